@@ -56,13 +56,81 @@ function loadDashboard() {
 }
 
 
-$(document).ready(function dashboard(){
-	var autoRefresh = false;
-	//loadDashboard();
-	if (autoRefresh) {
-		var dashLoop = window.setInterval(function startDashLoop(){
-			refreshDashboard();
+function applyTeamStatus(teamStatus) {
+	// swap the status suffix of every class listed in data-status-prefixes
+	var status = teamStatus.teamStatus === null ? 'None' : teamStatus.teamStatus;
+	$('[data-team-id="' + teamStatus.teamId + '"]').each(function updateCard(){
+		var card = $(this);
+		card.find('.js-team-status').text(status);
+		card.find('[data-status-prefixes]').addBack('[data-status-prefixes]').each(function updateClasses(){
+			var element = this;
+			$(element).data('statusPrefixes').split(' ').forEach(function swapClass(prefix){
+				Array.from(element.classList).forEach(function removeClass(className){
+					if (className.indexOf(prefix) === 0) {
+						element.classList.remove(className);
+					}
+				});
+				element.classList.add(prefix + status);
+			});
+		});
+	});
+}
+
+function refreshDashboard() {
+	// the API answers 304 while nothing changed, see DashboardAPI.get_etag
+	var refreshUrl = $('input#js-refresh-url').val();
+	$.ajax({
+		method: 'GET',
+		url: refreshUrl,
+		dataType: 'json',
+		ifModified: true,
+		success: function applyDashboardData(dashboardData) {
+			if (!dashboardData) {
+				return;
+			}
+			dashboardData.adminTeams.concat(dashboardData.leadTeams, dashboardData.teams).forEach(applyTeamStatus);
+		}
+	});
+}
 
-		}, 5000);
+var dashLoop = null;
+
+function pollDashboard() {
+	// fallback for browsers and servers without the event stream
+	if (dashLoop !== null) {
+		return;
+	}
+	var pollInterval = parseInt($('input#js-poll-interval').val(), 10) || 30;
+	dashLoop = window.setInterval(refreshDashboard, pollInterval * 1000);
+}
+
+function streamDashboard() {
+	// team status changes are pushed from the server, see teambeat/streams.py
+	var streamUrl = $('input#js-stream-url').val();
+	if (!streamUrl || !window.EventSource) {
+		pollDashboard();
+		return;
 	}
+	var stream = new EventSource(streamUrl);
+	stream.addEventListener('team-status', function onTeamStatus(event){
+		applyTeamStatus(JSON.parse(event.data));
+	});
+	stream.addEventListener('overflow', function onOverflow(){
+		// updates were dropped, start over from a fresh page
+		window.location.reload();
+	});
+	stream.onerror = function onStreamError(){
+		if (stream.readyState === EventSource.CLOSED) {
+			// the server refused the stream, e.g. it runs under WSGI
+			pollDashboard();
+		} else {
+			// reconnecting, catch up on changes sent meanwhile
+			refreshDashboard();
+		}
+	};
+}
+
+
+$(document).ready(function dashboard(){
+	streamDashboard();
 });
\ No newline at end of file
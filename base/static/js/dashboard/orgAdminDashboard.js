@@ -7,4 +7,45 @@ $(document).ready(function handleModal(){
 		handleModalAjax(ajaxTargetUrl, 'POST', formData);
 		successMessage('Updated organization admins');
 	});
-});
\ No newline at end of file
+});
+
+function selectedIds(name) {
+	return $('input.js-bulk-select[name=' + name + ']:checked').map(function(){
+		return $(this).val();
+	}).get();
+}
+
+$(document).ready(function handleBulkActions(){
+	$('.js-select-all').change(function(){
+		var name = $(this).attr('data-select');
+		$('input.js-bulk-select[name=' + name + ']:enabled').prop('checked', $(this).prop('checked'));
+	});
+	$('.js-bulk-action').click(function(){
+		var button = $(this);
+		var form = button.closest('form');
+		var isOrgUsers = form.attr('id') == 'bulk-orgusers';
+		var name = isOrgUsers ? 'orguser_ids' : 'invitee_ids';
+		var ids = selectedIds(name);
+		if (ids.length == 0) {
+			warningMessage('Nothing selected');
+			return;
+		}
+		var formData = {'csrfmiddlewaretoken': form.find('input[name=csrfmiddlewaretoken]').val()};
+		formData[name] = ids.join(',');
+		if (button.attr('data-is-admin')) {
+			formData['is_admin'] = button.attr('data-is-admin');
+		}
+		var postData = handleModalAjax(button.attr('data-ajax-target'), 'POST', formData);
+		if (postData.status == 'success') {
+			var rowPrefix = button.attr('data-remove-rows');
+			postData.ids.forEach(function updateRow(id){
+				if (rowPrefix) {
+					$('tr#' + rowPrefix + '-' + id).remove();
+				} else {
+					$('input#admin-toggle-id-' + id).prop('checked', button.attr('data-is-admin') == 'true');
+				}
+			});
+			successMessage('Updated ' + postData.ids.length + ' of ' + ids.length + ' selected');
+		}
+	});
+});
@@ -117,6 +117,43 @@ function handleAddUserToTeam(userId, ajaxTargetUrl) {
 	bindShowModal($('button#remove-teammember-' + postData.teamMemberId));
 }
 
+function handleAddUsersToTeam(userIds, ajaxTargetUrl) {
+	var formData = {'user_ids': userIds.join(','), 'csrfmiddlewaretoken': $('input[name=csrfmiddlewaretoken]').val()}
+	var postData = handleModalAjax(ajaxTargetUrl, 'POST', formData);
+	var targetTable = $('table#teammember-rows tbody');
+	targetTable.prepend(postData.htmlResult);
+	postData.teamMemberIds.forEach(function bindRow(teamMemberId){
+		bindShowModal($('button#remove-teammember-' + teamMemberId));
+	});
+}
+
+function handleAddAdminsToTeam(userIds, ajaxTargetUrl) {
+	var formData = {'user_ids': userIds.join(','), 'csrfmiddlewaretoken': $('input[name=csrfmiddlewaretoken]').val()}
+	var postData = handleModalAjax(ajaxTargetUrl, 'POST', formData);
+	var targetTable = $('table#teamadmin-rows tbody');
+	targetTable.prepend(postData.htmlResult);
+	postData.teamAdminIds.forEach(function bindRow(teamAdminId){
+		bindShowModal($('button#removeadmin-' + teamAdminId));
+	});
+}
+
+function handleRemoveTeamMembers(sourceButton) {
+	var teamMemberIds = $('input.js-bulk-select[name=teammember_ids]:checked').map(function(){
+		return $(this).val();
+	}).get();
+	if (teamMemberIds.length == 0) {
+		warningMessage('Nothing selected');
+		return;
+	}
+	var formData = {'teammember_ids': teamMemberIds.join(','), 'csrfmiddlewaretoken': $('input[name=csrfmiddlewaretoken]').val()}
+	var postData = handleModalAjax(sourceButton.attr('data-ajax-target'), 'POST', formData);
+	if (postData.status == 'success') {
+		postData.teamMemberIds.forEach(function removeRow(teamMemberId){
+			$('tr#teammember_' + teamMemberId).remove();
+		});
+	}
+}
+
 function clearUserSearch() {
 	var resultTable = $('table#search-results');
 	resultTable.html('');
@@ -125,36 +162,83 @@ function clearUserSearch() {
 
 }
 
+function displayUserSearchResults(searchResults, modalId, resultHandlerFunction, resultHanlerUrl, bulkHandlerFunction, bulkHandlerUrl) {
+	var resultTable = $('table#search-results');
+	resultTable.css('display', 'none');
+	resultTable.html('');
+	$('#add-user-link').css('display', 'none');
+	if (searchResults) {
+		if (searchResults.searchResult.length > 0) {
+			searchResults.searchResult.forEach(function displayResult(user){
+				var selectHTML = bulkHandlerFunction ? '<td><input type="checkbox" class="js-select-result" value="' + user.id + '"></td>' : '';
+				var rowHTML = '<tr>' + selectHTML + '<td>' + user.displayName + ' (' + user.email + ') </td><td><button class="btn btn-success js-handle-result" data-user-id="'+user.id+'">add</button></td></tr>';
+				resultTable.append(rowHTML);
+			});
+			if (bulkHandlerFunction) {
+				resultTable.append('<tr><td colspan="100%"><button class="btn btn-success js-handle-selected">add selected</button></td></tr>');
+			}
+			resultTable.css('display', '');
+			$('button.js-handle-result').click(function(){
+				var userId = $(this).attr('data-user-id');
+				window[resultHandlerFunction](userId, resultHanlerUrl);
+				clearUserSearch();
+				$('#' + modalId).modal('hide');
+			});
+			$('button.js-handle-selected').click(function(){
+				var userIds = $('input.js-select-result:checked').map(function(){
+					return $(this).val();
+				}).get();
+				if (userIds.length > 0) {
+					window[bulkHandlerFunction](userIds, bulkHandlerUrl);
+				}
+				clearUserSearch();
+				$('#' + modalId).modal('hide');
+			});
+		} else {
+			$('#add-user-link').css('display', '');
+		}
+	}
+}
+
 function handleUserSearchModal(sourceButton, modalId) {
 	clearUserSearch();
 	$('#' + modalId).modal('show');
 	var searchApiURL = sourceButton.attr('data-ajax-target');
+	var autocompleteApiURL = sourceButton.attr('data-autocomplete-target');
 	var resultHandlerFunction = sourceButton.attr('data-result-target-handler');
 	var resultHanlerUrl = sourceButton.attr('data-result-target-url');
-	var resultTable = $('table#search-results');
+	var bulkHandlerFunction = sourceButton.attr('data-bulk-target-handler');
+	var bulkHandlerUrl = sourceButton.attr('data-bulk-target-url');
+	var searchInput = $('form#modal-user-search input#id_search_term');
+	searchInput.off('input');
+	if (autocompleteApiURL) {
+		// typeahead is served from an in-memory index, so it is cheap to
+		// ask on every keystroke
+		searchInput.on('input', function executeUserAutocomplete(){
+			var searchTerm = $(this).val();
+			if (searchTerm.length == 0) {
+				clearUserSearch();
+				return;
+			}
+			$.ajax({
+				method: 'GET',
+				url: autocompleteApiURL,
+				dataType: 'json',
+				data: {'search_term': searchTerm},
+				success: function(searchResults) {
+					if (searchInput.val() == searchTerm) {
+						displayUserSearchResults(searchResults, modalId, resultHandlerFunction, resultHanlerUrl, bulkHandlerFunction, bulkHandlerUrl);
+					}
+				}
+			});
+		});
+	}
+	$('form#modal-user-search').off('submit');
 	$('form#modal-user-search').submit(function executeUserSearch(event){
 		event.preventDefault();
-		resultTable.css('display', 'none');
-		resultTable.html('');
 		var formData = $(this).serialize();
 		var searchResults = handleModalAjax(searchApiURL, 'GET', formData);
-		if (searchResults) {
-			if (searchResults.searchResult.length > 0) {
-				searchResults.searchResult.forEach(function displayResult(user){
-					var rowHTML = '<tr><td>' + user.displayName + ' (' + user.email + ') </td><td><button class="btn btn-success js-handle-result" data-user-id="'+user.id+'">add</button></td></tr>';
-					resultTable.append(rowHTML);
-				});
-				resultTable.css('display', '');
-				$('button.js-handle-result').click(function(){
-					var userId = $(this).attr('data-user-id');
-					window[resultHandlerFunction](userId, resultHanlerUrl);
-					clearUserSearch();
-					$('#' + modalId).modal('hide');
-				});
-			} else {
-				$('#add-user-link').css('display', '');
-			}
-		}
+		displayUserSearchResults(searchResults, modalId, resultHandlerFunction, resultHanlerUrl, bulkHandlerFunction, bulkHandlerUrl);
 	});
 }
 
@@ -0,0 +1,14 @@
+""" gunicorn settings, read from the working directory at startup
+"""
+import glob
+import os
+
+
+def on_starting(server):
+    """ Remove the metrics files of the previous server's workers, see
+        teambeat.metrics; runs once in the master before any worker starts
+    """
+    directory = os.environ.get('METRICS_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, 'metrics-*.db')):
+            os.remove(path)
@@ -9,8 +9,18 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
-application = get_asgi_application()
+# as django.core.asgi.get_asgi_application, with status exports and other
+# streaming responses generated outside the event loop
+django.setup(set_prefix=False)
+
+# imported once Django is set up
+from teambeat.asgi import ASGIHandler  # noqa: E402
+from teambeat.streams import route_streams  # noqa: E402
+
+django_application = ASGIHandler()
+
+application = route_streams(django_application)
@@ -42,14 +42,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'teambeat.middleware.metrics_middleware',
+    'teambeat.middleware.query_budget_logging',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'teambeat.middleware.CachedAuthenticationMiddleware',
+    'teambeat.middleware.profiling_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'session_manager.middleware.session_request_validation',
+    'session_manager.middleware.SessionRequestValidationMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -143,6 +146,114 @@ DEFAULT_ERROR_TEMPLATE = 'session_manager/error.html'
 
 HOST = '127.0.0.1:8000'
 
+# log requests that run more SQL queries than their view's query_budget
+QUERY_BUDGET_LOGGING = DEBUG
+
 SEND_EMAILS = False
 LOG_EMAILS = True
 
+# login and reset tokens, see session_manager.tokens
+SIGNED_TOKENS = True
+SIGNED_TOKEN_MAX_AGE = 60 * 60 * 24
+SIGNED_TOKEN_REPLAY_CACHE = 'default'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # rendered template fragments, see teambeat.fragments; locmem evicts the
+    # least recently used third of the entries once MAX_ENTRIES is reached,
+    # use a shared backend such as memcached when running several processes
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'teambeat-fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 3,
+        },
+    },
+    # sessions in SESSION_MODE "cache"; locmem is a local stand in that only
+    # works with a single process, use a shared backend such as memcached
+    # or redis when running several
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'teambeat-sessions',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+FRAGMENT_CACHE_ALIAS = 'fragments'
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# where sessions are kept, set with the SESSION_MODE environment variable:
+# "database" (the django_session table), "signed_cookies" (in the browser,
+# signed with SECRET_KEY, no server side state) or "cache" (SESSION_CACHE_ALIAS);
+# see manage.py purge_sessions for emptying django_session after switching
+SESSION_ENGINES = {
+    'database': 'django.contrib.sessions.backends.db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'cache': 'django.contrib.sessions.backends.cache',
+}
+SESSION_MODE = os.environ.get('SESSION_MODE', 'database')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+SESSION_CACHE_ALIAS = 'sessions'
+
+# dashboard push updates served by project.asgi, see teambeat.streams; an
+# empty DASHBOARD_STREAM_PATH (e.g. under WSGI) leaves dashboards polling
+# every DASHBOARD_POLL_INTERVAL seconds, as they also do when a stream fails.
+# LocalBroker only reaches streams of the publishing process, run more than
+# one process with teambeat.events.PostgresBroker
+DASHBOARD_STREAM_PATH = '/api/dashboard/stream/'
+DASHBOARD_STREAM_KEEPALIVE = 15
+DASHBOARD_STREAM_MAX_AGE = 300
+DASHBOARD_POLL_INTERVAL = 30
+EVENT_BROKER = 'teambeat.events.LocalBroker'
+EVENT_QUEUE_SIZE = 100
+
+# delivery of queued emails by manage.py send_queued_emails, see session_manager.mailer
+EMAIL_OUTBOX_BATCH_SIZE = 20
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 3600
+EMAIL_OUTBOX_LEASE = 300
+
+
+# maximum users returned per page by session_manager.search
+USER_SEARCH_RESULT_LIMIT = 25
+
+# per process typeahead index for the user search modal, see teambeat.autocomplete
+AUTOCOMPLETE_MAX_ORGANIZATIONS = 100
+AUTOCOMPLETE_TTL = 300
+
+# seconds a resolved organization/team/role lookup is cached, see teambeat.request_context
+REQUEST_CONTEXT_CACHE_TIMEOUT = 60
+
+# per process cache of logged in users for CachedAuthenticationMiddleware, see teambeat.user_cache
+USER_CACHE_MAX_USERS = 1000
+USER_CACHE_TTL = 30
+
+# rows fetched per database round trip by status exports, see teambeat.export
+EXPORT_CHUNK_SIZE = 2000
+
+# statuses written per bulk_create by status imports, see teambeat.importer
+IMPORT_BATCH_SIZE = 1000
+
+# emails accepted by one bulk invitation, see Organization.invite_bulk
+BULK_INVITE_MAX_EMAILS = 1000
+
+# Prometheus metrics served by teambeat.middleware.metrics_middleware, see
+# teambeat.metrics; set METRICS_DIR to a directory shared by the gunicorn
+# workers (emptied at startup by gunicorn.conf.py) to report all of them
+# from any one
+METRICS_PATH = '/metrics'
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+METRICS_REQUIRE_TOKEN = False
+
+# cProfile captures of requests by teambeat.middleware.profiling_middleware,
+# see teambeat.profiling; off unless PROFILING_DIR is set
+PROFILING_DIR = os.environ.get('PROFILING_DIR')
+PROFILING_SAMPLE_RATE = int(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MAX_PROFILES = 50
+PROFILING_TOP_N = 40
@@ -11,6 +11,17 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 MIDDLEWARE_DEBUG = False
 
+QUERY_BUDGET_LOGGING = False
+
+# /metrics is not found until METRICS_TOKEN is set
+METRICS_REQUIRE_TOKEN = True
+
+# gunicorn runs several uvicorn workers, see Procfile
+EVENT_BROKER = 'teambeat.events.PostgresBroker'
+
+# the n-gram fallback is per process and unscoped, see session_manager.search
+USER_SEARCH_BACKEND = 'trigram'
+
 HOST = 'https://team-beat.herokuapp.com/'
 
 SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
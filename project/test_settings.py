@@ -1,3 +1,5 @@
 from project.settings import *
 
 MIDDLEWARE_DEBUG = True
+
+QUERY_BUDGET_LOGGING = False
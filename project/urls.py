@@ -3,6 +3,7 @@ from django.urls import path
 
 from session_manager.views import *
 from teambeat.views import organization_admin_views
+from teambeat.views import staff_views
 from teambeat.views import user_views
 from teambeat.views import team_admin_views
 from teambeat.views import team_lead_views
@@ -15,14 +16,20 @@ urlpatterns = [
     path('organization/select/', user_views.SetOrganization.as_view(), name='set_organization'),
     path('organization/add-user/', organization_admin_views.AddUserToOrganization.as_view(), name='add_user_to_organization'),
     path('organization/admin/', organization_admin_views.OrganizationAdminDashboard.as_view(), name='organization_admin_dashboard'),
+    path('organization/admin/export/', organization_admin_views.OrganizationStatusExport.as_view(), name='organization_status_export'),
+    path('organization/admin/import/', organization_admin_views.OrganizationStatusImport.as_view(), name='organization_status_import'),
     path('organization/admin/api/<str:api_target>/', organization_admin_views.OrganizationAdminDashboardAPI.as_view(), name='organization_admin_dashboard_api'),
     path('api/dashboard/', user_views.DashboardAPI.as_view(), name='dashboard_refresh_api'),
     path('api/usersearch/', user_views.UserSearchAPI.as_view(), name='api_user_search'),
+    path('api/usersearch/autocomplete/', user_views.UserAutocompleteAPI.as_view(), name='api_user_autocomplete'),
     path('teams/new/', team_admin_views.CreateTeam.as_view(), name='teams_create'),
     path('teams/<str:team_uuid>/set-status/', user_views.SetStatus.as_view(), name='teams_set_status'),
     path('teams/admin/<str:team_uuid>/dashboard/', team_admin_views.TeamAdminDashboard.as_view(), name='team_admin_dashboard'),
     path('teams/admin/<str:team_uuid>/dashboard/api/<str:api_target>/', team_admin_views.TeamAdminDashboardAPI.as_view(), name='team_admin_dashboard_api'),
     path('teams/lead/<str:team_uuid>/dashboard/', team_lead_views.TeamLeadDashboard.as_view(), name='team_lead_dashboard'),
+    path('teams/lead/<str:team_uuid>/export/', team_lead_views.TeamStatusExport.as_view(), name='team_status_export'),
+    path('staff/profiles/', staff_views.RequestProfiles.as_view(), name='request_profiles'),
+    path('staff/profiles/<str:name>.<str:file_format>', staff_views.RequestProfileDownload.as_view(), name='request_profile_download'),
     path('admin/', admin.site.urls),
     path('register/', CreateUserView.as_view(), name='session_manager_register'),
     path('login/', LoginUserView.as_view(), name='session_manager_login'),
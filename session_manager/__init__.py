@@ -0,0 +1 @@
+default_app_config = 'session_manager.apps.SessionManagerConfig'
@@ -13,4 +13,16 @@ class UserTokenAdmin(admin.ModelAdmin):
     readonly_fields = ['link', ]
 
 admin.site.register(UserToken, UserTokenAdmin)
-admin.site.register(EmailLog)
+
+class EmailLogAdmin(admin.ModelAdmin):
+    list_display = [
+        'email_type',
+        'to_email',
+        'status',
+        'attempts',
+        'next_attempt_at',
+        'sent_at',
+    ]
+    list_filter = ['status', 'email_type']
+
+admin.site.register(EmailLog, EmailLogAdmin)
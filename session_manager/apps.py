@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SessionManagerConfig(AppConfig):
     name = 'session_manager'
+
+    def ready(self):
+        import session_manager.signals  # noqa
@@ -1,17 +1,200 @@
+""" Outgoing email
+
+    send_email only writes an EmailLog row, so requests never wait on a mail
+    server. With SEND_EMAILS on the row is queued and delivered later by the
+    send_queued_emails management command, which claims batches of queued
+    rows (SELECT ... FOR UPDATE SKIP LOCKED where the database supports it),
+    sends them over one reused EMAIL_BACKEND connection per worker and
+    retries failures with exponential backoff.
+"""
 from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from session_manager.models import EmailLog
 
+from datetime import timedelta
+
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_DELAY = 60
+DEFAULT_MAX_RETRY_DELAY = 3600
+DEFAULT_LEASE = 300
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
 
 def send_email(email_type, to_email, from_email, subject, body):
-    if settings.LOG_EMAILS:
-        email_log = EmailLog(
+    """ Record an email, queueing it for delivery when SEND_EMAILS is on
+        Returns the EmailLog or None if emails are neither sent nor logged
+    """
+    if settings.SEND_EMAILS:
+        status = EmailLog.STATUS_QUEUED
+    elif settings.LOG_EMAILS:
+        status = EmailLog.STATUS_LOGGED
+    else:
+        return None
+    email_log = EmailLog(
+        email_type=email_type,
+        to_email=to_email,
+        from_email=from_email,
+        subject=subject,
+        body=body,
+        status=status
+    )
+    email_log.save()
+    return email_log
+
+
+def send_emails(emails):
+    """ Record many emails with one insert, see send_email
+        emails is an iterable of
+            (email_type, to_email, from_email, subject, body) tuples
+        Returns the number of emails recorded
+    """
+    if settings.SEND_EMAILS:
+        status = EmailLog.STATUS_QUEUED
+    elif settings.LOG_EMAILS:
+        status = EmailLog.STATUS_LOGGED
+    else:
+        return 0
+    email_logs = [
+        EmailLog(
             email_type=email_type,
             to_email=to_email,
             from_email=from_email,
             subject=subject,
-            body=body
+            body=body,
+            status=status
         )
-        email_log.save()
-        return email_log
-    return None
+        for email_type, to_email, from_email, subject, body in emails
+    ]
+    EmailLog.objects.bulk_create(email_logs, batch_size=500)
+    return len(email_logs)
+
+
+def retry_delay(attempts):
+    """ Seconds to wait before the next attempt after the given number of
+        failed attempts, doubling each time up to EMAIL_OUTBOX_MAX_RETRY_DELAY
+    """
+    delay = _setting('EMAIL_OUTBOX_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    max_delay = _setting('EMAIL_OUTBOX_MAX_RETRY_DELAY', DEFAULT_MAX_RETRY_DELAY)
+    return min(delay * 2 ** (attempts - 1), max_delay)
+
+
+def claim_batch(batch_size=None):
+    """ Claim up to batch_size emails that are due for delivery
+        Claimed rows are marked as sending with a lease of EMAIL_OUTBOX_LEASE
+        seconds; rows whose lease ran out (a worker died mid batch) are
+        claimable again
+    """
+    batch_size = batch_size or _setting('EMAIL_OUTBOX_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    using = router.db_for_write(EmailLog)
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        due_emails = EmailLog.objects.using(using).filter(
+            Q(status=EmailLog.STATUS_QUEUED, next_attempt_at__lte=now) |
+            Q(status=EmailLog.STATUS_SENDING, locked_until__lt=now)
+        ).order_by('next_attempt_at', 'pk')
+        features = connections[using].features
+        if features.has_select_for_update_skip_locked:
+            due_emails = due_emails.select_for_update(skip_locked=True)
+        emails = list(due_emails[:batch_size])
+        if emails:
+            EmailLog.objects.using(using).filter(
+                pk__in=[email.pk for email in emails]
+            ).update(
+                status=EmailLog.STATUS_SENDING,
+                locked_until=now + timedelta(
+                    seconds=_setting('EMAIL_OUTBOX_LEASE', DEFAULT_LEASE)
+                )
+            )
+    return emails
+
+
+def _mark_sent(email):
+    if not settings.LOG_EMAILS:
+        EmailLog.objects.filter(pk=email.pk).delete()
+        return
+    EmailLog.objects.filter(pk=email.pk).update(
+        status=EmailLog.STATUS_SENT,
+        attempts=email.attempts + 1,
+        sent_at=timezone.now(),
+        locked_until=None,
+        last_error=''
+    )
+
+
+def _mark_failed(email, error):
+    attempts = email.attempts + 1
+    if attempts >= _setting('EMAIL_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS):
+        status = EmailLog.STATUS_FAILED
+    else:
+        status = EmailLog.STATUS_QUEUED
+    EmailLog.objects.filter(pk=email.pk).update(
+        status=status,
+        attempts=attempts,
+        next_attempt_at=timezone.now() + timedelta(seconds=retry_delay(attempts)),
+        locked_until=None,
+        last_error=repr(error)
+    )
+
+
+def deliver_batch(emails, connection):
+    """ Send claimed emails over an open email backend connection
+        Returns the number of emails sent
+    """
+    sent = 0
+    for email in emails:
+        message = EmailMessage(
+            subject=email.subject,
+            body=email.body,
+            from_email=email.from_email,
+            to=[email.to_email],
+            connection=connection
+        )
+        try:
+            message.send()
+        except Exception as error:
+            _mark_failed(email, error)
+            # the connection may be unusable now, start over with a fresh one
+            try:
+                connection.close()
+                connection.open()
+            except Exception:
+                pass
+        else:
+            _mark_sent(email)
+            sent += 1
+    return sent
+
+
+def process_outbox(batch_size=None, stop_event=None):
+    """ Deliver batches until there is nothing left that is due
+        Returns the number of emails sent
+    """
+    sent = 0
+    connection = None
+    try:
+        while stop_event is None or not stop_event.is_set():
+            emails = claim_batch(batch_size)
+            if not emails:
+                break
+            if connection is None:
+                connection = get_connection()
+                try:
+                    connection.open()
+                except Exception:
+                    # leave the connection closed, every send will retry
+                    # opening it and fail into the backoff schedule
+                    pass
+            sent += deliver_batch(emails, connection)
+    finally:
+        if connection is not None:
+            connection.close()
+    return sent
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+DATABASE_ENGINES = (
+    'django.contrib.sessions.backends.db',
+    'django.contrib.sessions.backends.cached_db',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete rows from the django_session table in batches, e.g. after '
+        'switching SESSION_MODE to signed_cookies or cache'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--expired',
+            action='store_true',
+            help='Only delete expired sessions, whatever SESSION_ENGINE is in use'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Sessions deleted per query (default: 5000)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Delete every session even though SESSION_ENGINE still uses the table, logging everyone out'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        sessions = Session.objects.all()
+        if options['expired']:
+            sessions = sessions.filter(expire_date__lt=timezone.now())
+        elif settings.SESSION_ENGINE in DATABASE_ENGINES and not options['force']:
+            raise CommandError(
+                'SESSION_ENGINE {} keeps sessions in the table, deleting them '
+                'logs everyone out; use --expired or --force'.format(settings.SESSION_ENGINE)
+            )
+
+        # small batches keep each delete's locks short on a busy table
+        deleted = 0
+        while True:
+            session_keys = list(
+                sessions.values_list('session_key', flat=True)[:options['batch_size']]
+            )
+            if not session_keys:
+                break
+            deleted += Session.objects.filter(session_key__in=session_keys).delete()[0]
+        self.stdout.write('Deleted {} sessions'.format(deleted))
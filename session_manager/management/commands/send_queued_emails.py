@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+
+from session_manager.mailer import process_outbox
+from session_manager.models import EmailLog
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the EmailLog outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker threads, each with its own mail connection'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Emails claimed per batch (defaults to EMAIL_OUTBOX_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5,
+            help='Seconds to wait before checking an empty outbox again'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no more emails are due instead of polling'
+        )
+
+    def _work(self, options, stop_event, close_connections):
+        sent = 0
+        try:
+            while not stop_event.is_set():
+                sent += process_outbox(options['batch_size'], stop_event)
+                if options['once']:
+                    break
+                stop_event.wait(options['poll_interval'])
+        finally:
+            if close_connections:
+                connections.close_all()
+        return sent
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+        using = router.db_for_write(EmailLog)
+        if workers > 1 and not connections[using].features.has_select_for_update_skip_locked:
+            self.stderr.write(
+                'Database does not support SKIP LOCKED, using a single worker'
+            )
+            workers = 1
+
+        stop_event = threading.Event()
+        if workers == 1:
+            try:
+                sent = self._work(options, stop_event, False)
+            except KeyboardInterrupt:
+                return
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(self._work, options, stop_event, True)
+                    for worker in range(workers)
+                ]
+                try:
+                    sent = sum(future.result() for future in futures)
+                except KeyboardInterrupt:
+                    stop_event.set()
+                    return
+        self.stdout.write('Sent {} emails'.format(sent))
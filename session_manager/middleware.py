@@ -1,48 +1,90 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
-from django.core.exceptions import ValidationError
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.shortcuts import render, redirect
-from django.urls import resolve, reverse
+from django.urls import get_urlconf, resolve, reverse
 from django.urls.exceptions import Resolver404
 
+from functools import lru_cache
+import asyncio
 
-def session_request_validation(get_response):
+
+# distinct paths remembered by resolve_url_name; paths with ids in them
+# each take an entry, so the least recently used are dropped
+RESOLVE_CACHE_SIZE = 1024
+NOT_FOUND = object()
+
+
+@lru_cache(maxsize=RESOLVE_CACHE_SIZE)
+def resolve_url_name(path, urlconf=None):
+    """ Get the URL name of a path, or NOT_FOUND if nothing matches
+        Results are cached, the middleware resolves every request's path
+    """
+    try:
+        return resolve(path, urlconf).url_name
+    except Resolver404:
+        return NOT_FOUND
+
+
+@receiver(setting_changed)
+def clear_resolve_cache(setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        resolve_url_name.cache_clear()
+
+
+class SessionRequestValidationMiddleware(object):
     """ Handler for catching unauthenticated requests to authentication
         protected views and returning an error page instead of DEBUG page
 
         Primarily exists because Heroku has a real hard time with DEBUG=False
+
+        The session is only written to when login_redirect_from changes, so
+        authenticated requests don't each save their session. Works in both
+        WSGI and ASGI middleware chains.
     """
+    sync_capable = True
+    async_capable = True
 
-    def middleware(request):
-        error_message = None
-        status_code = 200
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.exempt_views = frozenset(settings.AUTHENTICATION_EXEMPT_VIEWS)
+        if asyncio.iscoroutinefunction(get_response):
+            # mark the instance as a coroutine function, like MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
+    def _check_request(self, request):
+        """ Returns a tuple:
+                (HttpResponse to send instead of the view's or None,
+                 error message for the error page or None)
+        """
         # middleware does not have access to the user
         # session_manager_login is expected to set a session variable to use here
         user_is_authenticated = request.session.get('user_is_authenticated')
 
-        try:
-            resolved_url = resolve(request.path)
-            is_login_page = resolved_url.url_name == settings.AUTHENTICATION_REQUIRED_REDIRECT
-            if is_login_page and user_is_authenticated:
-                return redirect(reverse(settings.LOGIN_SUCCESS_REDIRECT))
-            if not resolved_url.url_name in settings.AUTHENTICATION_EXEMPT_VIEWS:
-                if not user_is_authenticated and not settings.MIDDLEWARE_DEBUG:
-                    request.session['login_redirect_from'] = request.path
-                    messages.error(
-                        request,
-                        'You must be authenticated to access this page. Please log in.'
-                    )
-                    return redirect(reverse(settings.AUTHENTICATION_REQUIRED_REDIRECT))
-                else:
-                    request.session['login_redirect_from'] = None
-
-        except Resolver404:
+        url_name = resolve_url_name(request.path, get_urlconf())
+        if url_name is NOT_FOUND:
             if not settings.MIDDLEWARE_DEBUG:
-                error_message = 'Page not found.'
-                status_code = 404
+                return (None, 'Page not found.')
+            return (None, None)
+
+        is_login_page = url_name == settings.AUTHENTICATION_REQUIRED_REDIRECT
+        if is_login_page and user_is_authenticated:
+            return (redirect(reverse(settings.LOGIN_SUCCESS_REDIRECT)), None)
+        if url_name not in self.exempt_views:
+            if not user_is_authenticated and not settings.MIDDLEWARE_DEBUG:
+                request.session['login_redirect_from'] = request.path
+                messages.error(
+                    request,
+                    'You must be authenticated to access this page. Please log in.'
+                )
+                return (redirect(reverse(settings.AUTHENTICATION_REQUIRED_REDIRECT)), None)
+            elif request.session.get('login_redirect_from') is not None:
+                request.session['login_redirect_from'] = None
+        return (None, None)
 
-        response = get_response(request)
+    def _check_response(self, request, response, error_message):
         status_code = str(response.status_code)
 
         if response.status_code == 404:
@@ -65,4 +107,29 @@ def session_request_validation(get_response):
 
         return response
 
-    return middleware
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        response, error_message = self._check_request(request)
+        if response is not None:
+            return response
+        response = self.get_response(request)
+        return self._check_response(request, response, error_message)
+
+    async def __acall__(self, request):
+        # sessions and templates are sync only
+        response, error_message = await sync_to_async(
+            self._check_request,
+            thread_sensitive=True
+        )(request)
+        if response is not None:
+            return response
+        response = await self.get_response(request)
+        return await sync_to_async(
+            self._check_response,
+            thread_sensitive=True
+        )(request, response, error_message)
+
+
+# the name settings.MIDDLEWARE used before the middleware became a class
+session_request_validation = SessionRequestValidationMiddleware
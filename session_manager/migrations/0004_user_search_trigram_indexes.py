@@ -0,0 +1,49 @@
+from django.db import migrations
+
+
+SEARCH_FIELDS = ('first_name', 'last_name', 'email')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """ GIN trigram indexes matching the UPPER(column::text) LIKE expressions
+        Django generates for icontains, used by session_manager.search
+        Skipped when pg_trgm is unavailable; search then falls back to the
+        in-process index
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if not cursor.fetchone():
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS session_manager_user_{field}_trgm '
+            'ON auth_user USING gin ((UPPER({field}::text)) gin_trgm_ops)'.format(
+                field=field
+            )
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for field in SEARCH_FIELDS:
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS session_manager_user_{}_trgm'.format(field)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('session_manager', '0003_emaillog_email_type'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
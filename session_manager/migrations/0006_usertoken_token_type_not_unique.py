@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('session_manager', '0005_emaillog_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usertoken',
+            name='token_type',
+            field=models.CharField(choices=[('reset', 'reset'), ('login', 'login')], max_length=20),
+        ),
+    ]
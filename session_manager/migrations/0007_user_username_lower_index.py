@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_username_lower_index(apps, schema_editor):
+    """ Index matching the LOWER(username) IN (...) lookups of
+        SessionManager.get_users_by_username; Django 3.1 has no expression
+        indexes and auth_user is not ours to add Meta.indexes to
+    """
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS session_manager_user_username_lower '
+        'ON auth_user (LOWER(username))'
+    )
+
+
+def drop_username_lower_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS session_manager_user_username_lower')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('session_manager', '0006_usertoken_token_type_not_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_username_lower_index, drop_username_lower_index),
+    ]
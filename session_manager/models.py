@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
 
 from django.urls import reverse
 
@@ -12,6 +13,7 @@ import hashlib
 import random
 import string
 
+from session_manager.search import search_users, user_index
 from session_manager.utils import twentyfourhoursfromnow
 
 
@@ -41,26 +43,11 @@ class SessionManager(models.Model):
         return User.objects.filter(email__icontains=email).all()
 
     @classmethod
-    def full_search(cls, search_term):
-        """ Retrieve User if one with a matching username exists
+    def full_search(cls, search_term, limit=None, cursor=None):
+        """ Retrieve a ranked, bounded page of Users matching a name or email
+            Returns a session_manager.search.SearchPage
         """
-        filter_qs = User.objects
-        if '@' in search_term:
-            filter_qs = filter_qs.filter(email__icontains=search_term)
-        elif ' ' in search_term:
-            search_names = search_term.split(' ')
-            first_name = search_names[0]
-            last_name = ' '.join(search_names[1:])
-            filter_qs = filter_qs.filter(
-                Q(first_name__icontains=first_name)|
-                Q(last_name__icontains=last_name)
-            )
-        else:
-            filter_qs = filter_qs.filter(
-                Q(first_name__icontains=search_term)|
-                Q(last_name__icontains=search_term)
-            )
-        return filter_qs.all()
+        return search_users(search_term, limit=limit, cursor=cursor)
 
     @classmethod
     def get_user_by_id(cls, pk):
@@ -84,6 +71,43 @@ class SessionManager(models.Model):
             new_user.save()
         return new_user
 
+    @classmethod
+    def get_users_by_username(cls, usernames):
+        """ Retrieve the Users matching any of the usernames, ignoring case,
+            with one query served by the LOWER(username) index of
+            session_manager migration 0007
+            Returns a dict of {lowercased username: User}
+        """
+        return {
+            user.username.lower(): user
+            for user in User.objects.annotate(
+                username_lower=Lower('username')
+            ).filter(username_lower__in={username.lower() for username in usernames})
+        }
+
+    @classmethod
+    def create_users_bulk(cls, emails, first_name=' ', last_name=' '):
+        """ Create Users without passwords for many emails with one insert,
+            like create_user; emails a concurrent request created a User for
+            meanwhile get that User
+            Returns a dict of {lowercased email: User}
+        """
+        User.objects.bulk_create([
+            User(
+                email=email,
+                username=email,
+                first_name=first_name,
+                last_name=last_name,
+            )
+            for email in emails
+        ], ignore_conflicts=True)
+        # not every database returns primary keys from bulk inserts
+        users = cls.get_users_by_username(emails)
+        # bulk_create sends no post_save, keep the search index current
+        for user in users.values():
+            user_index.update(user)
+        return users
+
     @classmethod
     def check_user_login(cls, username_or_email, password):
         """ Checks password for given email and password combination if the email has a User
@@ -114,7 +138,6 @@ class UserToken(models.Model):
     token = models.CharField(max_length=64, blank=True)
     token_type = models.CharField(
         max_length=20,
-        unique=True,
         choices=(
             ('reset', 'reset'),
             ('login', 'login'),
@@ -159,6 +182,19 @@ class UserToken(models.Model):
     def __str__(self):
         return 'UserToken Object: {} // User: {} // type: {} // expires: {}'.format(self.pk, self.user.email, self.token_type, self.expiration)
 
+    @classmethod
+    def issue_bulk(cls, users, token_type):
+        """ Create tokens of the given type for many Users with one insert
+            Returns a dict of {user pk: UserToken}
+        """
+        tokens = []
+        for user in users:
+            token = cls(user=user, token_type=token_type)
+            token.token = token._generate_login_token()
+            tokens.append(token)
+        cls.objects.bulk_create(tokens)
+        return {token.user_id: token for token in tokens}
+
     @classmethod
     def get_token(cls, token, username, token_type):
         """ Retrieve a token that matches the given username and type if it exists
@@ -186,11 +222,42 @@ class UserToken(models.Model):
 
 
 class EmailLog(models.Model):
+    """ Log of outgoing emails, doubling as the outbox the send_queued_emails
+        worker delivers from (see session_manager.mailer)
+    """
+    STATUS_LOGGED = 'logged'
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_LOGGED, 'Logged'),
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
     email_type = models.CharField(max_length=50)
     to_email = models.EmailField()
     from_email = models.EmailField()
     subject = models.CharField(max_length=300)
     body = models.TextField()
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_LOGGED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
 
     def __str__(self):
         return '<EmailLog {}: type "{}" to "{}">'.format(
@@ -0,0 +1,332 @@
+""" Ranked, bounded user search
+
+    Results are ranked by trigram similarity to the search term, capped at
+    USER_SEARCH_RESULT_LIMIT per page and paged with an opaque "score-id"
+    cursor. On PostgreSQL the matching runs against the pg_trgm GIN indexes
+    created in session_manager migration 0004; other databases use an
+    in-process n-gram index kept current by the User signal handlers in
+    session_manager.signals.
+
+    The n-gram index is a fallback for tests and local SQLite databases
+    only: it covers every user in the system, so a search scoped to one
+    organization still ranks all matching users before filtering, and it
+    misses users created or renamed by other processes. Production sets
+    USER_SEARCH_BACKEND to 'trigram'.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections, router
+from django.db.models import FloatField, Q
+from django.db.models.functions import Greatest, Round
+
+import re
+import threading
+
+
+DEFAULT_RESULT_LIMIT = 25
+
+
+def search_clauses(search_term):
+    """ Split a search term into (field, value) pairs, any of which may match
+
+        Email addresses match on email, "first last" matches on first or last
+        name, and anything else on either name
+    """
+    search_term = search_term.strip()
+    if '@' in search_term:
+        return [('email', search_term)]
+    if ' ' in search_term:
+        search_names = search_term.split(' ')
+        return [
+            ('first_name', search_names[0]),
+            ('last_name', ' '.join(search_names[1:])),
+        ]
+    return [('first_name', search_term), ('last_name', search_term)]
+
+
+def trigrams(value):
+    """ pg_trgm style trigrams: each word is lowercased and padded with two
+        spaces in front and one behind
+    """
+    grams = set()
+    for word in re.findall(r'\w+', value.lower()):
+        padded = '  {} '.format(word)
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(value, other):
+    """ Trigram similarity as computed by pg_trgm's similarity()
+    """
+    value_grams = trigrams(value)
+    other_grams = trigrams(other)
+    if not value_grams or not other_grams:
+        return 0.0
+    return len(value_grams & other_grams) / len(value_grams | other_grams)
+
+
+def score(similarity_value):
+    """ Rank scores are similarities scaled to whole numbers so they compare
+        exactly in cursors
+    """
+    return float(round(similarity_value * 1000))
+
+
+def encode_cursor(user):
+    return '{}-{}'.format(int(user.search_score), user.pk)
+
+
+def decode_cursor(cursor):
+    """ Returns (score, pk) or None for a missing or malformed cursor
+    """
+    if not cursor:
+        return None
+    try:
+        user_score, pk = cursor.split('-')
+        return (float(user_score), int(pk))
+    except ValueError:
+        return None
+
+
+class SearchPage(object):
+    """ One page of ranked Users, each with a search_score attribute
+    """
+    def __init__(self, results, next_cursor=None):
+        self.results = results
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __bool__(self):
+        return bool(self.results)
+
+
+class TrigramSearchBackend(object):
+    """ PostgreSQL backend: icontains filters served by the pg_trgm GIN
+        indexes, ranked by TrigramSimilarity
+    """
+    def search(self, queryset, clauses, limit, after=None):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        filters = Q()
+        similarities = []
+        for field, value in clauses:
+            filters |= Q(**{'{}__icontains'.format(field): value})
+            similarities.append(TrigramSimilarity(field, value))
+        if len(similarities) > 1:
+            best_similarity = Greatest(*similarities)
+        else:
+            best_similarity = similarities[0]
+
+        users = queryset.filter(filters).annotate(
+            search_score=Round(best_similarity * 1000, output_field=FloatField())
+        ).order_by('-search_score', 'pk')
+        if after:
+            after_score, after_pk = after
+            users = users.filter(
+                Q(search_score__lt=after_score) |
+                Q(search_score=after_score, pk__gt=after_pk)
+            )
+        return list(users[:limit])
+
+
+class NgramIndex(object):
+    """ In-process index of 1 to 3 character n-grams over each searchable
+        field, used to find substring matches without scanning every user
+        Not for production, see the module docstring
+    """
+    fields = ('first_name', 'last_name', 'email')
+    max_gram = 3
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        self.values = {field: {} for field in self.fields}
+        self.postings = {field: {} for field in self.fields}
+
+    def _grams(self, value):
+        grams = set()
+        for size in range(1, self.max_gram + 1):
+            grams.update(value[i:i + size] for i in range(len(value) - size + 1))
+        return grams
+
+    def _build(self):
+        for user in User.objects.values_list('pk', *self.fields).iterator():
+            self._add(user[0], dict(zip(self.fields, user[1:])))
+        self.built = True
+
+    def _add(self, pk, values):
+        for field in self.fields:
+            value = (values.get(field) or '').lower()
+            self.values[field][pk] = value
+            for gram in self._grams(value):
+                self.postings[field].setdefault(gram, set()).add(pk)
+
+    def _remove(self, pk):
+        for field in self.fields:
+            value = self.values[field].pop(pk, None)
+            if value is None:
+                continue
+            for gram in self._grams(value):
+                posting = self.postings[field].get(gram)
+                if posting is not None:
+                    posting.discard(pk)
+                    if not posting:
+                        del self.postings[field][gram]
+
+    def update(self, user):
+        with self.lock:
+            if self.built:
+                self._remove(user.pk)
+                self._add(user.pk, {
+                    field: getattr(user, field) for field in self.fields
+                })
+
+    def remove(self, pk):
+        with self.lock:
+            if self.built:
+                self._remove(pk)
+
+    def clear(self):
+        with self.lock:
+            self.built = False
+            self.values = {field: {} for field in self.fields}
+            self.postings = {field: {} for field in self.fields}
+
+    def matches(self, field, value):
+        """ Returns {pk: score} for users whose field contains value
+        """
+        value = value.lower()
+        with self.lock:
+            if not self.built:
+                self._build()
+            size = min(len(value), self.max_gram)
+            grams = set(value[i:i + size] for i in range(len(value) - size + 1))
+            postings = sorted(
+                (self.postings[field].get(gram, set()) for gram in grams),
+                key=len
+            )
+            if not postings:
+                return {}
+            candidates = set.intersection(*postings)
+            field_values = self.values[field]
+            return {
+                pk: score(similarity(value, field_values[pk]))
+                for pk in candidates
+                if value in field_values[pk]
+            }
+
+
+class NgramSearchBackend(object):
+    """ Fallback backend for test and development databases without pg_trgm
+    """
+    chunk_size = 500
+
+    def __init__(self, index):
+        self.index = index
+
+    def _still_matches(self, user, clauses):
+        return any(
+            value.lower() in (getattr(user, field) or '').lower()
+            for field, value in clauses
+        )
+
+    def search(self, queryset, clauses, limit, after=None):
+        scores = {}
+        for field, value in clauses:
+            for pk, user_score in self.index.matches(field, value).items():
+                scores[pk] = max(user_score, scores.get(pk, 0.0))
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if after:
+            after_score, after_pk = after
+            ranked = [
+                (pk, user_score) for pk, user_score in ranked
+                if user_score < after_score or (
+                    user_score == after_score and pk > after_pk)
+            ]
+
+        # walk the ranking in chunks so only as many rows as are needed to
+        # fill the page are checked against the queryset's own filters
+        results = []
+        for start in range(0, len(ranked), self.chunk_size):
+            chunk = ranked[start:start + self.chunk_size]
+            users = queryset.in_bulk([pk for pk, user_score in chunk])
+            for pk, user_score in chunk:
+                if pk in users:
+                    user = users[pk]
+                    if not self._still_matches(user, clauses):
+                        # the index missed a write, e.g. a rolled back save
+                        self.index.update(user)
+                        continue
+                    user.search_score = user_score
+                    results.append(user)
+                    if len(results) == limit:
+                        return results
+        return results
+
+
+user_index = NgramIndex()
+
+
+_has_pg_trgm = {}
+
+
+def has_pg_trgm(using):
+    """ True if the database has the pg_trgm extension installed, checked
+        once per database alias
+    """
+    if using not in _has_pg_trgm:
+        connection = connections[using]
+        installed = False
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+                )
+                installed = cursor.fetchone() is not None
+        _has_pg_trgm[using] = installed
+    return _has_pg_trgm[using]
+
+
+def get_backend(using=None):
+    """ Choose the backend from the USER_SEARCH_BACKEND setting ('trigram'
+        or 'ngram'), defaulting to trigram when pg_trgm is installed
+    """
+    backend = getattr(settings, 'USER_SEARCH_BACKEND', None)
+    if backend is None:
+        using = using or router.db_for_read(User)
+        backend = 'trigram' if has_pg_trgm(using) else 'ngram'
+    if backend == 'trigram':
+        return TrigramSearchBackend()
+    return NgramSearchBackend(user_index)
+
+
+def search_users(search_term, queryset=None, limit=None, cursor=None):
+    """ Search Users by name or email, best matches first
+        Returns a SearchPage of at most limit (capped at
+        USER_SEARCH_RESULT_LIMIT) Users
+    """
+    max_limit = getattr(settings, 'USER_SEARCH_RESULT_LIMIT', DEFAULT_RESULT_LIMIT)
+    limit = min(limit or max_limit, max_limit)
+    if queryset is None:
+        queryset = User.objects.all()
+    clauses = [(field, value) for field, value in search_clauses(search_term) if value]
+    if not clauses:
+        return SearchPage([])
+
+    # fetch one extra row to know whether there is another page
+    results = get_backend(queryset.db).search(
+        queryset,
+        clauses,
+        limit + 1,
+        after=decode_cursor(cursor)
+    )
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_cursor(results[-1])
+    return SearchPage(results, next_cursor)
@@ -0,0 +1,15 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from session_manager.search import user_index
+
+
+@receiver(post_save, sender=User)
+def update_search_index(sender, instance, **kwargs):
+    user_index.update(instance)
+
+
+@receiver(post_delete, sender=User)
+def remove_from_search_index(sender, instance, **kwargs):
+    user_index.remove(instance.pk)
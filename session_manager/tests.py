@@ -1,11 +1,30 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
-from session_manager.models import UserToken
+from django.utils import timezone
+from session_manager.mailer import claim_batch, send_email
+from session_manager.middleware import SessionRequestValidationMiddleware
+from session_manager.models import EmailLog, SessionManager, UserToken
+from session_manager.search import has_pg_trgm, user_index
+from session_manager.tokens import SignedToken, issue_tokens
 from session_manager.utils import yesterday
 
+from asgiref.sync import async_to_sync
+
 from bs4 import BeautifulSoup
 from datetime import datetime, timedelta
+from io import StringIO
+import socketserver
+import threading
 
 
 class SessionManagerTestCase(TestCase):
@@ -90,6 +109,71 @@ class MiddlewareTestCase(SessionManagerTestCase):
             )
             self.assertEqual(result_request.status_code, 200)
 
+    def test_authenticated_requests_do_not_save_session(self):
+        """ Verify the middleware only saves the session when
+            login_redirect_from changes
+        """
+        user = self._create_user('test@example.com')
+        self.client.force_login(user)
+        session = self.client.session
+        session['user_is_authenticated'] = True
+        session['login_redirect_from'] = '/profile/'
+        session.save()
+        profile_url = reverse('session_manager_profile')
+
+        self.client.get(profile_url)
+        self.assertIsNone(self.client.session['login_redirect_from'])
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(profile_url)
+        self.assertEqual(
+            [query['sql'] for query in captured.captured_queries
+             if 'django_session' in query['sql'] and not query['sql'].startswith('SELECT')],
+            []
+        )
+
+    def test_async_middleware(self):
+        """ Verify the middleware works in an async middleware chain
+        """
+        async def get_response(request):
+            return HttpResponse('view')
+
+        middleware = SessionRequestValidationMiddleware(get_response)
+        request = RequestFactory().get(reverse('session_manager_login'))
+        request.session = {'user_is_authenticated': True}
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, reverse(settings.LOGIN_SUCCESS_REDIRECT))
+
+        request = RequestFactory().get(reverse('session_manager_register'))
+        request.session = {}
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.content, b'view')
+
+
+class TestPurgeSessions(SessionManagerTestCase):
+    """ Test cases for emptying the django_session table
+    """
+    def test_purge(self):
+        """ Verify expired sessions can always be purged, and all of them
+            once another session engine is in use
+        """
+        for number in range(3):
+            SessionStore().create()
+        expired = SessionStore()
+        expired.set_expiry(-60)
+        expired.create()
+
+        with self.assertRaises(CommandError):
+            call_command('purge_sessions', stdout=StringIO())
+        call_command('purge_sessions', expired=True, stdout=StringIO())
+        self.assertEqual(Session.objects.count(), 3)
+
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            output = StringIO()
+            call_command('purge_sessions', batch_size=2, stdout=output)
+        self.assertEqual(Session.objects.count(), 0)
+        self.assertIn('Deleted 3 sessions', output.getvalue())
+
 
 class TestRegistrationFlow(SessionManagerTestCase):
     """ Test cases for form based registration
@@ -431,3 +515,371 @@ class TestTokenPasswordReset(SessionManagerTestCase):
         self.assertMessageInContext(reset_request, 'Token is expired.')
 
 
+class TestSignedTokens(SessionManagerTestCase):
+    """ Test cases for stateless signed login and reset tokens
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestSignedTokens, self).setUp(*args, **kwargs)
+        self.user = self._create_user('test@example.com', password='t3st3r@dmin')
+
+    def test_login_with_signed_token(self):
+        """ Verify a signed token logs in once and is then rejected
+        """
+        token = SignedToken.issue(self.user, 'login')
+        login_request = self.client.get(token.path)
+        self.assertRedirects(
+            login_request,
+            reverse(settings.LOGIN_SUCCESS_REDIRECT),
+            fetch_redirect_response=False
+        )
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+
+        self.client.logout()
+        login_request = self.client.get(token.path)
+        self.assertMessageInContext(login_request, 'Token has already been used.')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_verify_reads_only_the_user(self):
+        """ Verify checking a token only reads its user
+        """
+        token = SignedToken.issue(self.user, 'login')
+        with self.assertNumQueries(1):
+            verified, error_message = SignedToken.verify(token.token, 'login')
+        self.assertEqual(verified.user, self.user)
+        self.assertIsNone(error_message)
+
+    def test_single_use_without_replay_cache(self):
+        """ Verify used tokens are rejected by processes that never saw
+            them used, e.g. other workers or after a restart
+        """
+        login_token = SignedToken.issue(self.user, 'login')
+        reset_token = SignedToken.issue(self.user, 'reset')
+        self.client.get(login_token.path)
+        self.assertIn('_auth_user_id', self.client.session)
+        caches[settings.SIGNED_TOKEN_REPLAY_CACHE].clear()
+        self.assertEqual(
+            SignedToken.verify(login_token.token, 'login'),
+            (None, 'Token has already been used.')
+        )
+
+        # logging in also retires the reset tokens issued before it
+        self.assertEqual(
+            SignedToken.verify(reset_token.token, 'reset'),
+            (None, 'Token has already been used.')
+        )
+        self.user.refresh_from_db()
+        reset_token = SignedToken.issue(self.user, 'reset')
+        self.client.post(reset_token.path, {
+            'user_id': self.user.pk,
+            'password': 't3st3r@dminnewpass'
+        })
+        caches[settings.SIGNED_TOKEN_REPLAY_CACHE].clear()
+        self.assertEqual(
+            SignedToken.verify(reset_token.token, 'reset'),
+            (None, 'Token has already been used.')
+        )
+
+    def test_invalid_signed_tokens(self):
+        """ Verify tampered, mistyped and expired tokens are rejected
+        """
+        token = SignedToken.issue(self.user, 'login')
+        self.assertEqual(
+            SignedToken.verify(token.token[:-1] + 'x', 'login'),
+            (None, 'Token not found.')
+        )
+        self.assertEqual(
+            SignedToken.verify(token.token, 'reset'),
+            (None, 'Token not found.')
+        )
+        with self.settings(SIGNED_TOKEN_MAX_AGE=-1):
+            self.assertEqual(
+                SignedToken.verify(token.token, 'login'),
+                (None, 'Token is expired.')
+            )
+
+    def test_reset_with_signed_token(self):
+        """ Verify a signed reset token resets the password of the signed
+            user, whatever user id is posted
+        """
+        other_user = self._create_user('other@example.com', password='0th3r@dmin')
+        token = SignedToken.issue(self.user, 'reset')
+        reset_request = self.client.get(token.path)
+        self.assertIn('form', str(reset_request.content))
+        post_data = {
+            'user_id': other_user.pk,
+            'password': 't3st3r@dminnewpass'
+        }
+        self.client.post(token.path, post_data)
+        self.user.refresh_from_db()
+        other_user.refresh_from_db()
+        self.assertTrue(self.user.check_password('t3st3r@dminnewpass'))
+        self.assertTrue(other_user.check_password('0th3r@dmin'))
+
+        reset_request = self.client.post(token.path, post_data, follow=True)
+        self.assertMessageInContext(reset_request, 'Token has already been used.')
+
+    def test_issue_tokens_in_bulk(self):
+        """ Verify bulk issuing in signed and UserToken modes
+        """
+        users = [self.user, self._create_user('other@example.com')]
+        with self.assertNumQueries(0):
+            tokens = issue_tokens(users, 'login')
+        self.assertEqual(set(tokens), set(user.pk for user in users))
+        self.assertEqual(len(set(token.token for token in tokens.values())), 2)
+
+        with self.settings(SIGNED_TOKENS=False):
+            with self.assertNumQueries(1):
+                tokens = issue_tokens(users, 'login')
+        self.assertEqual(UserToken.objects.filter(token_type='login').count(), 2)
+        self.assertIn('user=other@example.com', tokens[users[1].pk].path)
+
+
+class TestUserSearch(SessionManagerTestCase):
+    """ Test cases for ranked, bounded user search
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestUserSearch, self).setUp(*args, **kwargs)
+        user_index.clear()
+        for first_name, last_name in [
+                ('Grace', 'Hopper'),
+                ('Gracie', 'Allen'),
+                ('Ada', 'Lovelace'),
+                ('Margaret', 'Hamilton')]:
+            email = '{}@example.com'.format(first_name.lower())
+            User.objects.create(
+                username=email,
+                email=email,
+                first_name=first_name,
+                last_name=last_name
+            )
+
+    def _assert_search(self):
+        page = SessionManager.full_search('grac')
+        self.assertEqual(
+            [user.first_name for user in page],
+            ['Grace', 'Gracie']
+        )
+        self.assertEqual(
+            [user.first_name for user in SessionManager.full_search('ada@example')],
+            ['Ada']
+        )
+        self.assertEqual(
+            [user.last_name for user in SessionManager.full_search('x hamil')],
+            ['Hamilton']
+        )
+        self.assertFalse(SessionManager.full_search('nobody'))
+
+        first_page = SessionManager.full_search('a', limit=2)
+        self.assertEqual(len(first_page), 2)
+        second_page = SessionManager.full_search(
+            'a',
+            limit=2,
+            cursor=first_page.next_cursor
+        )
+        self.assertEqual(len(second_page), 2)
+        self.assertIsNone(second_page.next_cursor)
+        self.assertEqual(
+            len(set(user.pk for user in first_page) | set(user.pk for user in second_page)),
+            4
+        )
+
+    def test_ngram_search(self):
+        """ Verify ranking, matching and paging with the in-process index
+        """
+        with self.settings(USER_SEARCH_BACKEND='ngram'):
+            self._assert_search()
+            user = User.objects.get(first_name='Ada')
+            user.first_name = 'Augusta'
+            user.save()
+            self.assertEqual(
+                [user.first_name for user in SessionManager.full_search('augusta')],
+                ['Augusta']
+            )
+
+    def test_trigram_search(self):
+        """ Verify ranking, matching and paging with pg_trgm
+        """
+        if not has_pg_trgm(connection.alias):
+            self.skipTest('pg_trgm is not installed')
+        with self.settings(USER_SEARCH_BACKEND='trigram'):
+            self._assert_search()
+
+    def test_result_limit(self):
+        """ Verify the configured hard limit caps every page
+        """
+        with self.settings(USER_SEARCH_RESULT_LIMIT=1):
+            page = SessionManager.full_search('a', limit=10)
+            self.assertEqual(len(page), 1)
+            self.assertIsNotNone(page.next_cursor)
+
+
+class TestCreateUsersBulk(SessionManagerTestCase):
+    """ Test cases for looking up and creating many users at once
+    """
+    def test_users_created_concurrently(self):
+        """ Verify emails another request created a User for meanwhile get
+            that User instead of an IntegrityError
+        """
+        existing = self._create_user('new@example.com')
+        users = SessionManager.create_users_bulk(['new@example.com', 'other@example.com'])
+        self.assertEqual(set(users), {'new@example.com', 'other@example.com'})
+        self.assertEqual(users['new@example.com'].pk, existing.pk)
+        self.assertEqual(User.objects.filter(username='new@example.com').count(), 1)
+
+    def test_lookup_ignores_case(self):
+        """ Verify usernames match whatever their case
+        """
+        user = self._create_user('Grace@Example.com')
+        self.assertEqual(
+            SessionManager.get_users_by_username(['grace@example.COM']),
+            {'grace@example.com': user}
+        )
+
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """ Just enough SMTP to accept messages, rejecting recipients listed in
+        the server's reject set
+    """
+    def reply(self, line):
+        self.wfile.write('{}\r\n'.format(line).encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stand-in')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().rstrip('\r\n')
+            if not line:
+                return
+            command = line.split(' ')[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 stand-in')
+            elif command == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipient = line.split(':', 1)[1].strip('<> ')
+                if recipient in self.server.reject:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(recipient)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                    pass
+                self.server.delivered.extend(recipients)
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class TestEmailOutbox(TestCase):
+    """ Test cases for queueing emails and delivering them with the
+        send_queued_emails worker
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestEmailOutbox, self).setUp(*args, **kwargs)
+        self.smtp_server = socketserver.ThreadingTCPServer(
+            ('127.0.0.1', 0),
+            StandInSMTPHandler
+        )
+        self.smtp_server.daemon_threads = True
+        self.smtp_server.connections = 0
+        self.smtp_server.delivered = []
+        self.smtp_server.reject = set()
+        threading.Thread(target=self.smtp_server.serve_forever, daemon=True).start()
+        self.email_settings = self.settings(
+            SEND_EMAILS=True,
+            LOG_EMAILS=True,
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1',
+            EMAIL_PORT=self.smtp_server.server_address[1],
+            EMAIL_OUTBOX_BATCH_SIZE=2,
+        )
+        self.email_settings.enable()
+
+    def tearDown(self, *args, **kwargs):
+        self.email_settings.disable()
+        self.smtp_server.shutdown()
+        self.smtp_server.server_close()
+        super(TestEmailOutbox, self).tearDown(*args, **kwargs)
+
+    def _queue(self, count):
+        return [
+            send_email(
+                'Test',
+                'user{}@example.com'.format(i),
+                'admin@example.com',
+                'Subject {}'.format(i),
+                'Body'
+            )
+            for i in range(count)
+        ]
+
+    def _send_queued_emails(self):
+        out = StringIO()
+        call_command('send_queued_emails', '--once', stdout=out)
+        return out.getvalue()
+
+    def test_send_email_only_queues(self):
+        """ Verify send_email records the email without contacting the server
+        """
+        email_log = self._queue(1)[0]
+        self.assertEqual(email_log.status, EmailLog.STATUS_QUEUED)
+        self.assertEqual(self.smtp_server.connections, 0)
+        with self.settings(SEND_EMAILS=False):
+            self.assertEqual(self._queue(1)[0].status, EmailLog.STATUS_LOGGED)
+            with self.settings(LOG_EMAILS=False):
+                self.assertIsNone(self._queue(1)[0])
+
+    def test_delivery_reuses_connection(self):
+        """ Verify batches are delivered over a single SMTP connection
+        """
+        self._queue(5)
+        self.assertIn('Sent 5 emails', self._send_queued_emails())
+        self.assertEqual(self.smtp_server.connections, 1)
+        self.assertEqual(
+            sorted(self.smtp_server.delivered),
+            ['user{}@example.com'.format(i) for i in range(5)]
+        )
+        self.assertEqual(
+            EmailLog.objects.filter(status=EmailLog.STATUS_SENT).count(),
+            5
+        )
+        self.assertIn('Sent 0 emails', self._send_queued_emails())
+
+    def test_retry_with_backoff(self):
+        """ Verify failed emails are retried later and eventually marked failed
+        """
+        self.smtp_server.reject.add('user1@example.com')
+        self._queue(3)
+        with self.settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_DELAY=60):
+            self.assertIn('Sent 2 emails', self._send_queued_emails())
+            rejected = EmailLog.objects.get(to_email='user1@example.com')
+            self.assertEqual(rejected.status, EmailLog.STATUS_QUEUED)
+            self.assertEqual(rejected.attempts, 1)
+            self.assertGreater(
+                rejected.next_attempt_at,
+                timezone.now() + timedelta(seconds=50)
+            )
+            self.assertIn('Sent 0 emails', self._send_queued_emails())
+
+            EmailLog.objects.filter(pk=rejected.pk).update(next_attempt_at=timezone.now())
+            self._send_queued_emails()
+            rejected.refresh_from_db()
+            self.assertEqual(rejected.status, EmailLog.STATUS_FAILED)
+            self.assertEqual(rejected.attempts, 2)
+            self.assertIn('550', rejected.last_error)
+
+    def test_expired_claims_are_reclaimed(self):
+        """ Verify a batch left behind by a dead worker is picked up again
+        """
+        self._queue(1)
+        self.assertEqual(len(claim_batch()), 1)
+        self.assertEqual(claim_batch(), [])
+        EmailLog.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertIn('Sent 1 emails', self._send_queued_emails())
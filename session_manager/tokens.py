@@ -0,0 +1,164 @@
+""" Stateless login and password reset tokens
+
+    A signed token carries the user's primary key, the token type, a random
+    nonce, its issue time and a hash of the user's password and last_login,
+    signed with SECRET_KEY through django.core.signing, so no token rows are
+    stored. Tokens expire after SIGNED_TOKEN_MAX_AGE seconds and are single
+    use the way django.contrib.auth's PasswordResetTokenGenerator makes
+    them: logging in updates last_login and resetting changes the password,
+    so a used token no longer matches its user in any process. consume()
+    also records the nonce in the SIGNED_TOKEN_REPLAY_CACHE cache, which
+    stops concurrent requests using one token twice. UserToken rows remain
+    supported, the views tell the two apart with is_signed_token.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from session_manager.models import UserToken
+
+import secrets
+import time
+
+
+DEFAULT_MAX_AGE = 60 * 60 * 24
+SALT = 'session_manager.tokens'
+TOKEN_TYPES = ('login', 'reset')
+TOKEN_PATHS = {
+    'login': 'session_manager_login',
+    'reset': 'session_manager_token_reset_password',
+}
+
+
+def _max_age():
+    return getattr(settings, 'SIGNED_TOKEN_MAX_AGE', DEFAULT_MAX_AGE)
+
+
+def _replay_cache():
+    return caches[getattr(settings, 'SIGNED_TOKEN_REPLAY_CACHE', 'default')]
+
+
+def user_state(user, issued_at):
+    """ Hash of what using a token changes about its user, like
+        PasswordResetTokenGenerator._make_hash_value
+    """
+    last_login = ''
+    if user.last_login is not None:
+        last_login = user.last_login.replace(microsecond=0, tzinfo=None)
+    return salted_hmac(
+        SALT,
+        '{}{}{}{}'.format(user.pk, user.password, last_login, issued_at)
+    ).hexdigest()[::2]
+
+
+def is_signed_token(token):
+    """ Signed tokens contain the signer's ':' separators, UserToken values
+        are plain hex digests
+    """
+    return bool(token) and ':' in token
+
+
+class SignedToken(object):
+    """ A verified or freshly issued signed token
+    """
+    def __init__(self, user_id, token_type, nonce, issued_at, token=None, user=None):
+        self.user_id = user_id
+        self.token_type = token_type
+        self.nonce = nonce
+        self.issued_at = issued_at
+        self.token = token
+        # the active User the token belongs to, set by verify
+        self.user = user
+
+    @classmethod
+    def issue(cls, user, token_type):
+        """ Create a signed token of the given type for a User
+        """
+        if token_type not in TOKEN_TYPES:
+            raise ValueError('Unknown token type "{}"'.format(token_type))
+        nonce = secrets.token_urlsafe(9)
+        issued_at = int(time.time())
+        token = signing.dumps(
+            [user.pk, token_type, nonce, issued_at, user_state(user, issued_at)],
+            salt=SALT,
+            compress=True
+        )
+        return cls(user.pk, token_type, nonce, issued_at, token=token)
+
+    @classmethod
+    def issue_bulk(cls, users, token_type):
+        """ Create signed tokens for many Users at once, e.g. for mass
+            invitations; signing is pure computation so no queries are run,
+            the Users must have their password and last_login loaded
+            Returns a dict of {user pk: SignedToken}
+        """
+        return {user.pk: cls.issue(user, token_type) for user in users}
+
+    @classmethod
+    def verify(cls, token, token_type):
+        """ Check the signature, type, expiry, user state and replay cache of
+            a token, reading its user
+            Returns a tuple:
+                (object: SignedToken if valid, string: error message if not)
+        """
+        try:
+            user_id, signed_type, nonce, issued_at, state = signing.loads(
+                token,
+                salt=SALT,
+                max_age=_max_age()
+            )
+        except signing.SignatureExpired:
+            return (None, 'Token is expired.')
+        except (signing.BadSignature, TypeError, ValueError):
+            return (None, 'Token not found.')
+        if signed_type != token_type:
+            return (None, 'Token not found.')
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return (None, 'User matching token not found.')
+        signed_token = cls(user_id, signed_type, nonce, issued_at, token=token, user=user)
+        if not constant_time_compare(state, user_state(user, issued_at)) or signed_token.is_used:
+            return (None, 'Token has already been used.')
+        return (signed_token, None)
+
+    @property
+    def _replay_key(self):
+        return 'session_manager:used-token:{}'.format(self.nonce)
+
+    @property
+    def is_used(self):
+        return _replay_cache().get(self._replay_key) is not None
+
+    def consume(self):
+        """ Mark the token as used
+            Returns False if it was already used, e.g. by a concurrent request
+        """
+        remaining = self.issued_at + _max_age() - int(time.time())
+        if remaining <= 0:
+            return False
+        return _replay_cache().add(self._replay_key, 1, remaining + 1)
+
+    @property
+    def path(self):
+        """ Get the URL path expected by the login and password reset views
+        """
+        return '{}?token={}'.format(reverse(TOKEN_PATHS[self.token_type]), self.token)
+
+    @property
+    def link(self):
+        """ Get a full link for the path based on the HOST value found in settings
+        """
+        return '{}{}'.format(settings.HOST, self.path)
+
+
+def issue_tokens(users, token_type):
+    """ Issue login or reset tokens for many Users, signed unless
+        SIGNED_TOKENS is turned off, in which case UserToken rows are created
+        Returns a dict of {user pk: token}, each token with a path and link
+    """
+    if getattr(settings, 'SIGNED_TOKENS', True):
+        return SignedToken.issue_bulk(users, token_type)
+    return UserToken.issue_bulk(users, token_type)
@@ -20,6 +20,7 @@ from session_manager.forms import (
 )
 
 from session_manager.models import SessionManager, UserToken
+from session_manager.tokens import SignedToken, is_signed_token
 
 
 class CreateUserView(View):
@@ -64,9 +65,27 @@ class LoginUserView(View):
         self.template = loader.get_template('session_manager/login.html')
         self.context = {}
 
+    def _login_with_signed_token(self, request):
+        """ Log in with a signed token; logging in updates last_login, which
+            stops the token verifying again
+        """
+        token, token_error_message = SignedToken.verify(request.GET['token'], 'login')
+        if token and not token.consume():
+            token, token_error_message = (None, 'Token has already been used.')
+        if token:
+            login(request, token.user)
+            request.session['user_is_authenticated'] = True
+            return redirect(reverse(settings.LOGIN_SUCCESS_REDIRECT))
+        messages.error(request, token_error_message)
+        return None
+
     def get(self, request, *args, **kwargs):
         # check if a login token was provided
-        if request.GET.get('token') and request.GET.get('user'):
+        if is_signed_token(request.GET.get('token')):
+            response = self._login_with_signed_token(request)
+            if response:
+                return response
+        elif request.GET.get('token') and request.GET.get('user'):
             token, token_error_message = UserToken.get_token(token=request.GET['token'], username=request.GET['user'], token_type='login')
             if token:
                 if token.is_valid:
@@ -130,17 +149,32 @@ class ResetPasswordWithTokenView(View):
         self.template = loader.get_template('session_manager/reset_password.html')
         self.context = {}
         # get the token and error message, needed for both GET and POST
-        self.token, self.token_error_message = UserToken.get_token(
-            token=request.GET.get('token'),
-            username=request.GET.get('user'),
-            token_type='reset'
-        )
+        self.signed = is_signed_token(request.GET.get('token'))
+        if self.signed:
+            # expiry is checked while verifying, so a found token is valid
+            self.token, self.token_error_message = SignedToken.verify(
+                request.GET['token'],
+                'reset'
+            )
+            self.token_is_valid = self.token is not None
+        else:
+            self.token, self.token_error_message = UserToken.get_token(
+                token=request.GET.get('token'),
+                username=request.GET.get('user'),
+                token_type='reset'
+            )
+            self.token_is_valid = self.token is not None and self.token.is_valid
+
+    def _token_user_id(self):
+        if self.signed:
+            return self.token.user_id
+        return self.token.user.id
 
     def get(self, request, *args, **kwargs):
         # If we find a valid token, show the reset form with the user's ID passed to it
         if self.token:
-            if self.token.is_valid:
-                form = ResetPasswordForm(initial={'user_id': self.token.user.id})
+            if self.token_is_valid:
+                form = ResetPasswordForm(initial={'user_id': self._token_user_id()})
                 self.context.update({'form': form})
             else:
                 messages.error(request, 'Token is expired.')
@@ -153,13 +187,22 @@ class ResetPasswordWithTokenView(View):
         # if a valid token was given and the form is valid, reset user's password
         # and redirect to login
         if self.token:
-            if self.token.is_valid:
+            if self.token_is_valid:
                 if form.is_valid():
-                    user = SessionManager.get_user_by_id(request.POST['user_id'])
+                    if self.signed:
+                        if not self.token.consume():
+                            messages.error(request, 'Token has already been used.')
+                            self.context.update({'form': form})
+                            return HttpResponse(self.template.render(self.context, request))
+                        # the signed user is authoritative, not the form field
+                        user = self.token.user
+                    else:
+                        user = SessionManager.get_user_by_id(request.POST['user_id'])
                     user.set_password(request.POST['password'])
                     user.save()
                     messages.success(request, 'Password reset. Please log in to continue.')
-                    self.token.delete()
+                    if not self.signed:
+                        self.token.delete()
                     return redirect(reverse('session_manager_login'))
             else:
                 messages.error(request, 'Token is expired.')
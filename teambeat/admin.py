@@ -5,6 +5,7 @@ from teambeat.models import (
     OrganizationUser,
     Team,
     TeamAdmin,
+    TeamDailyRollup,
     TeamMember,
     TeamMemberStatus
 )
@@ -16,3 +17,4 @@ admin.site.register(Team)
 admin.site.register(TeamAdmin)
 admin.site.register(TeamMember)
 admin.site.register(TeamMemberStatus)
+admin.site.register(TeamDailyRollup)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TeambeatConfig(AppConfig):
     name = 'teambeat'
+
+    def ready(self):
+        import teambeat.signals  # noqa
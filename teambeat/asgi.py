@@ -0,0 +1,60 @@
+""" ASGI handler for Django responses whose body is generated on the fly
+
+    Django 3.1's ASGIHandler iterates a StreamingHttpResponse in the event
+    loop, so a body that reads the database, like the status exports in
+    teambeat.export, raises SynchronousOnlyOperation. This handler
+    generates streaming bodies in a worker thread of their own instead,
+    which keeps the event loop and the thread running sync views free
+    while a download is sent, and closes that thread's database connection
+    afterwards. Served by project.asgi.
+"""
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.handlers import asgi
+from django.db import connections
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """ ASGIHandler sending streaming response bodies from a worker thread
+    """
+    async def send_response(self, response, send):
+        if not response.streaming:
+            await super(ASGIHandler, self).send_response(response, send)
+            return
+
+        # as ASGIHandler.send_response
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append(
+                (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+        # one thread for the whole body, a server side cursor belongs to
+        # the connection of the thread that opened it
+        await sync_to_async(self._send_streaming_content, thread_sensitive=False)(
+            response,
+            async_to_sync(send)
+        )
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+    def _send_streaming_content(self, response, send):
+        try:
+            for part in response:
+                for chunk, _ in self.chunk_bytes(part):
+                    send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+        finally:
+            connections.close_all()
@@ -0,0 +1,145 @@
+""" Per organization typeahead index for the user search modal
+
+    Each organization's active users are loaded once into sorted arrays of
+    lowercased first name, last name, full name and email, so prefix lookups
+    are a bisect plus a short scan with no database access. Indexes are
+    built lazily, kept in a bounded LRU (AUTOCOMPLETE_MAX_ORGANIZATIONS) and
+    dropped by the OrganizationUser and User signal handlers in
+    teambeat.signals, with AUTOCOMPLETE_TTL seconds as a backstop for writes
+    made by other processes.
+"""
+from django.conf import settings
+
+from teambeat.metrics import record_cache_lookup
+from teambeat.models import OrganizationUser
+
+from bisect import bisect_left
+from collections import OrderedDict
+import threading
+import time
+
+
+DEFAULT_MAX_ORGANIZATIONS = 100
+DEFAULT_TTL = 300
+DEFAULT_RESULT_LIMIT = 10
+
+
+class OrganizationAutocompleteIndex(object):
+    """ Sorted prefix index over one organization's active users
+    """
+    def __init__(self, org_users):
+        self.results = {}
+        self.user_ids = set()
+        keyed_ids = []
+        for org_user in org_users:
+            user = org_user.user
+            display_name = '{} {}'.format(user.first_name, user.last_name)
+            self.results[org_user.pk] = {
+                'displayName': display_name,
+                'email': user.email,
+                'id': org_user.pk
+            }
+            self.user_ids.add(user.pk)
+            for value in (user.first_name, user.last_name, display_name, user.email):
+                value = (value or '').strip().lower()
+                if value:
+                    keyed_ids.append((value, org_user.pk))
+        keyed_ids.sort()
+        self.keys = [key for key, pk in keyed_ids]
+        self.ids = [pk for key, pk in keyed_ids]
+
+    @classmethod
+    def build(cls, organization_id):
+        return cls(
+            OrganizationUser.objects.filter(
+                organization_id=organization_id,
+                active=True
+            ).select_related('user')
+        )
+
+    def search(self, prefix, limit=DEFAULT_RESULT_LIMIT):
+        """ Users with a name or email starting with prefix, in key order
+        """
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        found = []
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and len(found) < limit:
+            if not self.keys[position].startswith(prefix):
+                break
+            pk = self.ids[position]
+            if pk not in found:
+                found.append(pk)
+            position += 1
+        return [self.results[pk] for pk in found]
+
+
+class AutocompleteCache(object):
+    """ Bounded LRU of organization indexes, safe to share between threads
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+        # bumped by every invalidation, so a build that raced one is not stored
+        self.generation = 0
+
+    @property
+    def max_organizations(self):
+        return getattr(
+            settings,
+            'AUTOCOMPLETE_MAX_ORGANIZATIONS',
+            DEFAULT_MAX_ORGANIZATIONS
+        )
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTOCOMPLETE_TTL', DEFAULT_TTL)
+
+    def get(self, organization_id):
+        """ Return the organization's index, building it if needed
+        """
+        with self.lock:
+            cached = self.indexes.get(organization_id)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self.indexes.move_to_end(organization_id)
+                record_cache_lookup('autocomplete', True)
+                return cached[1]
+            generation = self.generation
+        record_cache_lookup('autocomplete', False)
+
+        # build outside the lock so one slow organization does not hold up
+        # lookups for the others
+        index = OrganizationAutocompleteIndex.build(organization_id)
+        with self.lock:
+            if generation == self.generation:
+                self.indexes[organization_id] = (time.monotonic(), index)
+                self.indexes.move_to_end(organization_id)
+                while len(self.indexes) > self.max_organizations:
+                    self.indexes.popitem(last=False)
+        return index
+
+    def search(self, organization_id, prefix, limit=DEFAULT_RESULT_LIMIT):
+        return self.get(organization_id).search(prefix, limit=limit)
+
+    def invalidate(self, organization_id):
+        with self.lock:
+            self.generation += 1
+            self.indexes.pop(organization_id, None)
+
+    def invalidate_user(self, user_id):
+        """ Drop every cached index that includes the user
+        """
+        with self.lock:
+            self.generation += 1
+            for organization_id, (built_at, index) in list(self.indexes.items()):
+                if user_id in index.user_ids:
+                    del self.indexes[organization_id]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.indexes.clear()
+
+
+autocomplete_cache = AutocompleteCache()
@@ -0,0 +1,196 @@
+""" Benchmark of every GET view in project/urls.py
+
+    Each view is requested through the Django test client as the owner of an
+    organization (see teambeat.synthetic.seed_organization), recording
+    latency percentiles, SQL queries, session writes and peak Python memory
+    per URL. Reports
+    are plain JSON so runs on two revisions can be compared with
+    compare_reports; used by the benchmark management command.
+"""
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, get_resolver, reverse
+
+import platform
+import statistics
+import time
+import tracemalloc
+
+
+# logging out would end the benchmark's session, and request_profiles lists
+# files on disk and only answers superusers
+SKIPPED_URL_NAMES = ('session_manager_logout', 'request_profiles')
+# query string sent with every request, for the search views
+QUERY_PARAMS = {'search_term': 'a'}
+PERCENTILES = (50, 90, 99)
+
+
+def is_session_write(sql):
+    """ Whether a captured query saves a database backed session
+    """
+    return sql.startswith(('INSERT', 'UPDATE')) and 'django_session' in sql
+
+
+def login_client(client, org_user):
+    """ Log the client in as an organization user with their organization
+        selected, the way session_manager_login and SetOrganization do
+    """
+    client.force_login(org_user.user)
+    session = client.session
+    session['user_is_authenticated'] = True
+    session['organization'] = str(org_user.organization.uuid)
+    session.save()
+    # signed cookie sessions get a new key whenever they are saved
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+
+def benchmark_client():
+    """ Test client sending a Host header the project accepts
+    """
+    host = 'localhost'
+    for allowed_host in settings.ALLOWED_HOSTS:
+        if allowed_host != '*':
+            host = allowed_host.lstrip('.')
+            break
+    return Client(HTTP_HOST=host)
+
+
+def benchmark_urls(team):
+    """ (url name, path) of every view in the URLconf that answers GET
+        requests, with team_uuid filled in from team
+    """
+    urls = []
+    for pattern in get_resolver().url_patterns:
+        if not isinstance(pattern, URLPattern) or pattern.name in SKIPPED_URL_NAMES:
+            continue
+        view_class = getattr(pattern.callback, 'view_class', None)
+        if view_class is None or not hasattr(view_class, 'get'):
+            continue
+        converters = pattern.pattern.converters
+        if set(converters) - {'team_uuid'}:
+            # POST only APIs and invitation handlers
+            continue
+        kwargs = {}
+        if 'team_uuid' in converters:
+            kwargs['team_uuid'] = str(team.uuid)
+        urls.append((pattern.name, reverse(pattern.name, kwargs=kwargs)))
+    return urls
+
+
+def percentile(values, percent):
+    """ Nearest rank percentile of a non empty list
+    """
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100.0 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _request(client, path):
+    # the test client closes the response itself, once streamed if streaming
+    response = client.get(path, QUERY_PARAMS)
+    if response.streaming:
+        for chunk in response.streaming_content:
+            pass
+    return response
+
+
+def benchmark_url(client, path, iterations=20, warmup=2):
+    """ Time a URL, returns a dict of its measurements; latencies are in
+        milliseconds and peak memory in KiB
+    """
+    for i in range(warmup):
+        _request(client, path)
+
+    latencies = []
+    queries = []
+    session_writes = []
+    for i in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = _request(client, path)
+            latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        session_writes.append(sum(
+            1 for query in captured.captured_queries
+            if is_session_write(query['sql'])
+        ))
+
+    # tracing slows requests down, so memory is measured on a separate request
+    tracemalloc.start()
+    try:
+        _request(client, path)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        'path': path,
+        'status': response.status_code,
+        'iterations': iterations,
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'min_ms': round(min(latencies), 3),
+        'max_ms': round(max(latencies), 3),
+        'queries': max(queries),
+        'session_writes': max(session_writes),
+        'peak_memory_kib': round(peak / 1024.0, 1),
+    }
+    for percent in PERCENTILES:
+        result['p{}_ms'.format(percent)] = round(percentile(latencies, percent), 3)
+    return result
+
+
+def run_benchmark(organization, iterations=20, warmup=2, url_names=None, session_mode=None):
+    """ Benchmark every GET view as the organization's first admin, with
+        sessions kept the way settings.SESSION_ENGINES[session_mode] does
+        when given
+        Returns the report as a JSON serializable dict
+    """
+    if session_mode:
+        with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[session_mode]):
+            return run_benchmark(organization, iterations, warmup, url_names)
+
+    owner = organization.organizationuser_set.filter(
+        is_organization_admin=True
+    ).select_related('user', 'organization').order_by('pk').first()
+    client = benchmark_client()
+    login_client(client, owner)
+
+    results = {}
+    for name, path in benchmark_urls(organization.team_set.order_by('pk').first()):
+        if url_names and name not in url_names:
+            continue
+        results[name] = benchmark_url(client, path, iterations, warmup)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        'session_engine': settings.SESSION_ENGINE,
+        'organization': {
+            'users': organization.organizationuser_set.count(),
+            'teams': organization.team_set.count(),
+        },
+        'iterations': iterations,
+        'urls': results,
+    }
+
+
+def compare_reports(baseline, report, metrics=('p50_ms', 'p90_ms', 'queries', 'session_writes', 'peak_memory_kib')):
+    """ Differences between two reports, as a list of
+        (url name, metric, baseline value, new value, change in percent)
+        for URLs in both
+    """
+    changes = []
+    for name, result in sorted(report['urls'].items()):
+        baseline_result = baseline['urls'].get(name)
+        if baseline_result is None:
+            continue
+        for metric in metrics:
+            old = baseline_result.get(metric)
+            new = result.get(metric)
+            if old is None or new is None:
+                continue
+            change = ((new - old) * 100.0 / old) if old else 0.0
+            changes.append((name, metric, old, new, round(change, 1)))
+    return changes
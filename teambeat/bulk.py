@@ -0,0 +1,184 @@
+""" Set based changes to many organization users and team members at once
+
+    Each operation runs a fixed number of queries however many ids it is
+    given, in one transaction, using queryset update() and set based M2M
+    changes instead of a get() and save() per row. These writes send no
+    model signals, so the work of the signal handlers in teambeat.signals
+    (rollups, version counters, request context and autocomplete caches) is
+    done here once per operation. Ids outside the organization are ignored.
+"""
+from django.db import transaction
+
+from teambeat.autocomplete import autocomplete_cache
+from teambeat.models import (
+    OrganizationUser,
+    Team,
+    TeamAdmin,
+    TeamDailyRollup,
+    TeamMember,
+    as_date,
+)
+from teambeat.request_context import invalidate_organization_id
+from teambeat.versioning import bump_organization_versions, bump_team_versions
+
+
+def teams_changed(team_ids):
+    """ Stand in for the signal handlers after bulk changes to the members
+        or admins of teams
+    """
+    team_ids = set(team_ids)
+    if team_ids:
+        # leaving or joining a team changes today's missing count
+        TeamDailyRollup.rebuild(
+            as_date(),
+            as_date(),
+            teams=Team.objects.filter(pk__in=team_ids)
+        )
+        bump_team_versions(team_ids)
+
+
+def organization_changed(organization, team_ids=()):
+    """ Stand in for the signal handlers after bulk changes to an
+        organization's users and, optionally, the memberships of team_ids
+    """
+    teams_changed(team_ids)
+    bump_organization_versions([organization.pk])
+    invalidate_organization_id(organization.pk)
+    autocomplete_cache.invalidate(organization.pk)
+
+
+def remove_organization_users(organization, org_user_ids):
+    """ Deactivate organization users and their team memberships
+        Returns the pks of the users removed
+    """
+    with transaction.atomic():
+        org_user_ids = list(organization.organizationuser_set.filter(
+            pk__in=org_user_ids,
+            active=True
+        ).values_list('pk', flat=True))
+        if not org_user_ids:
+            return []
+        teammembers = TeamMember.objects.filter(
+            organization_user_id__in=org_user_ids,
+            active=True
+        )
+        team_ids = set(teammembers.values_list('team_id', flat=True))
+        teammembers.update(active=False)
+        organization.organizationuser_set.filter(
+            pk__in=org_user_ids
+        ).update(active=False)
+        organization_changed(organization, team_ids)
+    return org_user_ids
+
+
+def set_organization_admins(organization, org_user_ids, is_admin):
+    """ Grant or revoke organization admin rights, keeping
+        Organization.admins in step
+        Returns the pks of the users changed
+    """
+    with transaction.atomic():
+        org_users = organization.organizationuser_set.filter(
+            pk__in=org_user_ids
+        ).exclude(is_organization_admin=is_admin)
+        changed = list(org_users.values_list('pk', 'user_id'))
+        if not changed:
+            return []
+        organization.organizationuser_set.filter(
+            pk__in=[pk for pk, user_id in changed]
+        ).update(is_organization_admin=is_admin)
+        user_ids = [user_id for pk, user_id in changed]
+        if is_admin:
+            organization.admins.add(*user_ids)
+        else:
+            organization.admins.remove(*user_ids)
+        organization_changed(organization)
+    return [pk for pk, user_id in changed]
+
+
+def cancel_invitations(organization, invitation_ids):
+    """ Delete pending invitations
+        Returns the pks of the invitations deleted
+    """
+    with transaction.atomic():
+        invitations = organization.organizationinvitation_set.filter(
+            pk__in=invitation_ids
+        )
+        invitation_ids = list(invitations.values_list('pk', flat=True))
+        invitations.delete()
+    return invitation_ids
+
+
+def _organization_user_ids(team, org_user_ids):
+    # only active users of the team's own organization can join it
+    return set(OrganizationUser.objects.filter(
+        organization_id=team.organization_id,
+        pk__in=org_user_ids,
+        active=True
+    ).values_list('pk', flat=True))
+
+
+def add_team_members(team, org_user_ids):
+    """ Add organization users to a team, reactivating earlier memberships
+        Returns the TeamMembers added, with their users joined; users
+        already active on the team are left out
+    """
+    with transaction.atomic():
+        org_user_ids = _organization_user_ids(team, org_user_ids)
+        memberships = dict(team.teammember_set.filter(
+            organization_user_id__in=org_user_ids
+        ).values_list('organization_user_id', 'active'))
+        reactivated = [
+            org_user_id for org_user_id, active in memberships.items()
+            if not active
+        ]
+        team.teammember_set.filter(
+            organization_user_id__in=reactivated
+        ).update(active=True)
+        created = org_user_ids.difference(memberships)
+        TeamMember.objects.bulk_create([
+            TeamMember(organization_user_id=org_user_id, team=team)
+            for org_user_id in created
+        ])
+        added = list(team.teammember_set.filter(
+            organization_user_id__in=created.union(reactivated),
+            active=True
+        ).select_related('organization_user__user').order_by('pk'))
+        if added:
+            teams_changed([team.pk])
+    return added
+
+
+def remove_team_members(team, teammember_ids):
+    """ Deactivate team members
+        Returns the pks of the members removed
+    """
+    with transaction.atomic():
+        teammembers = team.teammember_set.filter(pk__in=teammember_ids, active=True)
+        teammember_ids = list(teammembers.values_list('pk', flat=True))
+        if teammember_ids:
+            team.teammember_set.filter(pk__in=teammember_ids).update(active=False)
+            teams_changed([team.pk])
+    return teammember_ids
+
+
+def add_team_admins(team, org_user_ids):
+    """ Make organization users admins of a team
+        Returns the TeamAdmins created, with their users joined
+    """
+    with transaction.atomic():
+        org_user_ids = _organization_user_ids(team, org_user_ids).difference(
+            team.teamadmin_set.values_list('organization_user_id', flat=True)
+        )
+        if not org_user_ids:
+            return []
+        TeamAdmin.objects.bulk_create([
+            TeamAdmin(organization_user_id=org_user_id, team=team)
+            for org_user_id in org_user_ids
+        ])
+        added = list(team.teamadmin_set.filter(
+            organization_user_id__in=org_user_ids
+        ).select_related('organization_user__user').order_by('pk'))
+        bump_team_versions([team.pk])
+        # team admin rights are part of the cached request context
+        invalidate_organization_id(team.organization_id)
+    return added
@@ -0,0 +1,71 @@
+from teambeat.models import (
+    Team,
+    TeamDailyRollup,
+    TeamMemberStatus,
+    as_date,
+)
+
+
+class DashboardLoader(object):
+    """ Loads the teams, statuses and team rollups shown on an organization
+        user's dashboard with a fixed number of queries, however many teams
+        the user belongs to
+
+        Each TeamMember gets a todays_status attribute (TeamMemberStatus or
+        None) and each Team gets a current_status attribute (worst status
+        string or None) so templates never have to query lazily
+    """
+    def __init__(self, org_user, day=None):
+        self.org_user = org_user
+        self.day = as_date(day)
+        self.teammembers = list(
+            org_user.teammember_set.filter(
+                active=True
+            ).select_related('team').order_by('team__name')
+        )
+        self.adminteams = list(
+            org_user.teamadmin_set.select_related('team').order_by('team__name')
+        )
+        self.leadteams = list(
+            Team.objects.filter(
+                organization_id=org_user.organization_id,
+                team_lead=org_user
+            ).order_by('name')
+        )
+        self._attach_statuses()
+
+    @property
+    def teams(self):
+        """ Every Team instance on the dashboard, including duplicates
+            when the user holds several roles on one team
+        """
+        return (
+            [teammember.team for teammember in self.teammembers] +
+            [teamadmin.team for teamadmin in self.adminteams] +
+            self.leadteams
+        )
+
+    def _attach_statuses(self):
+        statuses = {}
+        if self.teammembers:
+            statuses = {
+                status.teammember_id: status
+                for status in TeamMemberStatus.objects.filter(
+                    teammember__in=self.teammembers,
+                    day=self.day
+                )
+            }
+        for teammember in self.teammembers:
+            teammember.todays_status = statuses.get(teammember.pk)
+
+        teams = self.teams
+        rollups = {}
+        if teams:
+            rollups = dict(
+                TeamDailyRollup.objects.filter(
+                    team_id__in=set(team.pk for team in teams),
+                    day=self.day
+                ).values_list('team_id', 'worst_status')
+            )
+        for team in teams:
+            team.current_status = rollups.get(team.pk)
@@ -0,0 +1,242 @@
+""" Publish/subscribe for pushing changes to connected clients
+
+    Publishers (signal handlers, running in sync request threads) call
+    get_broker().publish(topic, message); the dashboard stream in
+    teambeat.streams subscribes to one topic per team. The broker class is
+    chosen with the EVENT_BROKER setting: LocalBroker only reaches
+    subscribers in the same process, so it only suits single process
+    servers and tests; PostgresBroker sends messages through PostgreSQL
+    LISTEN/NOTIFY on the default database and reaches every process.
+"""
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+import asyncio
+import json
+import logging
+import select
+import threading
+
+
+DEFAULT_BROKER = 'teambeat.events.LocalBroker'
+DEFAULT_QUEUE_SIZE = 100
+NOTIFY_CHANNEL = 'teambeat_events'
+# seconds the PostgresBroker listener waits before reconnecting, and at
+# most between checks for close()
+RECONNECT_DELAY = 5
+LISTEN_TIMEOUT = 1
+
+
+logger = logging.getLogger(__name__)
+
+
+def team_topic(team_id):
+    return 'team:{}'.format(team_id)
+
+
+class Subscription(object):
+    """ A subscriber's queue of messages, bound to the event loop it was
+        created on
+
+        If the subscriber falls more than queue_size messages behind, the
+        backlog is dropped and the next get() returns the overflow marker so
+        the client can reload instead of silently missing changes
+    """
+    OVERFLOW = {'type': 'overflow'}
+
+    def __init__(self, broker, topics, queue_size=DEFAULT_QUEUE_SIZE):
+        self.broker = broker
+        self.topics = set(topics)
+        self.loop = asyncio.get_event_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def _put(self, message):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = self.OVERFLOW
+        self.queue.put_nowait(message)
+
+    def deliver(self, message):
+        """ Hand a message over from any thread
+        """
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # the subscriber's loop is gone
+            self.broker.unsubscribe(self)
+
+    async def get(self, timeout=None):
+        """ Wait for the next message, returns None on timeout
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker(object):
+    """ Interface for brokers
+    """
+    def publish(self, topic, message):
+        """ Send a JSON serializable message to every subscriber of topic
+        """
+        raise NotImplementedError
+
+    def subscribe(self, topics):
+        """ Returns a Subscription to the given topics, must be called from
+            within the subscriber's event loop
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    """ Broker that fans messages out to subscribers in this process
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def publish(self, topic, message):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(topic, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    def subscribe(self, topics):
+        subscription = Subscription(
+            self,
+            topics,
+            getattr(settings, 'EVENT_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+        )
+        with self.lock:
+            for topic in subscription.topics:
+                self.subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for topic in subscription.topics:
+                subscribers = self.subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[topic]
+
+
+class PostgresBroker(LocalBroker):
+    """ Broker that publishes with NOTIFY and delivers to this process's
+        subscribers from a LISTEN connection, so every process with
+        subscribers gets every message
+
+        Publishing runs on the publisher's database connection, so inside a
+        transaction messages are only sent once it commits. The listener is
+        a daemon thread with its own connection, started by the first
+        subscription; messages published while it reconnects are lost, the
+        same as a browser missing them while its stream reconnects.
+    """
+    using = 'default'
+
+    def __init__(self):
+        super(PostgresBroker, self).__init__()
+        self.listener = None
+        # set while the listener's LISTEN is in place
+        self.listening = threading.Event()
+        self.closing = threading.Event()
+
+    def publish(self, topic, message):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, %s)',
+                [NOTIFY_CHANNEL, json.dumps({'topic': topic, 'message': message})]
+            )
+
+    def subscribe(self, topics):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(
+                    target=self._listen,
+                    name='teambeat-events-listener',
+                    daemon=True
+                )
+                self.listener.start()
+        return super(PostgresBroker, self).subscribe(topics)
+
+    def _connect(self):
+        connection = connections[self.using]
+        listen_connection = connection.get_new_connection(
+            connection.get_connection_params()
+        )
+        listen_connection.autocommit = True
+        with listen_connection.cursor() as cursor:
+            cursor.execute('LISTEN {}'.format(NOTIFY_CHANNEL))
+        return listen_connection
+
+    def _deliver(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        super(PostgresBroker, self).publish(event['topic'], event['message'])
+
+    def _listen(self):
+        while not self.closing.is_set():
+            try:
+                listen_connection = self._connect()
+                self.listening.set()
+                try:
+                    while not self.closing.is_set():
+                        if select.select([listen_connection], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                            continue
+                        listen_connection.poll()
+                        while listen_connection.notifies:
+                            self._deliver(listen_connection.notifies.pop(0).payload)
+                finally:
+                    self.listening.clear()
+                    listen_connection.close()
+            except Exception:
+                logger.exception('Event listener lost its connection, reconnecting')
+                self.closing.wait(RECONNECT_DELAY)
+
+    def close(self):
+        """ Stop the listener and close its connection
+        """
+        self.closing.set()
+        if self.listener is not None:
+            self.listener.join()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """ The process wide broker configured by EVENT_BROKER
+    """
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker_class = import_string(
+                    getattr(settings, 'EVENT_BROKER', DEFAULT_BROKER)
+                )
+                _broker = broker_class()
+    return _broker
+
+
+def publish_team_status(team_id, day, team_status):
+    """ Tell subscribers of a team that its status for a day changed
+    """
+    get_broker().publish(team_topic(team_id), {
+        'type': 'team-status',
+        'teamId': team_id,
+        'day': day.isoformat(),
+        'teamStatus': team_status,
+    })
@@ -0,0 +1,140 @@
+""" Streaming export of team member status history
+
+    Rows are read with QuerySet.iterator(chunk_size=...), which uses a server
+    side cursor on PostgreSQL (and fetchmany elsewhere), and are written out
+    as CSV or JSON Lines in buffered chunks, optionally gzip compressed, so
+    memory use stays flat however many rows are exported. Used by the export
+    views and the export_statuses management command; under ASGI the
+    response body is generated in a worker thread by teambeat.asgi.
+"""
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from teambeat.models import TeamMemberStatus
+
+import csv
+import io
+import json
+import zlib
+
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+DEFAULT_CHUNK_SIZE = 2000
+# bytes collected before a chunk is handed to the response or file
+BUFFER_SIZE = 64 * 1024
+
+FIELDS = (
+    ('day', 'day'),
+    ('organization', 'teammember__team__organization__name'),
+    ('team', 'teammember__team__name'),
+    ('team_uuid', 'teammember__team__uuid'),
+    ('email', 'teammember__organization_user__user__email'),
+    ('first_name', 'teammember__organization_user__user__first_name'),
+    ('last_name', 'teammember__organization_user__user__last_name'),
+    ('status', 'status'),
+    ('additional_info_for_team', 'additional_info_for_team'),
+    ('additional_info_for_lead', 'additional_info_for_lead'),
+)
+
+
+def export_queryset(team=None, organization=None, start=None, end=None):
+    """ Statuses of a team or an organization between start and end
+        (inclusive, either may be None for an open range) as tuples of the
+        FIELDS lookups, in (day, id) order
+    """
+    statuses = TeamMemberStatus.objects.all()
+    if team is not None:
+        statuses = statuses.filter(teammember__team=team)
+    if organization is not None:
+        statuses = statuses.filter(teammember__team__organization=organization)
+    if start is not None:
+        statuses = statuses.filter(day__gte=start)
+    if end is not None:
+        statuses = statuses.filter(day__lte=end)
+    return statuses.order_by('day', 'id').values_list(
+        *[lookup for name, lookup in FIELDS]
+    )
+
+
+def _csv_rows(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, lookup in FIELDS])
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+def _jsonl_rows(rows):
+    names = [name for name, lookup in FIELDS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), default=str) + '\n'
+
+
+def _buffered(lines):
+    """ Join encoded lines into chunks of about BUFFER_SIZE bytes
+    """
+    chunk = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        chunk.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def _gzipped(chunks):
+    # wbits 31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, export_format='csv', compress=False, chunk_size=None):
+    """ Generator of the encoded export of an export_queryset
+    """
+    if export_format not in FORMATS:
+        raise ValueError('Unknown export format "{}"'.format(export_format))
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    rows = queryset.iterator(chunk_size=chunk_size)
+    if export_format == 'csv':
+        lines = _csv_rows(rows)
+    else:
+        lines = _jsonl_rows(rows)
+    chunks = _buffered(lines)
+    if compress:
+        chunks = _gzipped(chunks)
+    return chunks
+
+
+def export_filename(name, export_format, compress=False):
+    return '{}.{}{}'.format(name, export_format, '.gz' if compress else '')
+
+
+def export_response(queryset, name, export_format='csv', compress=False):
+    """ StreamingHttpResponse downloading the export as a file
+    """
+    response = StreamingHttpResponse(
+        stream_export(queryset, export_format, compress),
+        content_type=CONTENT_TYPES[export_format]
+    )
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(
+        export_filename(name, export_format, compress)
+    )
+    return response
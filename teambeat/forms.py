@@ -1,19 +1,30 @@
 from django.forms import (
     BooleanField,
     CharField,
+    ChoiceField,
+    DateField,
+    DateInput,
     EmailField,
     EmailInput,
+    FileField,
     Form,
     HiddenInput,
     IntegerField,
     ModelForm,
     RadioSelect,
     Select,
+    Textarea,
     TextInput,
 )
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
-from teambeat.models import Team, Organization
+from teambeat.export import FORMATS
+from teambeat.importer import CONFLICT_MODES
+from teambeat.models import Team, Organization, as_date
+
+from datetime import datetime
+import re
 
 
 class CreateOrganizationForm(Form):
@@ -82,3 +93,125 @@ class SetOrganizationForm():
 
 class InviteUserForm(Form):
     email = EmailField(widget=EmailInput(attrs={'class': 'form-control'}))
+
+
+class BulkInviteForm(Form):
+    """ Pasted and/or uploaded emails for AddUserToOrganization's bulk mode;
+        cleaned_data['email_list'] holds every address found
+    """
+    emails = CharField(
+        required=False,
+        widget=Textarea(attrs={'class': 'form-control', 'rows': 8}),
+        help_text='Separated by commas, spaces or new lines'
+    )
+    email_file = FileField(
+        required=False,
+        label='or a CSV file of emails'
+    )
+    bulk_invite = CharField(widget=HiddenInput(), initial='1')
+
+    def clean(self):
+        super(BulkInviteForm, self).clean()
+        data = self.cleaned_data
+        text = data.get('emails') or ''
+        if data.get('email_file'):
+            try:
+                text += '\n' + data['email_file'].read().decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise ValidationError('The file must be UTF-8 text')
+        # take every cell of a CSV that looks like an email, e.g. skipping headers
+        data['email_list'] = [
+            value.strip('"\'') for value in re.split(r'[\s,;]+', text)
+            if '@' in value
+        ]
+        if not data['email_list']:
+            raise ValidationError('No emails found')
+        max_emails = getattr(settings, 'BULK_INVITE_MAX_EMAILS', 1000)
+        if len(data['email_list']) > max_emails:
+            raise ValidationError(
+                'At most {} emails can be invited at once'.format(max_emails)
+            )
+        return data
+
+
+class TeamStatusFilterForm(Form):
+    """ Day or date range and history page selection for the team lead
+        dashboard; cleaned_data always has start, end and before
+    """
+    day = DateField(
+        required=False,
+        widget=DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    start = DateField(
+        required=False,
+        widget=DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    end = DateField(
+        required=False,
+        widget=DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    before = CharField(required=False, widget=HiddenInput())
+
+    def clean_before(self):
+        """ Parse the "<day>.<id>" history cursor into a (date, int) tuple
+        """
+        before = self.cleaned_data['before']
+        if not before:
+            return None
+        try:
+            before_day, before_id = before.split('.')
+            return (
+                datetime.strptime(before_day, '%Y-%m-%d').date(),
+                int(before_id)
+            )
+        except ValueError:
+            raise ValidationError('Invalid history cursor')
+
+    def clean(self):
+        super(TeamStatusFilterForm, self).clean()
+        data = self.cleaned_data
+        if data.get('day'):
+            data['start'] = data['end'] = data['day']
+        else:
+            data['start'] = data.get('start') or as_date()
+            data['end'] = data.get('end') or max(data['start'], as_date())
+        if data['end'] < data['start']:
+            raise ValidationError('The end date must not be before the start date')
+        return data
+
+
+class StatusExportForm(Form):
+    """ Date range and format of a status history export; start and end may
+        be left out for an open range
+    """
+    start = DateField(required=False)
+    end = DateField(required=False)
+    format = ChoiceField(
+        required=False,
+        choices=[(export_format, export_format) for export_format in FORMATS]
+    )
+    gzip = BooleanField(required=False)
+
+    def clean(self):
+        super(StatusExportForm, self).clean()
+        data = self.cleaned_data
+        data['format'] = data.get('format') or FORMATS[0]
+        if data.get('start') and data.get('end') and data['end'] < data['start']:
+            raise ValidationError('The end date must not be before the start date')
+        return data
+
+
+class StatusImportForm(Form):
+    status_file = FileField(
+        label='CSV or JSON Lines file',
+        help_text='Columns: email, team or team_uuid, day, status, additional_info_for_team, additional_info_for_lead'
+    )
+    on_conflict = ChoiceField(
+        choices=(
+            (CONFLICT_MODES[0], 'Keep existing statuses'),
+            (CONFLICT_MODES[1], 'Overwrite existing statuses'),
+        ),
+        initial=CONFLICT_MODES[0],
+        widget=Select(attrs={'class': 'form-control'}),
+        label='When a status already exists for that day'
+    )
@@ -0,0 +1,91 @@
+""" Cache for rendered template fragments
+
+    Fragments are stored in the FRAGMENT_CACHE_ALIAS cache under a key built
+    from a name and version stamps, e.g. Team.version (see
+    teambeat.versioning), which the TeamMember, TeamAdmin, Team and
+    TeamMemberStatus signal handlers bump; a change therefore simply makes
+    the old entries unreachable and they age out of the cache. The default
+    locmem backend evicts least recently used entries beyond MAX_ENTRIES;
+    configure a shared backend such as memcached to share fragments between
+    processes.
+
+    CSRF tokens are per user, so fragments are rendered with a placeholder
+    token that is swapped for the request's token on the way out.
+
+    Use render_fragment in Python or the fragment tag in templates:
+
+        {% load fragments %}
+        {% fragment 'teammember-rows' team_stamp %}...{% endfragment %}
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.middleware.csrf import get_token
+from django.template import loader
+
+from teambeat.metrics import record_cache_lookup
+
+import hashlib
+
+
+CSRF_PLACEHOLDER = 'FRAGMENTCSRFTOKENPLACEHOLDER'
+DEFAULT_ALIAS = 'fragments'
+DEFAULT_TIMEOUT = 60 * 60
+
+
+class FragmentCache(object):
+    """ Stores rendered fragments by name and version stamps
+    """
+    def _cache(self):
+        alias = getattr(settings, 'FRAGMENT_CACHE_ALIAS', DEFAULT_ALIAS)
+        if alias not in settings.CACHES:
+            alias = 'default'
+        return caches[alias]
+
+    def key(self, name, stamps):
+        stamp = '|'.join(str(stamp) for stamp in stamps)
+        return 'teambeat:fragment:{}:{}'.format(
+            name,
+            hashlib.md5(stamp.encode()).hexdigest()
+        )
+
+    def get_or_render(self, name, stamps, render, csrf_token=None):
+        """ Return the cached fragment, calling render() to produce (and
+            store) it on a miss; render must use CSRF_PLACEHOLDER in place of
+            the CSRF token, which is filled in with csrf_token
+        """
+        cache = self._cache()
+        key = self.key(name, stamps)
+        fragment = cache.get(key)
+        record_cache_lookup('fragments', fragment is not None)
+        if fragment is None:
+            fragment = render()
+            cache.set(
+                key,
+                fragment,
+                getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+            )
+        return fragment.replace(CSRF_PLACEHOLDER, str(csrf_token or ''))
+
+    def clear(self):
+        self._cache().clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def render_fragment(template_name, context, stamps, request=None):
+    """ Cached loader.render_to_string, keyed on the template name and the
+        stamps, which must cover everything in context the output depends on
+    """
+    def render():
+        return loader.render_to_string(
+            template_name,
+            dict(context, csrf_token=CSRF_PLACEHOLDER),
+            request=request
+        )
+    return fragment_cache.get_or_render(
+        template_name,
+        stamps,
+        render,
+        csrf_token=get_token(request) if request is not None else None
+    )
@@ -0,0 +1,316 @@
+""" Bulk import of team member statuses from CSV or JSON Lines
+
+    Rows are read one at a time from the file (the columns written by
+    teambeat.export: email, team or team_uuid, day, status and the optional
+    additional_info_for_team/additional_info_for_lead), matched to team
+    members through a dict built with a single query, and written in
+    batches of IMPORT_BATCH_SIZE with bulk_create instead of one save() per
+    row.
+
+    Existing statuses for the same (teammember, day) are kept
+    (on_conflict='skip', bulk_create(ignore_conflicts=True)) or overwritten
+    (on_conflict='update'; Django 3.1 has no upsert in bulk_create, so each
+    batch looks up its existing rows in one query and bulk_updates them).
+    Signals do not fire for bulk writes: once all batches are written the
+    daily rollups of the affected teams and days are rebuilt and the team
+    versions bumped. A file that turns out not to be UTF-8, gzip or CSV
+    part way through stops the import at that line; the rows before it
+    stay imported and ImportResult.error says where it stopped.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from teambeat.models import Team, TeamDailyRollup, TeamMember, TeamMemberStatus
+from teambeat.versioning import bump_team_versions
+
+from datetime import datetime
+import codecs
+import csv
+import gzip
+import json
+import time
+import zlib
+
+
+FORMATS = ('csv', 'jsonl')
+CONFLICT_MODES = ('skip', 'update')
+DEFAULT_BATCH_SIZE = 1000
+# rejected rows kept for the report, the rest are only counted
+MAX_REPORTED_REJECTIONS = 100
+
+STATUSES = [status for status, label in TeamMemberStatus._meta.get_field('status').choices]
+UPDATE_FIELDS = ['status', 'additional_info_for_team', 'additional_info_for_lead']
+# raised while reading a file that is not what its name says
+READ_ERRORS = (UnicodeDecodeError, csv.Error, EOFError, OSError, zlib.error)
+
+
+def format_for_filename(filename):
+    """ Guess the import format from a file name, defaulting to csv
+    """
+    name = filename.lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def open_lines(lines, filename):
+    """ Decompress an open binary file or UploadedFile if filename ends in .gz
+    """
+    if filename.lower().endswith('.gz'):
+        return gzip.GzipFile(fileobj=lines, mode='rb')
+    return lines
+
+
+def read_error_reason(error):
+    if isinstance(error, UnicodeDecodeError):
+        return 'File is not UTF-8 encoded text'
+    if isinstance(error, csv.Error):
+        return 'Malformed CSV: {}'.format(error)
+    return 'File is not valid gzip: {}'.format(error)
+
+
+def read_rows(lines, import_format='csv'):
+    """ Generator of (line number, dict) from an iterable of encoded lines,
+        e.g. an open binary file or an UploadedFile
+    """
+    if import_format not in FORMATS:
+        raise ValueError('Unknown import format "{}"'.format(import_format))
+    text = codecs.iterdecode(lines, 'utf-8-sig')
+    if import_format == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield (reader.line_num, row)
+    else:
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield (line_number, row if isinstance(row, dict) else None)
+
+
+class MemberLookup(object):
+    """ Team members of an organization by email, and by email and team name
+        or uuid, loaded with a single query
+    """
+    def __init__(self, organization):
+        self.by_email = {}
+        self.by_team = {}
+        members = TeamMember.objects.filter(
+            team__organization=organization
+        ).values_list(
+            'pk',
+            'team_id',
+            'organization_user__user__email',
+            'team__name',
+            'team__uuid',
+        )
+        for teammember_id, team_id, email, team_name, team_uuid in members:
+            email = email.lower()
+            member = (teammember_id, team_id)
+            self.by_team[(email, team_name)] = member
+            self.by_team[(email, str(team_uuid))] = member
+            # an email is only unambiguous without a team if it is on one team
+            self.by_email.setdefault(email, []).append(member)
+
+    def get(self, email, team=None):
+        """ (teammember pk, team pk) or None
+        """
+        email = (email or '').strip().lower()
+        if team:
+            return self.by_team.get((email, team.strip()))
+        members = self.by_email.get(email, [])
+        if len(members) == 1:
+            return members[0]
+        return None
+
+
+class ImportResult(object):
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected_count = 0
+        self.rejected = []
+        self.team_ids = set()
+        # why the file could not be read to the end, if it couldn't
+        self.error = None
+        self.start = None
+        self.end = None
+        self.started_at = time.monotonic()
+        self.elapsed = 0
+
+    @property
+    def rows(self):
+        return self.created + self.updated + self.skipped + self.rejected_count
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0
+        return self.rows / self.elapsed
+
+    def reject(self, line_number, reason):
+        self.rejected_count += 1
+        if len(self.rejected) < MAX_REPORTED_REJECTIONS:
+            self.rejected.append((line_number, reason))
+
+    def stop(self, line_number, reason):
+        """ Record an unreadable line, which ends the import
+        """
+        self.reject(line_number, reason)
+        self.error = 'Import stopped at line {}: {}'.format(line_number, reason)
+
+    def summary(self):
+        return (
+            'Imported {} rows in {:.1f}s ({:.0f} rows/s): {} created, '
+            '{} updated, {} skipped, {} rejected'
+        ).format(
+            self.rows,
+            self.elapsed,
+            self.rows_per_second,
+            self.created,
+            self.updated,
+            self.skipped,
+            self.rejected_count
+        )
+
+
+def _parse_row(row, lookup):
+    """ Build an unsaved TeamMemberStatus from a row
+        Returns a tuple:
+            (object: TeamMemberStatus or None, string: reason it was rejected)
+    """
+    if row is None:
+        return (None, 'Not a JSON object')
+    member = lookup.get(row.get('email'), row.get('team_uuid') or row.get('team'))
+    if member is None:
+        return (None, 'No team member "{}" on team "{}"'.format(
+            row.get('email'),
+            row.get('team_uuid') or row.get('team') or ''
+        ))
+    try:
+        day = datetime.strptime(str(row.get('day')), '%Y-%m-%d').date()
+    except ValueError:
+        return (None, 'Invalid day "{}", expected YYYY-MM-DD'.format(row.get('day')))
+    status = (row.get('status') or '').strip().lower()
+    if status not in STATUSES:
+        return (None, 'Invalid status "{}"'.format(row.get('status')))
+    teammember_id, team_id = member
+    status = TeamMemberStatus(
+        teammember_id=teammember_id,
+        day=day,
+        status=status,
+        additional_info_for_team=row.get('additional_info_for_team') or None,
+        additional_info_for_lead=row.get('additional_info_for_lead') or None
+    )
+    status.team_id = team_id
+    return (status, None)
+
+
+def _write_batch(statuses, on_conflict, result):
+    # the last row wins when a file repeats a member and day
+    unique_statuses = list({
+        (status.teammember_id, status.day): status for status in statuses
+    }.values())
+    result.skipped += len(statuses) - len(unique_statuses)
+    existing_statuses = TeamMemberStatus.objects.filter(
+        teammember_id__in={status.teammember_id for status in unique_statuses},
+        day__in={status.day for status in unique_statuses}
+    )
+    with transaction.atomic():
+        if on_conflict == 'update':
+            existing = {
+                (teammember_id, day): pk
+                for pk, teammember_id, day in existing_statuses.values_list(
+                    'pk', 'teammember_id', 'day'
+                )
+            }
+            updates = []
+            creates = []
+            for status in unique_statuses:
+                pk = existing.get((status.teammember_id, status.day))
+                if pk is None:
+                    creates.append(status)
+                else:
+                    status.pk = pk
+                    updates.append(status)
+            TeamMemberStatus.objects.bulk_update(updates, UPDATE_FIELDS)
+            TeamMemberStatus.objects.bulk_create(creates, ignore_conflicts=True)
+            # a status saved since existing was read makes its insert
+            # conflict and be skipped, overwrite it like the others
+            conflicted = []
+            if creates:
+                saved = {
+                    (teammember_id, day): (pk, list(values))
+                    for teammember_id, day, pk, *values in existing_statuses.values_list(
+                        'teammember_id', 'day', 'pk', *UPDATE_FIELDS
+                    )
+                }
+                for status in creates:
+                    pk, values = saved[(status.teammember_id, status.day)]
+                    if values != [getattr(status, field) for field in UPDATE_FIELDS]:
+                        status.pk = pk
+                        conflicted.append(status)
+                TeamMemberStatus.objects.bulk_update(conflicted, UPDATE_FIELDS)
+            result.updated += len(updates) + len(conflicted)
+            result.created += len(creates) - len(conflicted)
+        else:
+            # only inserted rows change the count of this narrow filter
+            before = existing_statuses.count()
+            TeamMemberStatus.objects.bulk_create(
+                unique_statuses,
+                ignore_conflicts=True
+            )
+            created = existing_statuses.count() - before
+            result.created += created
+            result.skipped += len(unique_statuses) - created
+
+
+def import_statuses(organization, lines, import_format='csv', on_conflict='skip',
+                    batch_size=None):
+    """ Import statuses for the organization's team members from an
+        iterable of encoded lines
+        Returns an ImportResult
+    """
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError('Unknown conflict mode "{}"'.format(on_conflict))
+    if batch_size is None:
+        batch_size = getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+    result = ImportResult()
+    lookup = MemberLookup(organization)
+    batch = []
+    line_number = 0
+    try:
+        for line_number, row in read_rows(lines, import_format):
+            status, error = _parse_row(row, lookup)
+            if error:
+                result.reject(line_number, error)
+                continue
+            batch.append(status)
+            result.team_ids.add(status.team_id)
+            result.start = min(result.start or status.day, status.day)
+            result.end = max(result.end or status.day, status.day)
+            if len(batch) >= batch_size:
+                _write_batch(batch, on_conflict, result)
+                batch = []
+    except READ_ERRORS as e:
+        # earlier batches are written, so rollups are still rebuilt below
+        result.stop(line_number + 1, read_error_reason(e))
+    if batch:
+        _write_batch(batch, on_conflict, result)
+
+    if result.team_ids:
+        TeamDailyRollup.rebuild(
+            result.start,
+            result.end,
+            teams=Team.objects.filter(pk__in=result.team_ids)
+        )
+        bump_team_versions(result.team_ids)
+    result.elapsed = time.monotonic() - result.started_at
+    return result
@@ -0,0 +1,410 @@
+""" Replay a weighted mix of user traffic against a running server
+
+    Unlike teambeat.benchmark, which calls views one at a time through the
+    test client, this sends real HTTP requests to a gunicorn, runserver or
+    ASGI server from a pool of threads, one virtual user per thread, for a
+    fixed duration. Each virtual user logs in as an organization user, keeps
+    its own session and CSRF cookies and picks its next action by weight
+    from the traffic mix. The report has the throughput, error rate and a
+    latency histogram per action; used by the replay_load management command.
+
+    Virtual users log in with signed login tokens issued here, so the server
+    must share this project's SECRET_KEY and database, or with a password
+    given to the command.
+"""
+from django.db import connections
+from django.urls import reverse
+
+from session_manager.tokens import SignedToken
+from teambeat.benchmark import percentile
+from teambeat.models import TeamAdmin, TeamMember
+from teambeat.status_defs import STATUSES
+
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+import platform
+import random
+import socket
+import threading
+import time
+
+
+# action name: default weight
+DEFAULT_MIX = {
+    'login': 2,
+    'dashboard': 25,
+    'dashboard_api': 25,
+    'set_status': 15,
+    'user_search': 20,
+    'team_admin_api': 13,
+}
+# upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+PERCENTILES = (50, 90, 99)
+SEARCH_TERMS = ('a', 'an', 'jo', 'ma', 'li', 'gr', 'example')
+
+
+def parse_mix(value):
+    """ Parse a traffic mix like "dashboard=3,user_search=1" into a dict of
+        {action: weight}; raises ValueError for unknown actions or weights
+    """
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        action, separator, weight = part.partition('=')
+        action = action.strip()
+        if action not in DEFAULT_MIX:
+            raise ValueError('Unknown action "{}", choose from {}'.format(
+                action,
+                ', '.join(sorted(DEFAULT_MIX))
+            ))
+        try:
+            mix[action] = float(weight) if separator else 1.0
+        except ValueError:
+            raise ValueError('Weight of "{}" is not a number'.format(action))
+        if mix[action] < 0:
+            raise ValueError('Weight of "{}" is negative'.format(action))
+    if not any(mix.values()):
+        raise ValueError('The traffic mix needs at least one weighted action')
+    return mix
+
+
+class VirtualUserProfile(object):
+    """ What a virtual user needs to know about its organization user, read
+        from the database before the load starts
+    """
+    def __init__(self, org_user, member_team_uuids, admin_teams):
+        self.org_user_id = org_user.pk
+        self.user = org_user.user
+        self.email = org_user.user.email
+        self.organization_id = org_user.organization_id
+        self.member_team_uuids = member_team_uuids
+        # [(team uuid, org user id of one of its members)]
+        self.admin_teams = admin_teams
+
+    @classmethod
+    def load(cls, organization, users=None):
+        """ Profiles of the organization's active users, admins first so small
+            runs still exercise the team admin API
+        """
+        org_users = organization.organizationuser_set.filter(
+            active=True,
+            user__is_active=True
+        ).select_related('user').order_by('-is_organization_admin', 'pk')
+        if users:
+            org_users = org_users[:users]
+        org_users = list(org_users)
+        org_user_ids = [org_user.pk for org_user in org_users]
+
+        member_teams = {}
+        team_members = {}
+        for org_user_id, team_id, team_uuid in TeamMember.objects.filter(
+            team__organization=organization,
+            active=True
+        ).values_list('organization_user_id', 'team_id', 'team__uuid'):
+            if org_user_id in org_user_ids:
+                member_teams.setdefault(org_user_id, []).append(str(team_uuid))
+            team_members.setdefault(team_id, org_user_id)
+
+        admin_teams = {}
+        for org_user_id, team_id, team_uuid in TeamAdmin.objects.filter(
+            organization_user_id__in=org_user_ids
+        ).values_list('organization_user_id', 'team_id', 'team__uuid'):
+            if team_id in team_members:
+                admin_teams.setdefault(org_user_id, []).append(
+                    (str(team_uuid), team_members[team_id])
+                )
+
+        return [
+            cls(
+                org_user,
+                member_teams.get(org_user.pk, []),
+                admin_teams.get(org_user.pk, [])
+            )
+            for org_user in org_users
+        ]
+
+    def actions(self, mix):
+        """ The actions of the mix this user is able to take
+        """
+        available = dict(mix)
+        if not self.member_team_uuids:
+            available.pop('set_status', None)
+        if not self.admin_teams:
+            available.pop('team_admin_api', None)
+        return {action: weight for action, weight in available.items() if weight}
+
+
+class ActionFailed(Exception):
+    pass
+
+
+class VirtualUser(object):
+    """ A browser-like HTTP client for one organization user, following
+        redirects and keeping session and CSRF cookies between requests
+    """
+    def __init__(self, base_url, profile, password=None, timeout=30, rng=None):
+        self.base_url = base_url.rstrip('/')
+        self.profile = profile
+        self.password = password
+        self.timeout = timeout
+        self.rng = rng or random.Random()
+        self.login_path = reverse('session_manager_login')
+        self.logged_in = False
+        self._new_session()
+
+    def _new_session(self):
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def _csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, path, data=None, params=None, ajax=False):
+        """ GET, or POST if data is given, a path of the site
+            Returns (status code, final URL path after redirects); an error
+            status raises urllib.error.HTTPError
+        """
+        url = self.base_url + path
+        if params:
+            url = '{}?{}'.format(url, urlencode(params))
+        headers = {'Referer': self.base_url + '/'}
+        body = None
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=self._csrf_token())
+            body = urlencode(data).encode('utf-8')
+            headers['X-CSRFToken'] = data['csrfmiddlewaretoken']
+        if ajax:
+            headers['X-Requested-With'] = 'XMLHttpRequest'
+        with self.opener.open(Request(url, body, headers), timeout=self.timeout) as response:
+            response.read()
+            return (response.status, urlsplit(response.geturl()).path)
+
+    def _page(self, path, data=None, params=None, ajax=False):
+        status, final_path = self.request(path, data, params, ajax)
+        if final_path == self.login_path:
+            self.logged_in = False
+            raise ActionFailed('redirected to login')
+        return status
+
+    def login(self):
+        """ Start a new session and select the user's organization
+        """
+        self._new_session()
+        self.logged_in = False
+        if self.password:
+            # the login form sets the CSRF cookie
+            self.request(self.login_path)
+            status, final_path = self.request(self.login_path, {
+                'email': self.profile.email,
+                'password': self.password,
+            })
+        else:
+            # tokens are bound to last_login, which the previous login changed
+            self.profile.user.refresh_from_db(fields=['password', 'last_login'])
+            status, final_path = self.request(
+                SignedToken.issue(self.profile.user, 'login').path
+            )
+        if final_path == self.login_path:
+            raise ActionFailed('login failed')
+        status = self._page(reverse('set_organization'), {
+            'organization_id': self.profile.organization_id,
+        })
+        self.logged_in = True
+        return status
+
+    def dashboard(self):
+        return self._page(reverse('dashboard'))
+
+    def dashboard_api(self):
+        return self._page(reverse('dashboard_refresh_api'), ajax=True)
+
+    def set_status(self):
+        team_uuid = self.rng.choice(self.profile.member_team_uuids)
+        return self._page(reverse('teams_set_status', kwargs={'team_uuid': team_uuid}), {
+            'selected-status': self.rng.choice(list(STATUSES)),
+            'status-additional-info-team': '',
+            'status-additional-info-lead': '',
+        })
+
+    def user_search(self):
+        return self._page(
+            reverse('api_user_search'),
+            params={'search_term': self.rng.choice(SEARCH_TERMS)},
+            ajax=True
+        )
+
+    def team_admin_api(self):
+        # adding a user already on the team reads everything a real change
+        # would without writing, so the data set stays the same between runs
+        team_uuid, org_user_id = self.rng.choice(self.profile.admin_teams)
+        return self._page(
+            reverse('team_admin_dashboard_api', kwargs={
+                'team_uuid': team_uuid,
+                'api_target': 'addteammember',
+            }),
+            {'user_id': org_user_id},
+            ajax=True
+        )
+
+
+class ActionStats(object):
+    """ Latencies, in milliseconds, and errors of one action
+    """
+    def __init__(self):
+        self.latencies = []
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        self.errors = {}
+
+    def record(self, latency, error=None):
+        self.latencies.append(latency)
+        bucket = 0
+        while bucket < len(HISTOGRAM_BUCKETS) and latency > HISTOGRAM_BUCKETS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+        if error:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def report(self, duration):
+        count = len(self.latencies)
+        error_count = sum(self.errors.values())
+        result = {
+            'requests': count,
+            'errors': error_count,
+            'error_rate': round(error_count / count, 4) if count else 0.0,
+            'throughput': round(count / duration, 2) if duration else 0.0,
+            'error_reasons': dict(self.errors),
+            'histogram': histogram_labels(self.histogram),
+        }
+        if count:
+            result['mean_ms'] = round(sum(self.latencies) / count, 3)
+            result['max_ms'] = round(max(self.latencies), 3)
+            for percent in PERCENTILES:
+                result['p{}_ms'.format(percent)] = round(
+                    percentile(self.latencies, percent),
+                    3
+                )
+        return result
+
+
+def histogram_labels(counts):
+    """ Label histogram counts with their bucket bounds, as a dict of
+        {"<=5": count, ..., ">5000": count}
+    """
+    labels = ['<={}'.format(bound) for bound in HISTOGRAM_BUCKETS]
+    labels.append('>{}'.format(HISTOGRAM_BUCKETS[-1]))
+    return dict(zip(labels, counts))
+
+
+def _error_reason(error):
+    if isinstance(error, HTTPError):
+        return 'HTTP {}'.format(error.code)
+    if isinstance(error, URLError):
+        return 'connection: {}'.format(error.reason)
+    if isinstance(error, socket.timeout):
+        return 'timeout'
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+class LoadReplay(object):
+    """ Run virtual users against base_url from a pool of threads until the
+        duration in seconds is up
+    """
+    def __init__(self, base_url, profiles, mix=None, concurrency=10,
+                 duration=60, password=None, timeout=30, seed=None):
+        if not profiles:
+            raise ValueError('No organization users to replay traffic as')
+        self.base_url = base_url
+        self.profiles = profiles
+        self.mix = mix or DEFAULT_MIX
+        self.concurrency = concurrency
+        self.duration = duration
+        self.password = password
+        self.timeout = timeout
+        self.seed = seed
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _record(self, action, latency, error=None):
+        with self._lock:
+            if action not in self.stats:
+                self.stats[action] = ActionStats()
+            self.stats[action].record(latency, error)
+
+    def _timed(self, user, action):
+        started = time.perf_counter()
+        error = None
+        try:
+            getattr(user, action)()
+        except Exception as e:
+            error = _error_reason(e)
+        self._record(action, (time.perf_counter() - started) * 1000, error)
+
+    def _run_user(self, number, deadline):
+        try:
+            self._replay_user(number, deadline)
+        finally:
+            # token logins read the user in this thread
+            connections.close_all()
+
+    def _replay_user(self, number, deadline):
+        rng = random.Random(None if self.seed is None else self.seed + number)
+        profile = self.profiles[number % len(self.profiles)]
+        user = VirtualUser(self.base_url, profile, self.password, self.timeout, rng)
+        actions = profile.actions(self.mix)
+        if not actions:
+            return
+        names = list(actions)
+        weights = [actions[action] for action in names]
+        while time.monotonic() < deadline:
+            action = rng.choices(names, weights)[0] if user.logged_in else 'login'
+            self._timed(user, action)
+            if not user.logged_in:
+                # don't hammer a server refusing logins
+                time.sleep(min(1.0, max(deadline - time.monotonic(), 0)))
+
+    def run(self):
+        """ Replay the traffic, returns the report as a JSON serializable dict
+        """
+        started = time.monotonic()
+        deadline = started + self.duration
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = [
+                pool.submit(self._run_user, number, deadline)
+                for number in range(self.concurrency)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.monotonic() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        total = ActionStats()
+        actions = {}
+        for action, stats in sorted(self.stats.items()):
+            actions[action] = stats.report(elapsed)
+            for latency in stats.latencies:
+                total.record(latency)
+            total.errors.update({
+                '{} {}'.format(action, reason): count
+                for reason, count in stats.errors.items()
+            })
+        return {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'base_url': self.base_url,
+            'concurrency': self.concurrency,
+            'duration': round(elapsed, 3),
+            'users': len(self.profiles),
+            'mix': self.mix,
+            'total': total.report(elapsed),
+            'actions': actions,
+        }
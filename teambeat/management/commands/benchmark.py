@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from teambeat.benchmark import compare_reports, run_benchmark
+from teambeat.models import Organization
+from teambeat.synthetic import seed_organization
+
+import json
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every GET view through the test client and write latency '
+        'percentiles, query counts, session writes and peak memory to a JSON report'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organization',
+            help='Benchmark an existing organization with this uuid, e.g. one made by seed_data'
+        )
+        parser.add_argument('--users', type=int, default=200, help='Users of the seeded organization (default: 200)')
+        parser.add_argument('--teams', type=int, default=20, help='Teams of the seeded organization (default: 20)')
+        parser.add_argument(
+            '--members-per-team',
+            type=int,
+            default=10,
+            help='Members per seeded team (default: 10)'
+        )
+        parser.add_argument('--days', type=int, default=30, help='Days of seeded status history (default: 30)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the seeded data (default: 0)')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per URL (default: 20)')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per URL first (default: 2)')
+        parser.add_argument(
+            '--url',
+            action='append',
+            dest='url_names',
+            help='Only benchmark the URL with this name, repeatable'
+        )
+        parser.add_argument(
+            '--session-mode',
+            action='append',
+            dest='session_modes',
+            choices=sorted(settings.SESSION_ENGINES),
+            help='Keep sessions this way instead of SESSION_ENGINE, repeat to compare modes'
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Baseline JSON report to compare the results with')
+
+    def _run(self, organization, options):
+        return {
+            session_mode: run_benchmark(
+                organization,
+                options['iterations'],
+                options['warmup'],
+                options['url_names'],
+                session_mode
+            )
+            for session_mode in options['session_modes'] or [None]
+        }
+
+    def _benchmark(self, options):
+        """ Returns a report per session mode, keyed None without any
+        """
+        if options['organization']:
+            organization = Organization.objects.filter(uuid=options['organization']).first()
+            if organization is None:
+                raise CommandError('Organization "{}" not found'.format(options['organization']))
+            return self._run(organization, options)
+
+        # seeded data is rolled back so the database is left as it was
+        reports = None
+        try:
+            with transaction.atomic():
+                organization = seed_organization(
+                    'Benchmark',
+                    users=options['users'],
+                    teams=options['teams'],
+                    members_per_team=options['members_per_team'],
+                    days=options['days'],
+                    seed=options['seed']
+                )
+                reports = self._run(organization, options)
+                raise Rollback()
+        except Rollback:
+            pass
+        return reports
+
+    def _write_report(self, report):
+        self.stdout.write('{:<40} {:>6} {:>9} {:>9} {:>9} {:>8} {:>7} {:>10}'.format(
+            'url', 'status', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'writes', 'peak KiB'
+        ))
+        for name, result in sorted(report['urls'].items()):
+            self.stdout.write('{:<40} {:>6} {:>9} {:>9} {:>9} {:>8} {:>7} {:>10}'.format(
+                name,
+                result['status'],
+                result['p50_ms'],
+                result['p90_ms'],
+                result['p99_ms'],
+                result['queries'],
+                result['session_writes'],
+                result['peak_memory_kib']
+            ))
+
+    def _write_changes(self, title, baseline, report):
+        self.stdout.write('\n{}:'.format(title))
+        for name, metric, old, new, change in compare_reports(baseline, report):
+            self.stdout.write('{:<40} {:<16} {:>10} -> {:>10} ({:+.1f}%)'.format(
+                name, metric, old, new, change
+            ))
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        reports = self._benchmark(options)
+        session_modes = list(reports)
+        report = reports[session_modes[0]]
+        for session_mode in session_modes:
+            if session_mode:
+                self.stdout.write('\nSession mode {}:'.format(session_mode))
+            self._write_report(reports[session_mode])
+
+        if baseline is not None:
+            self._write_changes('Changes from {}'.format(options['compare']), baseline, report)
+        for session_mode in session_modes[1:]:
+            self._write_changes(
+                'Changes from session mode {} to {}'.format(session_modes[0], session_mode),
+                report,
+                reports[session_mode]
+            )
+
+        if options['output']:
+            if len(session_modes) > 1:
+                report = {'session_modes': reports}
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+            self.stdout.write('Wrote report to {}'.format(options['output']))
@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from teambeat.export import FORMATS, export_queryset, stream_export
+from teambeat.models import Organization, Team
+
+from datetime import datetime
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Export the status history of a team or an organization as CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--team',
+            help='Export the team with this uuid'
+        )
+        parser.add_argument(
+            '--organization',
+            help='Export every team of the organization with this uuid'
+        )
+        parser.add_argument(
+            '--start',
+            help='First day to export, YYYY-MM-DD (defaults to the first status)'
+        )
+        parser.add_argument(
+            '--end',
+            help='Last day to export, YYYY-MM-DD (defaults to the last status)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default=FORMATS[0],
+            help='Output format (default: {})'.format(FORMATS[0])
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the output with gzip'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Rows fetched from the database at a time (default: EXPORT_CHUNK_SIZE)'
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help='File to write to (default: standard output)'
+        )
+
+    def _parse_day(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Invalid date "{}", expected YYYY-MM-DD'.format(value))
+
+    def handle(self, *args, **options):
+        start = self._parse_day(options['start']) if options['start'] else None
+        end = self._parse_day(options['end']) if options['end'] else None
+        if start and end and end < start:
+            raise CommandError('--end must not be before --start')
+
+        team = organization = None
+        if options['team']:
+            team = Team.objects.filter(uuid=options['team']).first()
+            if team is None:
+                raise CommandError('Team "{}" not found'.format(options['team']))
+        if options['organization']:
+            organization = Organization.objects.filter(
+                uuid=options['organization']
+            ).first()
+            if organization is None:
+                raise CommandError(
+                    'Organization "{}" not found'.format(options['organization'])
+                )
+
+        chunks = stream_export(
+            export_queryset(
+                team=team,
+                organization=organization,
+                start=start,
+                end=end
+            ),
+            options['format'],
+            compress=options['gzip'],
+            chunk_size=options['chunk_size']
+        )
+        if options['output'] == '-':
+            output = sys.stdout.buffer
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
+        else:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            self.stdout.write('Exported statuses to {}'.format(options['output']))
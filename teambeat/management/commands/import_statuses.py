@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from teambeat.importer import (
+    CONFLICT_MODES,
+    FORMATS,
+    format_for_filename,
+    import_statuses,
+)
+from teambeat.models import Organization
+
+import gzip
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Import team member statuses for an organization from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='File to import, gzip compressed if it ends in .gz, - for standard input'
+        )
+        parser.add_argument(
+            '--organization',
+            required=True,
+            help='Uuid of the organization the team members belong to'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Input format (defaults to jsonl for .jsonl files, csv otherwise)'
+        )
+        parser.add_argument(
+            '--on-conflict',
+            choices=CONFLICT_MODES,
+            default=CONFLICT_MODES[0],
+            help='Keep (skip) or overwrite (update) existing statuses for the same member and day'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Statuses written per batch (default: IMPORT_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        organization = Organization.objects.filter(
+            uuid=options['organization']
+        ).first()
+        if organization is None:
+            raise CommandError(
+                'Organization "{}" not found'.format(options['organization'])
+            )
+
+        path = options['path']
+        if path == '-':
+            lines = sys.stdin.buffer
+        elif path.endswith('.gz'):
+            lines = gzip.open(path, 'rb')
+        else:
+            lines = open(path, 'rb')
+        try:
+            result = import_statuses(
+                organization,
+                lines,
+                import_format=options['format'] or format_for_filename(path),
+                on_conflict=options['on_conflict'],
+                batch_size=options['batch_size']
+            )
+        finally:
+            if lines is not sys.stdin.buffer:
+                lines.close()
+
+        for line_number, reason in result.rejected:
+            self.stderr.write('Line {}: {}'.format(line_number, reason))
+        if result.rejected_count > len(result.rejected):
+            self.stderr.write('{} more rows were rejected'.format(
+                result.rejected_count - len(result.rejected)
+            ))
+        self.stdout.write(result.summary())
+        if result.error:
+            raise CommandError(result.error)
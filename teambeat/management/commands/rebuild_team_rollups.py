@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from teambeat.models import Team, TeamDailyRollup, as_date
+
+from datetime import datetime
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per team daily status rollups for a date range'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='First day to rebuild, YYYY-MM-DD (defaults to today)'
+        )
+        parser.add_argument(
+            '--end',
+            help='Last day to rebuild, YYYY-MM-DD (defaults to --start)'
+        )
+        parser.add_argument(
+            '--team',
+            action='append',
+            dest='teams',
+            help='Limit the rebuild to the team with this uuid, repeatable'
+        )
+
+    def _parse_day(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Invalid date "{}", expected YYYY-MM-DD'.format(value))
+
+    def handle(self, *args, **options):
+        start = self._parse_day(options['start']) if options['start'] else as_date()
+        end = self._parse_day(options['end']) if options['end'] else start
+        if end < start:
+            raise CommandError('--end must not be before --start')
+
+        teams = None
+        if options['teams']:
+            teams = Team.objects.filter(uuid__in=options['teams'])
+
+        created = TeamDailyRollup.rebuild(start, end, teams=teams)
+        self.stdout.write(
+            'Rebuilt {} team rollups from {} to {}'.format(created, start, end)
+        )
@@ -0,0 +1,112 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from teambeat.loadtest import (
+    DEFAULT_MIX,
+    LoadReplay,
+    VirtualUserProfile,
+    parse_mix,
+)
+from teambeat.models import Organization
+
+import json
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a weighted mix of logins, dashboards, status updates, team '
+        'admin API calls and user searches against a running server and '
+        'report throughput, error rates and latency histograms'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            default='http://127.0.0.1:8000',
+            help='Server to send traffic to (default: http://127.0.0.1:8000)'
+        )
+        parser.add_argument(
+            '--organization',
+            required=True,
+            help='Uuid of the organization whose users are replayed, e.g. one made by seed_data'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            help='Only act as this many of the organization users (default: all)'
+        )
+        parser.add_argument('--concurrency', type=int, default=10, help='Virtual users at once (default: 10)')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds to run for (default: 60)')
+        parser.add_argument(
+            '--mix',
+            default=','.join('{}={}'.format(action, weight) for action, weight in DEFAULT_MIX.items()),
+            help='Comma separated action=weight pairs (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--password',
+            help='Log in through the login form with this password instead of signed login tokens'
+        )
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request fails (default: 30)')
+        parser.add_argument('--seed', type=int, help='Random seed for repeatable action sequences')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        organization = Organization.objects.filter(uuid=options['organization']).first()
+        if organization is None:
+            raise CommandError('Organization "{}" not found'.format(options['organization']))
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+
+        profiles = VirtualUserProfile.load(organization, options['users'])
+        if not profiles:
+            raise CommandError('Organization "{}" has no active users'.format(organization.name))
+
+        self.stdout.write('Replaying traffic against {} as {} users, {} at once, for {}s'.format(
+            options['base_url'],
+            len(profiles),
+            options['concurrency'],
+            options['duration']
+        ))
+        report = LoadReplay(
+            options['base_url'],
+            profiles,
+            mix=mix,
+            concurrency=options['concurrency'],
+            duration=options['duration'],
+            password=options['password'],
+            timeout=options['timeout'],
+            seed=options['seed']
+        ).run()
+
+        row = '{:<16} {:>9} {:>7} {:>8} {:>9} {:>9} {:>9} {:>9}'
+        self.stdout.write(row.format(
+            'action', 'requests', 'errors', 'req/s', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms'
+        ))
+        for name, result in list(report['actions'].items()) + [('total', report['total'])]:
+            self.stdout.write(row.format(
+                name,
+                result['requests'],
+                result['errors'],
+                result['throughput'],
+                result.get('mean_ms', '-'),
+                result.get('p50_ms', '-'),
+                result.get('p90_ms', '-'),
+                result.get('p99_ms', '-')
+            ))
+
+        self.stdout.write('\nLatency histogram (ms):')
+        for bucket, count in report['total']['histogram'].items():
+            self.stdout.write('{:>8} {:>9}'.format(bucket, count))
+
+        if report['total']['errors']:
+            self.stdout.write('\nErrors ({:.2%} of requests):'.format(report['total']['error_rate']))
+            for reason, count in sorted(report['total']['error_reasons'].items()):
+                self.stdout.write('{:>9} {}'.format(count, reason))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+            self.stdout.write('Wrote report to {}'.format(options['output']))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from teambeat.models import Organization
+from teambeat.synthetic import seed_organization
+
+import time
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic organizations, users, teams and status history with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--organizations',
+            type=int,
+            default=1,
+            help='Number of organizations to create (default: 1)'
+        )
+        parser.add_argument(
+            '--name',
+            default='Synthetic',
+            help='Organization name prefix, numbered per organization (default: Synthetic)'
+        )
+        parser.add_argument('--users', type=int, default=100, help='Users per organization (default: 100)')
+        parser.add_argument('--teams', type=int, default=10, help='Teams per organization (default: 10)')
+        parser.add_argument(
+            '--members-per-team',
+            type=int,
+            default=10,
+            help='Members per team (default: 10)'
+        )
+        parser.add_argument('--days', type=int, default=30, help='Days of status history (default: 30)')
+        parser.add_argument(
+            '--status-rate',
+            type=float,
+            default=0.8,
+            help='Chance a member reported a status on a given day (default: 0.8)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per bulk insert (default: 1000)'
+        )
+        parser.add_argument('--seed', type=int, help='Random seed for repeatable data')
+
+    def handle(self, *args, **options):
+        names = [
+            '{} {}'.format(options['name'], number)
+            for number in range(1, options['organizations'] + 1)
+        ]
+        existing = Organization.objects.filter(name__in=names).values_list('name', flat=True)
+        if existing:
+            raise CommandError(
+                'Organizations already exist: {}, choose another --name'.format(
+                    ', '.join(sorted(existing))
+                )
+            )
+
+        for number, name in enumerate(names):
+            started = time.monotonic()
+            organization = seed_organization(
+                name,
+                users=options['users'],
+                teams=options['teams'],
+                members_per_team=options['members_per_team'],
+                days=options['days'],
+                status_rate=options['status_rate'],
+                batch_size=options['batch_size'],
+                seed=None if options['seed'] is None else options['seed'] + number
+            )
+            self.stdout.write('Created "{}" ({}) in {:.1f}s'.format(
+                name,
+                organization.uuid,
+                time.monotonic() - started
+            ))
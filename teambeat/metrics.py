@@ -0,0 +1,425 @@
+""" Prometheus metrics, counted in process and summed across gunicorn workers
+
+    metrics_middleware (see teambeat.middleware) records request latency,
+    SQL query counts and time and response sizes per URL name; the caches
+    record their hits and misses with record_cache_lookup. Each process only
+    adds to its own values, under a lock no other process takes. With
+    METRICS_DIR set the values live in a memory mapped file per process in
+    that directory and a scrape of any worker sums the files of all of
+    them, so one worker reports the whole server. Files of exited workers
+    are kept, as their counts still belong to the totals, until the
+    on_starting hook in gunicorn.conf.py empties the directory when the
+    server starts again. Without METRICS_DIR a process only
+    reports itself. The email outbox is counted when scraped.
+
+    The text format is served at METRICS_PATH before the session middleware
+    runs, behind a bearer token when METRICS_TOKEN is set (or not at all
+    with METRICS_REQUIRE_TOKEN on and no token).
+"""
+from django.conf import settings
+from django.db.models import Count
+
+from session_manager.models import EmailLog
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 15, 20, 30, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'teambeat_http_requests_total': (
+        'counter',
+        'Requests by URL name, method and status code',
+        None
+    ),
+    'teambeat_http_request_duration_seconds': (
+        'histogram',
+        'Request latency by URL name',
+        LATENCY_BUCKETS
+    ),
+    'teambeat_http_request_queries': (
+        'histogram',
+        'SQL queries per request by URL name',
+        QUERY_BUCKETS
+    ),
+    'teambeat_http_request_query_duration_seconds': (
+        'histogram',
+        'Time spent running SQL per request by URL name',
+        LATENCY_BUCKETS
+    ),
+    'teambeat_http_response_size_bytes': (
+        'histogram',
+        'Response body size by URL name, streaming responses excluded',
+        SIZE_BUCKETS
+    ),
+    'teambeat_cache_lookups_total': (
+        'counter',
+        'Cache lookups by cache and result (hit or miss)',
+        None
+    ),
+    'teambeat_email_outbox_emails': (
+        'gauge',
+        'Emails in the outbox by status',
+        None
+    ),
+}
+OUTBOX_STATUSES = (
+    EmailLog.STATUS_QUEUED,
+    EmailLog.STATUS_SENDING,
+    EmailLog.STATUS_FAILED,
+)
+FILE_PREFIX = 'metrics-'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def sample_key(name, labels):
+    """ Key a sample is stored under: its name and sorted labels as JSON
+    """
+    return json.dumps([name, sorted(labels.items())], separators=(',', ':'))
+
+
+class LocalValues(object):
+    """ Sample values of this process only
+    """
+    def __init__(self):
+        self.values = {}
+
+    def add(self, key, amount):
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def items(self):
+        return list(self.values.items())
+
+
+class MmapValues(object):
+    """ Sample values of this process in a memory mapped file, which other
+        processes read with read_values_file
+
+        The file starts with the number of bytes in use, then holds entries
+        of a 4 byte key length, the UTF-8 key padded to a multiple of 8 bytes
+        after the length and the 8 byte float value. Entries are only ever
+        appended, and the length is written after the entry, so readers
+        never see a partial one.
+    """
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.INITIAL_SIZE:
+            self.file.truncate(self.INITIAL_SIZE)
+            size = self.INITIAL_SIZE
+        self.mmap = mmap.mmap(self.file.fileno(), size)
+        self.used = struct.unpack_from('<q', self.mmap, 0)[0] or 8
+        self.positions = {
+            key: position
+            for key, value, position in _read_entries(self.mmap, self.used)
+        }
+
+    def _grow(self, size):
+        self.mmap.close()
+        self.file.truncate(size)
+        self.mmap = mmap.mmap(self.file.fileno(), size)
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        padded = len(encoded) + (-(4 + len(encoded)) % 8)
+        entry_size = 4 + padded + 8
+        if self.used + entry_size > len(self.mmap):
+            self._grow(max(len(self.mmap) * 2, self.used + entry_size))
+        struct.pack_into(
+            '<i{}sd'.format(padded),
+            self.mmap,
+            self.used,
+            len(encoded),
+            encoded,
+            0.0
+        )
+        position = self.used + 4 + padded
+        self.used += entry_size
+        struct.pack_into('<q', self.mmap, 0, self.used)
+        self.positions[key] = position
+        return position
+
+    def add(self, key, amount):
+        position = self.positions.get(key)
+        if position is None:
+            position = self._append(key)
+        value = struct.unpack_from('<d', self.mmap, position)[0]
+        struct.pack_into('<d', self.mmap, position, value + amount)
+
+    def items(self):
+        return [
+            (key, value)
+            for key, value, position in _read_entries(self.mmap, self.used)
+        ]
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+
+def _read_entries(data, used):
+    """ (key, value, value position) of the entries in a values file
+    """
+    position = 8
+    used = min(used, len(data))
+    while position + 4 <= used:
+        length = struct.unpack_from('<i', data, position)[0]
+        padded = length + (-(4 + length) % 8)
+        value_position = position + 4 + padded
+        if length <= 0 or value_position + 8 > used:
+            break
+        key = bytes(data[position + 4:position + 4 + length]).decode('utf-8')
+        yield key, struct.unpack_from('<d', data, value_position)[0], value_position
+        position = value_position + 8
+
+
+def read_values_file(path):
+    """ (key, value) pairs of a values file written by any process
+    """
+    with open(path, 'rb') as values_file:
+        data = values_file.read()
+    if len(data) < 8:
+        return []
+    used = struct.unpack_from('<q', data, 0)[0]
+    return [(key, value) for key, value, position in _read_entries(data, used)]
+
+
+class Metrics(object):
+    """ Records samples in this process, collects them from all of them
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.store = None
+        self.pid = None
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def _store(self):
+        # reopened after a fork, gunicorn workers must not share a file
+        pid = os.getpid()
+        if self.store is None or self.pid != pid:
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                self.store = MmapValues(os.path.join(
+                    self.directory,
+                    '{}{}.db'.format(FILE_PREFIX, pid)
+                ))
+            else:
+                self.store = LocalValues()
+            self.pid = pid
+        return self.store
+
+    def inc(self, name, labels, amount=1):
+        key = sample_key(name, labels)
+        with self.lock:
+            self._store().add(key, amount)
+
+    def observe(self, name, labels, value):
+        """ Add a value to a histogram
+        """
+        buckets = METRICS[name][2]
+        le = '+Inf'
+        for bound in buckets:
+            if value <= bound:
+                le = str(bound)
+                break
+        keys = (
+            sample_key(name + '_bucket', dict(labels, le=le)),
+            sample_key(name + '_count', labels),
+        )
+        sum_key = sample_key(name + '_sum', labels)
+        with self.lock:
+            store = self._store()
+            for key in keys:
+                store.add(key, 1)
+            store.add(sum_key, value)
+
+    def samples(self):
+        """ Values of every sample, summed across processes when METRICS_DIR
+            is set, as a dict of {key: value}
+        """
+        with self.lock:
+            own = self._store().items()
+        if not self.directory:
+            return dict(own)
+        totals = {}
+        for file_name in os.listdir(self.directory):
+            if not file_name.startswith(FILE_PREFIX):
+                continue
+            try:
+                values = read_values_file(os.path.join(self.directory, file_name))
+            except OSError:
+                continue
+            for key, value in values:
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def reset(self):
+        """ Forget this process's samples, removing its file
+        """
+        with self.lock:
+            if isinstance(self.store, MmapValues):
+                self.store.close()
+                os.remove(self.store.path)
+            self.store = None
+
+
+metrics = Metrics()
+
+
+class QueryTimer(object):
+    """ connection.execute_wrapper callable counting and timing queries
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+def record_request(request, response, duration, query_timer):
+    resolver_match = getattr(request, 'resolver_match', None)
+    view = resolver_match.view_name if resolver_match else 'unresolved'
+    labels = {'view': view}
+    metrics.inc('teambeat_http_requests_total', {
+        'view': view,
+        'method': request.method,
+        'status': str(response.status_code),
+    })
+    metrics.observe('teambeat_http_request_duration_seconds', labels, duration)
+    metrics.observe('teambeat_http_request_queries', labels, query_timer.count)
+    metrics.observe(
+        'teambeat_http_request_query_duration_seconds',
+        labels,
+        query_timer.duration
+    )
+    if not response.streaming:
+        metrics.observe('teambeat_http_response_size_bytes', labels, len(response.content))
+
+
+def record_cache_lookup(cache_name, hit):
+    metrics.inc('teambeat_cache_lookups_total', {
+        'cache': cache_name,
+        'result': 'hit' if hit else 'miss',
+    })
+
+
+def outbox_samples():
+    counts = dict(
+        EmailLog.objects.filter(
+            status__in=OUTBOX_STATUSES
+        ).values_list('status').annotate(Count('pk'))
+    )
+    return {
+        sample_key('teambeat_email_outbox_emails', {'status': status}): float(counts.get(status, 0))
+        for status in OUTBOX_STATUSES
+    }
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _bucket_order(labels):
+    le = dict(labels).get('le')
+    if le is None:
+        return 0
+    return float('inf') if le == '+Inf' else float(le)
+
+
+def exposition(samples):
+    """ Render samples, a dict of {key: value}, in the Prometheus text format;
+        histogram buckets are stored per bucket and made cumulative here
+    """
+    by_metric = {}
+    for key, value in samples.items():
+        name, labels = json.loads(key)
+        labels = [tuple(pair) for pair in labels]
+        for metric_name in METRICS:
+            if name == metric_name or (
+                METRICS[metric_name][0] == 'histogram'
+                and name in ('{}_bucket'.format(metric_name), '{}_sum'.format(metric_name), '{}_count'.format(metric_name))
+            ):
+                by_metric.setdefault(metric_name, []).append((name, labels, value))
+                break
+
+    lines = []
+    for metric_name, (metric_type, help_text, buckets) in METRICS.items():
+        if metric_name not in by_metric:
+            continue
+        lines.append('# HELP {} {}'.format(metric_name, help_text))
+        lines.append('# TYPE {} {}'.format(metric_name, metric_type))
+        entries = sorted(
+            by_metric[metric_name],
+            key=lambda entry: (
+                [pair for pair in entry[1] if pair[0] != 'le'],
+                entry[0],
+                _bucket_order(entry[1])
+            )
+        )
+        if metric_type == 'histogram':
+            entries = _cumulative_buckets(metric_name, buckets, entries)
+        for name, labels, value in entries:
+            label_text = ','.join(
+                '{}="{}"'.format(label, _escape(str(label_value)))
+                for label, label_value in labels
+            )
+            lines.append('{}{} {}'.format(
+                name,
+                '{{{}}}'.format(label_text) if label_text else '',
+                repr(float(value))
+            ))
+    return '\n'.join(lines) + '\n'
+
+
+def _cumulative_buckets(metric_name, buckets, entries):
+    """ Fill in every bucket of each label set with cumulative counts
+    """
+    bucket_name = '{}_bucket'.format(metric_name)
+    counts = {}
+    others = []
+    for name, labels, value in entries:
+        if name == bucket_name:
+            base = tuple(pair for pair in labels if pair[0] != 'le')
+            le = dict(labels)['le']
+            counts.setdefault(base, {})[le] = value
+        else:
+            others.append((name, labels, value))
+
+    result = []
+    for base in sorted(counts):
+        total = 0.0
+        for le in [str(bound) for bound in buckets] + ['+Inf']:
+            total += counts[base].get(le, 0.0)
+            labels = sorted(list(base) + [('le', le)], key=lambda pair: pair[0] == 'le')
+            result.append((bucket_name, labels, total))
+        result.extend(
+            (name, labels, value) for name, labels, value in others
+            if tuple(labels) == base
+        )
+    return result
+
+
+def render_metrics():
+    samples = metrics.samples()
+    samples.update(outbox_samples())
+    return exposition(samples)
@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from teambeat.metrics import CONTENT_TYPE, QueryTimer, record_request, render_metrics
+from teambeat.profiling import profile_request, profile_trigger
+from teambeat.query_budget import QueryRecorder, get_query_budget
+from teambeat.user_cache import get_user
+
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def query_budget_logging(get_response):
+    """ Development helper that logs every request running more SQL queries
+        than its view's query_budget, along with the offending SQL
+
+        Enabled by the QUERY_BUDGET_LOGGING setting; should sit at the top of
+        MIDDLEWARE so queries from other middleware are counted as well
+    """
+    if not getattr(settings, 'QUERY_BUDGET_LOGGING', False):
+        raise MiddlewareNotUsed()
+
+    def middleware(request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = get_response(request)
+
+        budget = get_query_budget(getattr(request, 'resolver_match', None))
+        if budget is not None and len(recorder) > budget:
+            logger.warning(
+                '%s %s ran %s queries, over its budget of %s:\n%s',
+                request.method,
+                request.path,
+                len(recorder),
+                budget,
+                '\n'.join(recorder.queries)
+            )
+        return response
+
+    return middleware
+
+
+def metrics_middleware(get_response):
+    """ Records every request in teambeat.metrics and serves the metrics
+        in the Prometheus text format at METRICS_PATH
+
+        Must sit first in MIDDLEWARE, so scrapes skip the session and
+        authentication middleware and the other middleware's time and
+        queries are counted. With METRICS_TOKEN set scrapes need an
+        "Authorization: Bearer <token>" header; without one the endpoint is
+        not found when METRICS_REQUIRE_TOKEN is on, as in production.
+        Disabled when METRICS_PATH is empty.
+    """
+    metrics_path = getattr(settings, 'METRICS_PATH', None)
+    if not metrics_path:
+        raise MiddlewareNotUsed()
+
+    def middleware(request):
+        if request.path == metrics_path:
+            token = getattr(settings, 'METRICS_TOKEN', None)
+            if not token and getattr(settings, 'METRICS_REQUIRE_TOKEN', False):
+                return HttpResponse('Not Found', status=404, content_type='text/plain')
+            if token and not constant_time_compare(
+                request.META.get('HTTP_AUTHORIZATION', ''),
+                'Bearer {}'.format(token)
+            ):
+                return HttpResponse('Forbidden', status=403, content_type='text/plain')
+            return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = get_response(request)
+        record_request(request, response, time.perf_counter() - started, timer)
+        return response
+
+    return middleware
+
+
+def profiling_middleware(get_response):
+    """ Runs requests a superuser asks to profile, and one in
+        PROFILING_SAMPLE_RATE of all requests, under cProfile and saves the
+        captures to PROFILING_DIR, see teambeat.profiling
+
+        Passes requests straight on without PROFILING_DIR; must sit after
+        the authentication middleware
+    """
+    if not getattr(settings, 'PROFILING_DIR', None):
+        # not MiddlewareNotUsed: Django 3.1's ASGI handler keeps the sync
+        # adapter it made for a middleware raising it, which the next async
+        # middleware then calls from the event loop
+        return get_response
+    sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+
+    def middleware(request):
+        trigger = profile_trigger(request, sample_rate)
+        if trigger is None:
+            return get_response(request)
+        return profile_request(request, get_response, trigger)
+
+    return middleware
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """ AuthenticationMiddleware with request.user served from the per
+        process cache in teambeat.user_cache; replaces it in MIDDLEWARE
+    """
+    def process_request(self, request):
+        assert hasattr(request, 'session'), (
+            'CachedAuthenticationMiddleware requires SessionMiddleware to '
+            'be installed before it in MIDDLEWARE'
+        )
+        request.user = SimpleLazyObject(lambda: get_user(request))
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teambeat', '0006_organizationinvitation_uuid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamDailyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('red_count', models.PositiveIntegerField(default=0)),
+                ('yellow_count', models.PositiveIntegerField(default=0)),
+                ('green_count', models.PositiveIntegerField(default=0)),
+                ('missing_count', models.PositiveIntegerField(default=0)),
+                ('worst_status', models.CharField(blank=True, max_length=10, null=True)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='teambeat.team')),
+            ],
+            options={
+                'unique_together': {('team', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def dedupe_teammemberstatus(apps, schema_editor):
+    """ Keep only the most recently created status per (teammember, day)
+        so the unique constraint added in 0009 can be applied
+    """
+    TeamMemberStatus = apps.get_model('teambeat', 'TeamMemberStatus')
+    duplicates = TeamMemberStatus.objects.values(
+        'teammember_id', 'day'
+    ).annotate(
+        total=Count('id'),
+        keep_id=Max('id')
+    ).filter(total__gt=1).order_by()
+    for duplicate in list(duplicates):
+        TeamMemberStatus.objects.filter(
+            teammember_id=duplicate['teammember_id'],
+            day=duplicate['day']
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teambeat', '0007_teamdailyrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_teammemberstatus, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:38
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teambeat', '0008_dedupe_teammemberstatus'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='teammemberstatus',
+            unique_together={('teammember', 'day')},
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.3 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teambeat', '0009_teammemberstatus_unique_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,11 +1,28 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connections, models, router, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.db.models.signals import post_save
+
+from session_manager.mailer import send_email, send_emails
+from session_manager.models import SessionManager
+from session_manager.search import search_users
+from teambeat.status_defs import STATUS_SEVERITY
+from teambeat.user_cache import user_cache
+
+from datetime import date, datetime
+import uuid
 
-from session_manager.mailer import send_email
 
-from datetime import datetime
-import uuid
+def as_date(day=None):
+    """ Normalize a day argument to a date, defaulting to today
+    """
+    if not day:
+        return date.today()
+    if isinstance(day, datetime):
+        return day.date()
+    return day
 
 
 class DjangoUserMixin(object):
@@ -30,10 +47,27 @@ class DjangoUserMixin(object):
         return '{} {}'.format(self.first_name, self.last_name)
 
 
-class Organization(models.Model):
+class VersionedMixin(object):
+    """ For models with a version counter that teambeat.versioning bumps
+        with UPDATE ... SET version = version + 1; regular saves of existing
+        rows leave the column alone so a stale instance can not roll it back
+        Must come before models.Model in the bases
+    """
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'version'
+            ]
+        super(VersionedMixin, self).save(*args, **kwargs)
+
+
+class Organization(VersionedMixin, models.Model):
     name = models.CharField(max_length=250, unique=True)
     uuid = models.UUIDField(default=uuid.uuid4, editable=True)
     admins = models.ManyToManyField(User, blank=True, null=True)
+    # bumped on membership and user changes, see teambeat.versioning
+    version = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return '<Organization {}: "{}"" {}>'.format(
@@ -42,37 +76,96 @@ class Organization(models.Model):
             self.uuid
         )
 
-    def send_app_invitation_email(self, _to, _from):
-        email_type = 'App Invitation'
-        to_email = _to.email
-        from_email = _from.email
+    INVITED_TO_APP = 'Invited to TeamBeat'
+    INVITED = 'Invited to organization'
+    ALREADY_MEMBER = 'Already in organization'
+    ALREADY_INVITED = 'Already invited'
+    INVALID_EMAIL = 'Invalid email'
+
+    def _invitation_email(self, email_type, _to, _from):
+        """ (email_type, to_email, from_email, subject, body) of an invitation
+        """
         subject = '{} {} has invited you to join {} on Teambeat'.format(
             _from.first_name, _from.last_name, self.name
         )
         body = 'Click to accept invitation'
-        send_email(
-            email_type,
-            to_email,
-            from_email,
-            subject,
-            body
-        )
+        return (email_type, _to.email, _from.email, subject, body)
+
+    def send_app_invitation_email(self, _to, _from):
+        send_email(*self._invitation_email('App Invitation', _to, _from))
 
     def send_org_invitation_email(self, _to, _from):
-        email_type = 'Organization Invitation'
-        to_email = _to.email
-        from_email = _from.email
-        subject = '{} {} has invited you to join {} on Teambeat'.format(
-            _from.first_name, _from.last_name, self.name
-        )
-        body = 'Click to accept invitation'
-        send_email(
-            email_type,
-            to_email,
-            from_email,
-            subject,
-            body
-        )
+        send_email(*self._invitation_email('Organization Invitation', _to, _from))
+
+    def invite_bulk(self, emails, _from):
+        """ Invite many emails to the organization in one transaction, with
+            a fixed number of queries however many emails are given: existing
+            users are found with one IN query, missing Users and the
+            OrganizationInvitations are bulk created and the invitation
+            emails recorded with one insert
+            Returns a list of (email, result) tuples in the order given,
+            without repeated emails
+        """
+        results = {}
+        valid_emails = {}
+        for email in emails:
+            email = email.strip()
+            key = email.lower()
+            if not email or key in results:
+                continue
+            try:
+                validate_email(email)
+            except ValidationError:
+                results[key] = (email, self.INVALID_EMAIL)
+                continue
+            results[key] = None
+            valid_emails[key] = email
+
+        with transaction.atomic():
+            users = SessionManager.get_users_by_username(valid_emails.values())
+            new_emails = [
+                email for key, email in valid_emails.items() if key not in users
+            ]
+            new_users = SessionManager.create_users_bulk(new_emails)
+            users.update(new_users)
+
+            user_ids = [user.pk for user in users.values()]
+            members = set(self.organizationuser_set.filter(
+                user_id__in=user_ids,
+                active=True
+            ).values_list('user_id', flat=True))
+            invited = set(self.organizationinvitation_set.filter(
+                user_id__in=user_ids
+            ).values_list('user_id', flat=True))
+
+            invitations = []
+            invitation_emails = []
+            for key, email in valid_emails.items():
+                user = users[key]
+                if user.pk in members:
+                    results[key] = (email, self.ALREADY_MEMBER)
+                elif user.pk in invited:
+                    results[key] = (email, self.ALREADY_INVITED)
+                else:
+                    invitations.append(
+                        OrganizationInvitation(organization=self, user=user)
+                    )
+                    if key in new_users:
+                        results[key] = (email, self.INVITED_TO_APP)
+                        email_type = 'App Invitation'
+                    else:
+                        results[key] = (email, self.INVITED)
+                        email_type = 'Organization Invitation'
+                    invitation_emails.append(
+                        self._invitation_email(email_type, user, _from)
+                    )
+            OrganizationInvitation.objects.bulk_create(invitations, batch_size=500)
+            # bulk_create skips the signals that clear the alert flag's cache
+            user_cache.invalidate_users(
+                [invitation.user_id for invitation in invitations]
+            )
+            send_emails(invitation_emails)
+        return list(results.values())
 
 
 class OrganizationUser(models.Model, DjangoUserMixin):
@@ -90,24 +183,35 @@ class OrganizationUser(models.Model, DjangoUserMixin):
 
 
     @classmethod
-    def search(cls, organization, search_term):
-        filter_qs = cls.objects.filter(organization=organization)
-        if '@' in search_term:
-            filter_qs = filter_qs.filter(user__email__icontains=search_term)
-        elif ' ' in search_term:
-            search_names = search_term.split(' ')
-            first_name = search_names[0]
-            last_name = ' '.join(search_names[1:])
-            filter_qs = filter_qs.filter(
-                Q(user__first_name__icontains=first_name)|
-                Q(user__last_name__icontains=last_name)
-            )
-        else:
-            filter_qs = filter_qs.filter(
-                Q(user__first_name__icontains=search_term)|
-                Q(user__last_name__icontains=search_term)
+    def search(cls, organization, search_term, limit=None, cursor=None):
+        """ Ranked, bounded search over the organization's active users
+            Returns a session_manager.search.SearchPage of OrganizationUsers
+        """
+        page = search_users(
+            search_term,
+            queryset=User.objects.filter(
+                organizationuser__organization=organization,
+                organizationuser__active=True
+            ),
+            limit=limit,
+            cursor=cursor
+        )
+        org_users = {
+            org_user.user_id: org_user
+            for org_user in cls.objects.filter(
+                organization=organization,
+                active=True,
+                user__in=page.results
             )
-        return filter_qs.all()
+        }
+        results = []
+        for user in page.results:
+            org_user = org_users[user.pk]
+            org_user.user = user
+            org_user.search_score = user.search_score
+            results.append(org_user)
+        page.results = results
+        return page
 
 
 class OrganizationInvitation(models.Model, DjangoUserMixin):
@@ -120,7 +224,7 @@ class OrganizationInvitation(models.Model, DjangoUserMixin):
             self.organization.name, self.display_name)
 
 
-class Team(models.Model):
+class Team(VersionedMixin, models.Model):
     name = models.CharField(max_length=250)
     organization = models.ForeignKey(
         Organization,
@@ -135,6 +239,8 @@ class Team(models.Model):
         null=True,
         on_delete=models.SET_NULL
     )
+    # bumped on status and membership changes, see teambeat.versioning
+    version = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ['name', 'organization']
@@ -146,31 +252,61 @@ class Team(models.Model):
             self.organization
         )
 
+    @classmethod
+    def dashboard_teams(cls, org_user):
+        """ Teams the organization user is an active member, admin or lead of
+        """
+        return cls.objects.filter(
+            Q(teammember__organization_user=org_user, teammember__active=True) |
+            Q(teamadmin__organization_user=org_user) |
+            Q(team_lead=org_user),
+            organization_id=org_user.organization_id
+        ).distinct()
+
     def teamstatus_set(self, day=None):
-        if not day:
-            day = datetime.today()
-        return TeamMemberStatus.objects.filter(teammember__team=self)
+        return TeamMemberStatus.objects.filter(
+            teammember__team=self,
+            day=as_date(day)
+        )
 
     def teamstatus(self, day=None):
-        if not day:
-            day = datetime.today()
-        has_red = False
-        has_yellow = False
-        has_green = False
-        for status in self.teamstatus_set(day):
-            if status.status == 'red':
-                has_red = True
-            elif status.status == 'yellow':
-                has_yellow = True
-            elif status.status == 'green':
-                has_green = True
-        if has_red:
-            return 'red'
-        if has_yellow:
-            return 'yellow'
-        if has_green:
-            return 'green'
-        return None
+        """ Worst status reported on the team for the given day, read from
+            the daily rollup
+        """
+        return self.teamdailyrollup_set.filter(
+            day=as_date(day)
+        ).values_list('worst_status', flat=True).first()
+
+    def status_history(self, start, end, before=None, limit=50):
+        """ Statuses between start and end (inclusive), newest first, with
+            their team member and user joined in the same query
+
+            Pages with keyset pagination on (day, id): pass the (day, id) of
+            the last status of the previous page as before
+        """
+        statuses = TeamMemberStatus.objects.filter(
+            teammember__team=self,
+            day__gte=start,
+            day__lte=end
+        ).select_related(
+            'teammember__organization_user__user'
+        ).order_by('-day', '-id')
+        if before:
+            before_day, before_id = before
+            statuses = statuses.filter(
+                Q(day__lt=before_day) | Q(day=before_day, id__lt=before_id)
+            )
+        return statuses[:limit]
+
+    def members_missing_status(self, day=None):
+        """ Active team members who have not set a status for the day
+        """
+        return self.teammember_set.filter(active=True).filter(
+            ~Exists(TeamMemberStatus.objects.filter(
+                teammember=OuterRef('pk'),
+                day=as_date(day)
+            ))
+        ).select_related('organization_user__user')
 
 
 class TeamMember(models.Model):
@@ -252,9 +388,200 @@ class TeamMemberStatus(models.Model):
     additional_info_for_team = models.TextField(blank=True, null=True)
     additional_info_for_lead = models.TextField(blank=True, null=True)
 
+    class Meta:
+        unique_together = ['teammember', 'day']
+
     def __str__(self):
         return '<TeamMemberStatus {} {} {}>'.format(
             self.teammember.team.name,
             self.teammember.user.username,
             self.day
         )
+
+    @classmethod
+    def set_for_day(cls, teammember, status, additional_info_for_team=None,
+                    additional_info_for_lead=None, day=None):
+        """ Create or update a team member's status for a day with a single
+            INSERT ... ON CONFLICT statement on the (teammember, day) key
+            Returns a tuple:
+                (object: the TeamMemberStatus, bool: True if it was created)
+        """
+        day = as_date(day)
+        db = router.db_for_write(cls)
+        connection = connections[db]
+        fields = cls._meta.concrete_fields
+        sql = (
+            'INSERT INTO {table} '
+            '(teammember_id, day, status, additional_info_for_team, additional_info_for_lead) '
+            'VALUES (%s, %s, %s, %s, %s) '
+            'ON CONFLICT (teammember_id, day) DO UPDATE SET '
+            'status = EXCLUDED.status, '
+            'additional_info_for_team = EXCLUDED.additional_info_for_team, '
+            'additional_info_for_lead = EXCLUDED.additional_info_for_lead'
+        ).format(table=connection.ops.quote_name(cls._meta.db_table))
+        params = [
+            teammember.pk,
+            day,
+            status,
+            additional_info_for_team,
+            additional_info_for_lead,
+        ]
+
+        with transaction.atomic(using=db), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # xmax is only 0 on rows that were inserted rather than updated
+                cursor.execute(
+                    '{} RETURNING {}, (xmax = 0)'.format(
+                        sql,
+                        ', '.join(
+                            connection.ops.quote_name(field.column)
+                            for field in fields
+                        )
+                    ),
+                    params
+                )
+                row = cursor.fetchone()
+                todays_status = cls.from_db(
+                    db, [field.attname for field in fields], row[:-1]
+                )
+                created = row[-1]
+            else:
+                created = not cls.objects.using(db).filter(
+                    teammember=teammember, day=day).exists()
+                cursor.execute(sql, params)
+                todays_status = cls.objects.using(db).get(
+                    teammember=teammember, day=day)
+            todays_status.teammember = teammember
+            # the raw statement bypasses Model.save, so keep signal receivers
+            # such as the team rollups informed
+            post_save.send(
+                sender=cls,
+                instance=todays_status,
+                created=created,
+                update_fields=None,
+                raw=False,
+                using=db
+            )
+        return (todays_status, created)
+
+
+class TeamDailyRollup(models.Model):
+    """ Per team, per day status counts, kept up to date by the
+        TeamMemberStatus signal handlers in teambeat.signals
+    """
+    team = models.ForeignKey(Team, on_delete=models.CASCADE)
+    day = models.DateField()
+    red_count = models.PositiveIntegerField(default=0)
+    yellow_count = models.PositiveIntegerField(default=0)
+    green_count = models.PositiveIntegerField(default=0)
+    missing_count = models.PositiveIntegerField(default=0)
+    worst_status = models.CharField(max_length=10, blank=True, null=True)
+
+    class Meta:
+        unique_together = ['team', 'day']
+
+    def __str__(self):
+        return '<TeamDailyRollup {} {}: {}>'.format(
+            self.team_id,
+            self.day,
+            self.worst_status
+        )
+
+    @classmethod
+    def _values(cls, status_counts, active_count, reporting_count):
+        """ Build the stored counts from a {status: count} dict
+        """
+        values = {
+            '{}_count'.format(status): status_counts.get(status, 0)
+            for status in STATUS_SEVERITY
+        }
+        values['missing_count'] = max(active_count - reporting_count, 0)
+        values['worst_status'] = next(
+            (status for status in STATUS_SEVERITY if status_counts.get(status)),
+            None
+        )
+        return values
+
+    @classmethod
+    def refresh(cls, team_id, day, create=True):
+        """ Recompute the rollup row for a single team and day
+            If create is False only an existing row is updated
+        """
+        day = as_date(day)
+        with transaction.atomic():
+            # count once the row is locked, so concurrent refreshes of the
+            # same team and day each see the statuses the other committed
+            rollups = cls.objects.select_for_update()
+            if create:
+                rollup, created = rollups.get_or_create(team_id=team_id, day=day)
+            else:
+                rollup = rollups.filter(team_id=team_id, day=day).first()
+                if rollup is None:
+                    return None
+
+            statuses = TeamMemberStatus.objects.filter(
+                teammember__team_id=team_id,
+                day=day
+            )
+            status_counts = dict(
+                statuses.order_by().values_list('status').annotate(total=Count('pk'))
+            )
+            active_members = TeamMember.objects.filter(team_id=team_id, active=True)
+            values = cls._values(
+                status_counts,
+                active_members.count(),
+                active_members.filter(teammemberstatus__day=day).distinct().count()
+            )
+            for field, value in values.items():
+                setattr(rollup, field, value)
+            rollup.save(update_fields=list(values))
+        return rollup if create else None
+
+    @classmethod
+    def rebuild(cls, start, end, teams=None):
+        """ Drop and recreate every rollup row between start and end
+            (inclusive), optionally limited to a queryset of teams
+            Returns the number of rows created
+        """
+        rollups = cls.objects.filter(day__gte=start, day__lte=end)
+        statuses = TeamMemberStatus.objects.filter(day__gte=start, day__lte=end)
+        active_members = TeamMember.objects.filter(active=True)
+        if teams is not None:
+            rollups = rollups.filter(team__in=teams)
+            statuses = statuses.filter(teammember__team__in=teams)
+            active_members = active_members.filter(team__in=teams)
+
+        status_counts = {}
+        for team_id, day, status, total in statuses.order_by().values_list(
+                'teammember__team_id', 'day', 'status').annotate(total=Count('pk')):
+            status_counts.setdefault((team_id, day), {})[status] = total
+        reporting_counts = {
+            (team_id, day): total
+            for team_id, day, total in statuses.filter(
+                teammember__active=True
+            ).order_by().values_list('teammember__team_id', 'day').annotate(
+                total=Count('teammember', distinct=True)
+            )
+        }
+        active_counts = dict(
+            active_members.order_by().values_list('team_id').annotate(
+                total=Count('pk')
+            )
+        )
+
+        new_rollups = [
+            cls(
+                team_id=team_id,
+                day=day,
+                **cls._values(
+                    counts,
+                    active_counts.get(team_id, 0),
+                    reporting_counts.get((team_id, day), 0)
+                )
+            )
+            for (team_id, day), counts in status_counts.items()
+        ]
+        with transaction.atomic():
+            rollups.delete()
+            cls.objects.bulk_create(new_rollups, batch_size=1000)
+        return len(new_rollups)
@@ -0,0 +1,188 @@
+""" On demand cProfile captures of single requests
+
+    profiling_middleware (see teambeat.middleware) runs a request under
+    cProfile when a superuser sends the X-Profile header or a profile query
+    parameter, or for one in PROFILING_SAMPLE_RATE requests. Each capture
+    is saved to PROFILING_DIR as a .prof file for pstats or snakeviz and a
+    .txt summary of the PROFILING_TOP_N functions with the most cumulative
+    time; only the newest PROFILING_MAX_PROFILES captures are kept.
+    Superusers list and download them at the request_profiles view.
+    Summaries record the path without the query string, which carries the
+    login and password reset tokens.
+
+    The profiler stops when the view returns, so the body of a streaming
+    response, generated as it is sent, is not in its capture; the summary
+    says so.
+
+    Without PROFILING_DIR the middleware hands requests straight on. One
+    request per process is profiled at a time, others run as usual
+    meanwhile.
+"""
+from django.conf import settings
+
+from datetime import datetime
+import cProfile
+import io
+import itertools
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = 'profile'
+PROFILE_FORMATS = ('prof', 'txt')
+DEFAULT_MAX_PROFILES = 50
+DEFAULT_TOP_N = 40
+
+NAME_PATTERN = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9]+-[0-9]+-[\w.-]+$')
+UNSAFE_CHARACTERS = re.compile(r'[^\w.-]+')
+
+_profiler_lock = threading.Lock()
+_sequence = itertools.count()
+
+
+def profile_trigger(request, sample_rate):
+    """ Why the request should be profiled, 'superuser' or 'sample', or None
+    """
+    if PROFILE_HEADER in request.META or PROFILE_PARAM in request.GET:
+        # only look the user up when asked to profile
+        if request.user.is_superuser:
+            return 'superuser'
+    if sample_rate and random.randrange(sample_rate) == 0:
+        return 'sample'
+    return None
+
+
+def profile_request(request, get_response, trigger):
+    """ Call get_response under cProfile and save the capture, adding its
+        name to the response's X-Profile header
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        return get_response(request)
+    try:
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - started
+    finally:
+        _profiler_lock.release()
+
+    response['X-Profile'] = profile_store.save(
+        profiler,
+        request,
+        response,
+        duration,
+        trigger
+    )
+    return response
+
+
+class ProfileStore(object):
+    """ The captures in PROFILING_DIR
+    """
+    @property
+    def directory(self):
+        return getattr(settings, 'PROFILING_DIR', None)
+
+    @property
+    def max_profiles(self):
+        return getattr(settings, 'PROFILING_MAX_PROFILES', DEFAULT_MAX_PROFILES)
+
+    @property
+    def top_n(self):
+        return getattr(settings, 'PROFILING_TOP_N', DEFAULT_TOP_N)
+
+    def save(self, profiler, request, response, duration, trigger):
+        """ Write the .prof and .txt files of a capture, returning its name
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = resolver_match.view_name if resolver_match else 'unresolved'
+        name = '{}-{}-{}-{}'.format(
+            datetime.utcnow().strftime('%Y%m%dT%H%M%S'),
+            os.getpid(),
+            next(_sequence),
+            UNSAFE_CHARACTERS.sub('_', view)
+        )
+        profiler.dump_stats(self.path(name, 'prof'))
+
+        summary = io.StringIO()
+        user = getattr(request, 'user', None)
+        summary.write('{} {} ({}) {} in {:.1f} ms, {} by {}{}\n\n'.format(
+            request.method,
+            request.path,
+            view,
+            response.status_code,
+            duration * 1000,
+            trigger,
+            user.get_username() if user is not None and user.is_authenticated else 'anonymous',
+            ', streamed body not profiled' if response.streaming else ''
+        ))
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(self.top_n)
+        with open(self.path(name, 'txt'), 'w') as summary_file:
+            summary_file.write(summary.getvalue())
+
+        self.prune()
+        return name
+
+    def names(self):
+        """ Names of the saved captures, newest first
+        """
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            (
+                file_name[:-len('.prof')]
+                for file_name in os.listdir(self.directory)
+                if file_name.endswith('.prof') and NAME_PATTERN.match(file_name[:-len('.prof')])
+            ),
+            reverse=True
+        )
+
+    def prune(self):
+        for name in self.names()[self.max_profiles:]:
+            for file_format in PROFILE_FORMATS:
+                try:
+                    os.remove(self.path(name, file_format))
+                except FileNotFoundError:
+                    pass
+
+    def path(self, name, file_format):
+        """ Path of a capture's file, None for names that are not captures
+            so request input never reaches outside the directory
+        """
+        if not self.directory or file_format not in PROFILE_FORMATS or not NAME_PATTERN.match(name):
+            return None
+        return os.path.join(self.directory, '{}.{}'.format(name, file_format))
+
+    def list(self):
+        """ dicts of name, saved time, size and summary line of each capture
+        """
+        profiles = []
+        for name in self.names():
+            try:
+                with open(self.path(name, 'txt')) as summary_file:
+                    summary = summary_file.readline().strip()
+                stat = os.stat(self.path(name, 'prof'))
+            except OSError:
+                # pruned by another process meanwhile
+                continue
+            profiles.append({
+                'name': name,
+                'saved_at': datetime.fromtimestamp(stat.st_mtime),
+                'size': stat.st_size,
+                'summary': summary,
+            })
+        return profiles
+
+
+profile_store = ProfileStore()
@@ -0,0 +1,41 @@
+""" Helpers for declaring and checking how many SQL queries a view may run
+    for a single request
+
+    Views declare a budget with the query_budget class attribute (see
+    AuthenticatedView) or the query_budget decorator. The budget covers the
+    whole request, including the session and authentication middleware.
+"""
+
+
+def query_budget(max_queries):
+    """ Class decorator setting the query budget of a class based view
+    """
+    def decorator(view_class):
+        view_class.query_budget = max_queries
+        return view_class
+    return decorator
+
+
+def get_query_budget(resolver_match):
+    """ Return the query budget of the view a request resolved to, or None
+        if the request did not resolve or the view declares no budget
+    """
+    if resolver_match is None:
+        return None
+    view_class = getattr(resolver_match.func, 'view_class', None)
+    return getattr(view_class, 'query_budget', None)
+
+
+class QueryRecorder(object):
+    """ connection.execute_wrapper callable that records every SQL statement
+        executed while it is installed
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
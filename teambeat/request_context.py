@@ -0,0 +1,156 @@
+""" Resolves the organization, membership, team and roles a TeamBeatView
+    request acts on
+
+    Everything is loaded with a single OrganizationUser query (the team and
+    team admin role come in as subqueries) and cached per (session, user,
+    organization, team). Cache keys include a per organization version
+    that the signal handlers in teambeat.signals replace whenever an
+    Organization, OrganizationUser, Team or TeamAdmin changes, so role
+    changes apply on the next request. With a per process cache such as the
+    default LocMemCache other processes only see changes once
+    REQUEST_CONTEXT_CACHE_TIMEOUT has passed; use a shared cache backend
+    when that matters.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Subquery
+
+from teambeat.metrics import record_cache_lookup
+from teambeat.models import Organization, OrganizationUser, Team, TeamAdmin
+
+import hashlib
+import uuid
+
+
+CACHE_PREFIX = 'teambeat:request-context'
+DEFAULT_CACHE_TIMEOUT = 60
+
+
+class ResolvedContext(object):
+    """ What a request resolved to: organization, org_user and team (None
+        when the URL has no team) plus the user's roles in them
+    """
+    def __init__(self, organization, org_user, team=None, is_team_admin=False):
+        self.organization = organization
+        self.org_user = org_user
+        self.team = team
+        self.is_organization_admin = org_user.is_organization_admin
+        self.is_team_admin = is_team_admin
+        self.is_team_lead = team is not None and team.team_lead_id == org_user.pk
+
+
+def _version_key(organization_uuid):
+    return '{}:version:{}'.format(CACHE_PREFIX, organization_uuid)
+
+
+def organization_version(organization_uuid):
+    """ Current cache version for an organization; a missing (or evicted)
+        version gets a fresh random value, so old entries are never revived
+    """
+    return cache.get_or_set(
+        _version_key(organization_uuid),
+        uuid.uuid4().hex,
+        None
+    )
+
+
+def invalidate_organization(organization_uuid):
+    cache.set(_version_key(organization_uuid), uuid.uuid4().hex, None)
+
+
+def invalidate_organization_id(organization_id):
+    """ Invalidate by primary key, for signal handlers that only have a
+        foreign key value at hand
+    """
+    organization_uuid = Organization.objects.filter(
+        pk=organization_id
+    ).values_list('uuid', flat=True).first()
+    if organization_uuid:
+        invalidate_organization(organization_uuid)
+
+
+def load_request_context(user, organization_uuid, team_uuid=None):
+    """ Run the resolving query, bypassing the cache
+        Returns None if the user has no active membership in the
+        organization and raises Team.DoesNotExist for an unknown team
+    """
+    org_users = OrganizationUser.objects.filter(
+        user=user,
+        organization__uuid=organization_uuid,
+        active=True
+    ).select_related('organization').order_by('pk')
+    if team_uuid:
+        teams = Team.objects.filter(
+            organization=OuterRef('organization'),
+            uuid=team_uuid
+        )
+        org_users = org_users.annotate(
+            team_pk=Subquery(teams.values('pk')[:1]),
+            team_name=Subquery(teams.values('name')[:1]),
+            team_lead_pk=Subquery(teams.values('team_lead_id')[:1]),
+            is_team_admin=Exists(TeamAdmin.objects.filter(
+                organization_user=OuterRef('pk'),
+                team__organization=OuterRef('organization'),
+                team__uuid=team_uuid
+            ))
+        )
+    org_user = org_users.first()
+    if org_user is None:
+        return None
+    if not team_uuid:
+        return ResolvedContext(org_user.organization, org_user)
+
+    if org_user.team_pk is None:
+        raise Team.DoesNotExist('Team matching uuid not found in organization.')
+    team = Team.from_db(
+        org_users.db,
+        ['id', 'name', 'organization_id', 'uuid', 'team_lead_id'],
+        [
+            org_user.team_pk,
+            org_user.team_name,
+            org_user.organization_id,
+            uuid.UUID(str(team_uuid)),
+            org_user.team_lead_pk,
+        ]
+    )
+    team.organization = org_user.organization
+    return ResolvedContext(
+        org_user.organization,
+        org_user,
+        team=team,
+        is_team_admin=org_user.is_team_admin
+    )
+
+
+def resolve_request_context(request, organization_uuid, team_uuid=None):
+    """ Cached load_request_context for the request's session and user
+    """
+    session_key = request.session.session_key
+    if not session_key:
+        return load_request_context(request.user, organization_uuid, team_uuid)
+
+    # signed cookie session keys are the whole session, too long for some
+    # cache backends' keys
+    cache_key = '{}:{}:{}:{}:{}:{}'.format(
+        CACHE_PREFIX,
+        hashlib.md5(session_key.encode('utf-8')).hexdigest(),
+        request.user.pk,
+        organization_uuid,
+        team_uuid,
+        organization_version(organization_uuid)
+    )
+    resolved = cache.get(cache_key)
+    record_cache_lookup('request_context', resolved is not None)
+    if resolved is None:
+        resolved = load_request_context(request.user, organization_uuid, team_uuid)
+        if resolved is not None:
+            cache.set(
+                cache_key,
+                resolved,
+                getattr(
+                    settings,
+                    'REQUEST_CONTEXT_CACHE_TIMEOUT',
+                    DEFAULT_CACHE_TIMEOUT
+                )
+            )
+    return resolved
@@ -0,0 +1,161 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from teambeat.autocomplete import autocomplete_cache
+from teambeat.events import publish_team_status
+from teambeat.request_context import (
+    invalidate_organization,
+    invalidate_organization_id,
+)
+from teambeat.user_cache import user_cache
+from teambeat.versioning import (
+    bump_organization_versions,
+    bump_team_versions,
+    bump_teammember_team_version,
+    bump_user_organization_versions,
+)
+from teambeat.models import (
+    Organization,
+    OrganizationInvitation,
+    OrganizationUser,
+    Team,
+    TeamAdmin,
+    TeamDailyRollup,
+    TeamMember,
+    TeamMemberStatus,
+    as_date,
+)
+
+
+@receiver(post_save, sender=TeamMemberStatus)
+def refresh_rollup_on_status_save(sender, instance, **kwargs):
+    """ Keep the team's rollup for the status day in step with the new status
+        and push the team's new status to dashboard streams once committed
+    """
+    rollup = TeamDailyRollup.refresh(instance.teammember.team_id, instance.day)
+    transaction.on_commit(lambda: publish_team_status(
+        rollup.team_id,
+        rollup.day,
+        rollup.worst_status
+    ))
+
+
+@receiver(post_delete, sender=TeamMemberStatus)
+def refresh_rollup_on_status_delete(sender, instance, **kwargs):
+    """ Deleting a status can only lower the counts, so only existing rollups
+        are touched; this also keeps cascading team deletes from recreating
+        rows for a team that is about to go away
+    """
+    team_id = TeamMember.objects.filter(
+        pk=instance.teammember_id
+    ).values_list('team_id', flat=True).first()
+    if team_id:
+        TeamDailyRollup.refresh(team_id, instance.day, create=False)
+
+
+@receiver(post_save, sender=TeamMember)
+def refresh_rollup_on_membership_change(sender, instance, **kwargs):
+    """ Joining or leaving a team changes today's missing count
+    """
+    TeamDailyRollup.refresh(instance.team_id, as_date(), create=False)
+
+
+@receiver(post_save, sender=OrganizationUser)
+@receiver(post_delete, sender=OrganizationUser)
+def invalidate_autocomplete_on_membership_change(sender, instance, **kwargs):
+    autocomplete_cache.invalidate(instance.organization_id)
+
+
+AUTOCOMPLETE_USER_FIELDS = {'first_name', 'last_name', 'email'}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_autocomplete_on_user_change(sender, instance, update_fields=None, **kwargs):
+    """ Logins save only last_login, which the index does not hold
+    """
+    if update_fields and not AUTOCOMPLETE_USER_FIELDS.intersection(update_fields):
+        return
+    autocomplete_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache_on_user_change(sender, instance, **kwargs):
+    """ Any field may be shown or checked, the password hash included
+    """
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=OrganizationInvitation)
+@receiver(post_delete, sender=OrganizationInvitation)
+def invalidate_user_cache_on_invitation_change(sender, instance, **kwargs):
+    user_cache.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Organization)
+@receiver(post_delete, sender=Organization)
+def invalidate_request_context_on_organization_change(sender, instance, **kwargs):
+    invalidate_organization(instance.uuid)
+
+
+@receiver(post_save, sender=OrganizationUser)
+@receiver(post_delete, sender=OrganizationUser)
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def invalidate_request_context_on_membership_change(sender, instance, **kwargs):
+    if instance.organization_id:
+        invalidate_organization_id(instance.organization_id)
+
+
+@receiver(post_save, sender=TeamAdmin)
+@receiver(post_delete, sender=TeamAdmin)
+def invalidate_request_context_on_team_admin_change(sender, instance, **kwargs):
+    organization_uuid = Organization.objects.filter(
+        team__pk=instance.team_id
+    ).values_list('uuid', flat=True).first()
+    if organization_uuid:
+        invalidate_organization(organization_uuid)
+
+
+@receiver(post_save, sender=TeamMemberStatus)
+def bump_version_on_status_save(sender, instance, **kwargs):
+    bump_team_versions([instance.teammember.team_id])
+
+
+@receiver(post_delete, sender=TeamMemberStatus)
+def bump_version_on_status_delete(sender, instance, **kwargs):
+    bump_teammember_team_version(instance.teammember_id)
+
+
+@receiver(post_save, sender=TeamMember)
+@receiver(post_delete, sender=TeamMember)
+@receiver(post_save, sender=TeamAdmin)
+@receiver(post_delete, sender=TeamAdmin)
+def bump_version_on_team_membership_change(sender, instance, **kwargs):
+    bump_team_versions([instance.team_id])
+
+
+@receiver(post_save, sender=Team)
+def bump_version_on_team_change(sender, instance, created=False, **kwargs):
+    if not created:
+        bump_team_versions([instance.pk])
+
+
+@receiver(post_save, sender=OrganizationUser)
+@receiver(post_delete, sender=OrganizationUser)
+def bump_version_on_organization_membership_change(sender, instance, **kwargs):
+    bump_organization_versions([instance.organization_id])
+
+
+@receiver(post_save, sender=User)
+def bump_version_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    """ Search results and team pages show user names and emails
+    """
+    if created:
+        return
+    if update_fields and not AUTOCOMPLETE_USER_FIELDS.intersection(update_fields):
+        return
+    bump_user_organization_versions(instance.pk)
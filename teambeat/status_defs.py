@@ -12,3 +12,6 @@ STATUSES = {
         'class': 'status_select-red',
     }
 }
+
+# ordered from most to least severe, used to pick a team's overall status
+STATUS_SEVERITY = ('red', 'yellow', 'green')
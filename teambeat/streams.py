@@ -0,0 +1,171 @@
+""" Server-Sent Events stream of team status changes for the dashboard
+
+    Served straight from the ASGI application in project.asgi (Django 3.1
+    views cannot stream asynchronously), so an open stream holds no worker
+    thread or database connection. The user and organization come from the
+    Django session; the stream subscribes to every team on the user's
+    dashboard and forwards today's team-status events published by
+    teambeat.events. Streams end after DASHBOARD_STREAM_MAX_AGE seconds and
+    the browser reconnects, picking up team membership changes.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.db import close_old_connections
+
+from http.cookies import SimpleCookie
+from importlib import import_module
+import asyncio
+import json
+import time
+
+from teambeat.events import get_broker, team_topic
+from teambeat.models import OrganizationUser, Team, as_date
+
+
+DEFAULT_PATH = '/api/dashboard/stream/'
+DEFAULT_KEEPALIVE = 15
+DEFAULT_MAX_AGE = 300
+
+
+def _session_key(scope):
+    cookies = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookies.load(value.decode('latin-1'))
+    morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+    return morsel.value if morsel else None
+
+
+def dashboard_team_ids(session_key):
+    """ Ids of the teams on the dashboard of the session's organization user
+        Returns None for sessions without a logged in user and organization
+    """
+    if not session_key:
+        return None
+    close_old_connections()
+    try:
+        session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        user_id = session.get(SESSION_KEY)
+        organization_uuid = session.get('organization')
+        if not user_id or not organization_uuid:
+            return None
+        org_user = OrganizationUser.objects.filter(
+            user_id=user_id,
+            organization__uuid=organization_uuid,
+            active=True
+        ).first()
+        if org_user is None:
+            return None
+        return list(
+            Team.dashboard_teams(org_user).values_list('pk', flat=True)
+        )
+    finally:
+        close_old_connections()
+
+
+def format_event(message):
+    return 'event: {}\ndata: {}\n\n'.format(
+        message['type'],
+        json.dumps(message)
+    ).encode()
+
+
+class DashboardStream(object):
+    """ ASGI application serving the event stream
+    """
+    async def _respond(self, send, status, body=b''):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _wait_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    async def __call__(self, scope, receive, send):
+        team_ids = await sync_to_async(dashboard_team_ids)(_session_key(scope))
+        if team_ids is None:
+            await self._respond(send, 403, b'Authentication required')
+            return
+
+        keepalive = getattr(settings, 'DASHBOARD_STREAM_KEEPALIVE', DEFAULT_KEEPALIVE)
+        ends_at = time.monotonic() + getattr(
+            settings,
+            'DASHBOARD_STREAM_MAX_AGE',
+            DEFAULT_MAX_AGE
+        )
+        subscription = get_broker().subscribe(
+            [team_topic(team_id) for team_id in team_ids]
+        )
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': 'retry: {}\n\n'.format(keepalive * 1000).encode(),
+                'more_body': True,
+            })
+            while not disconnected.done():
+                timeout = min(keepalive, ends_at - time.monotonic())
+                if timeout <= 0:
+                    break
+                getter = asyncio.ensure_future(subscription.get())
+                await asyncio.wait(
+                    [getter, disconnected],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected.done():
+                    getter.cancel()
+                    break
+                if getter.done():
+                    message = getter.result()
+                else:
+                    getter.cancel()
+                    message = None
+                if message is None:
+                    body = b': keepalive\n\n'
+                elif message['type'] == 'team-status' and message['day'] != as_date().isoformat():
+                    continue
+                else:
+                    body = format_event(message)
+                await send({
+                    'type': 'http.response.body',
+                    'body': body,
+                    'more_body': True,
+                })
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            subscription.close()
+            disconnected.cancel()
+
+
+def route_streams(application):
+    """ Wrap the Django ASGI application, serving the dashboard stream at
+        DASHBOARD_STREAM_PATH and everything else through Django
+    """
+    stream = DashboardStream()
+    stream_path = getattr(settings, 'DASHBOARD_STREAM_PATH', DEFAULT_PATH)
+
+    async def router(scope, receive, send):
+        if stream_path and scope['type'] == 'http' and scope['path'] == stream_path:
+            await stream(scope, receive, send)
+        else:
+            await application(scope, receive, send)
+
+    return router
@@ -0,0 +1,119 @@
+""" Synthetic data for load and query budget testing
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from session_manager.search import user_index
+
+from teambeat.models import (
+    Organization,
+    OrganizationUser,
+    Team,
+    TeamAdmin,
+    TeamDailyRollup,
+    TeamMember,
+    TeamMemberStatus,
+    as_date,
+)
+from teambeat.status_defs import STATUS_SEVERITY
+
+from datetime import timedelta
+import random
+
+
+FIRST_NAMES = [
+    'Ada', 'Alan', 'Barbara', 'Claude', 'Donald', 'Edsger', 'Frances',
+    'Grace', 'Hedy', 'John', 'Katherine', 'Linus', 'Margaret', 'Niklaus',
+]
+LAST_NAMES = [
+    'Allen', 'Backus', 'Dijkstra', 'Hamilton', 'Hopper', 'Johnson', 'Knuth',
+    'Lamarr', 'Liskov', 'Lovelace', 'Shannon', 'Turing', 'Wirth',
+]
+
+
+@transaction.atomic
+def seed_organization(name, users=20, teams=4, members_per_team=5, days=3,
+                      status_rate=0.8, batch_size=1000, seed=None):
+    """ Create an organization with users, teams and days of status history
+        using bulk inserts
+
+        The first user created is an organization admin and the admin, lead
+        and a member of every team. Returns the Organization.
+    """
+    rng = random.Random(seed)
+    slug = name.lower().replace(' ', '-')
+
+    User.objects.bulk_create([
+        User(
+            username='{}-{}@example.com'.format(slug, i),
+            email='{}-{}@example.com'.format(slug, i),
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            password='!'
+        )
+        for i in range(users)
+    ], batch_size=batch_size)
+    django_users = list(
+        User.objects.filter(username__startswith='{}-'.format(slug)).order_by('pk')
+    )
+    # bulk_create skips the signals that keep the search index current
+    user_index.clear()
+
+    organization = Organization.objects.create(name=name)
+    organization.admins.add(django_users[0])
+    OrganizationUser.objects.bulk_create([
+        OrganizationUser(
+            organization=organization,
+            user=user,
+            is_organization_admin=(i == 0)
+        )
+        for i, user in enumerate(django_users)
+    ], batch_size=batch_size)
+    org_users = list(organization.organizationuser_set.order_by('pk'))
+    owner = org_users[0]
+
+    Team.objects.bulk_create([
+        Team(
+            name='{} Team {}'.format(name, i),
+            organization=organization,
+            team_lead=owner
+        )
+        for i in range(teams)
+    ], batch_size=batch_size)
+    org_teams = list(organization.team_set.order_by('pk'))
+
+    teammembers = []
+    for team in org_teams:
+        sample_size = max(min(members_per_team, len(org_users)) - 1, 0)
+        members = [owner] + rng.sample(org_users[1:], sample_size)
+        teammembers.extend(
+            TeamMember(organization_user=org_user, team=team)
+            for org_user in members
+        )
+    TeamMember.objects.bulk_create(teammembers, batch_size=batch_size)
+    TeamAdmin.objects.bulk_create([
+        TeamAdmin(organization_user=owner, team=team) for team in org_teams
+    ], batch_size=batch_size)
+
+    end = as_date()
+    start = end - timedelta(max(days - 1, 0))
+    statuses = []
+    teammember_ids = TeamMember.objects.filter(
+        team__organization=organization
+    ).values_list('pk', flat=True)
+    for teammember_id in teammember_ids.iterator():
+        for offset in range(days):
+            if rng.random() < status_rate:
+                statuses.append(TeamMemberStatus(
+                    teammember_id=teammember_id,
+                    day=start + timedelta(offset),
+                    status=rng.choice(STATUS_SEVERITY)
+                ))
+        if len(statuses) >= batch_size:
+            TeamMemberStatus.objects.bulk_create(statuses, batch_size=batch_size)
+            statuses = []
+    TeamMemberStatus.objects.bulk_create(statuses, batch_size=batch_size)
+
+    # bulk_create skips the signals that keep rollups current
+    TeamDailyRollup.rebuild(start, end, teams=organization.team_set.all())
+    return organization
@@ -0,0 +1,48 @@
+from django import template
+
+from teambeat.fragments import CSRF_PLACEHOLDER, fragment_cache
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, stamps):
+        self.nodelist = nodelist
+        self.name = name
+        self.stamps = stamps
+
+    def render(self, context):
+        csrf_token = context.get('csrf_token')
+        if csrf_token == 'NOTPROVIDED':
+            csrf_token = None
+
+        def render():
+            with context.push(csrf_token=CSRF_PLACEHOLDER):
+                return self.nodelist.render(context)
+
+        return fragment_cache.get_or_render(
+            self.name.resolve(context),
+            [stamp.resolve(context) for stamp in self.stamps],
+            render,
+            csrf_token=csrf_token
+        )
+
+
+@register.tag('fragment')
+def do_fragment(parser, token):
+    """ Cache the enclosed template output, see teambeat.fragments
+
+        {% fragment name stamp [stamp ...] %}...{% endfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            "'{}' tag requires a name and at least one stamp".format(bits[0])
+        )
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]]
+    )
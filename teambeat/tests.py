@@ -1,3 +1,2067 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signals
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.servers.basehttp import WSGIServer
+from django.db import close_old_connections, connection, connections, transaction
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.test import LiveServerTestCase, RequestFactory, TestCase, TransactionTestCase
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
 
-# Create your tests here.
+from project import asgi
+from session_manager.models import EmailLog, SessionManager
+from session_manager.tokens import SignedToken
+from teambeat.autocomplete import OrganizationAutocompleteIndex, autocomplete_cache
+from teambeat.benchmark import compare_reports
+from teambeat.events import PostgresBroker, get_broker, publish_team_status, team_topic
+from teambeat.export import export_queryset, stream_export
+from teambeat.forms import BulkInviteForm
+from teambeat.fragments import CSRF_PLACEHOLDER, fragment_cache, render_fragment
+from teambeat.importer import import_statuses
+from teambeat.loadtest import histogram_labels, parse_mix
+from teambeat.metrics import MmapValues, metrics, sample_key
+from teambeat.models import (
+    Organization,
+    OrganizationInvitation,
+    OrganizationUser,
+    Team,
+    TeamAdmin,
+    TeamDailyRollup,
+    TeamMember,
+    TeamMemberStatus,
+    as_date,
+)
+from teambeat.profiling import profile_request, profile_store
+from teambeat.request_context import load_request_context
+from teambeat.streams import DashboardStream
+from teambeat.synthetic import seed_organization
+from teambeat.user_cache import get_user, has_alerts, user_cache
+from teambeat.views.base_views import AuthenticatedView
+from teambeat.views.team_lead_views import TeamLeadDashboard
+from teambeat.views.user_views import Dashboard
+
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+import asyncio
+import csv
+import gzip
+import importlib.util
+import json
+import os
+import re
+import tempfile
+import threading
+from unittest import mock, skipUnless
+import uuid
+
+
+class TeamBeatTestMixin(object):
+    """ Fixtures and helpers of TeamBeat Test Cases
+    """
+
+    def setUp(self, *args, **kwargs):
+        super(TeamBeatTestMixin, self).setUp(*args, **kwargs)
+        # primary keys repeat between tests, so do version stamps
+        fragment_cache.clear()
+        user_cache.clear()
+        self.organization = Organization.objects.create(name='Test Org')
+        self.team = Team.objects.create(
+            name='Test Team',
+            organization=self.organization
+        )
+
+    def _create_org_user(self, email, is_organization_admin=False):
+        """ Helper function to make a User in the test organization
+        """
+        user = User.objects.create(
+            username=email,
+            email=email,
+            first_name=email.split('@')[0],
+            last_name='Tester'
+        )
+        return OrganizationUser.objects.create(
+            organization=self.organization,
+            user=user,
+            is_organization_admin=is_organization_admin
+        )
+
+    def _create_teammember(self, email, team=None):
+        """ Helper function to make a TeamMember on the test team
+        """
+        return TeamMember.objects.create(
+            organization_user=self._create_org_user(email),
+            team=team or self.team
+        )
+
+    def _login(self, org_user):
+        """ Helper function to log in as an organization user with their
+            organization selected
+        """
+        self.client.force_login(org_user.user)
+        session = self.client.session
+        session['user_is_authenticated'] = True
+        session['organization'] = str(org_user.organization.uuid)
+        session.save()
+        # cache the user like a first request would, so query counts of
+        # the requests made next compare
+        request = RequestFactory().get('/')
+        request.session = session
+        get_user(request)
+
+    def _select_team(self, team):
+        """ Helper function to save the team as the session's current team,
+            so requests for its pages don't save the session
+        """
+        session = self.client.session
+        session['current_team_id'] = str(team.uuid)
+        session.save()
+
+    def _set_status(self, teammember, status, day=None):
+        return TeamMemberStatus.objects.create(
+            teammember=teammember,
+            status=status,
+            day=day or date.today()
+        )
+
+    def _asgi_get(self, path, application=None):
+        """ GET path through the ASGI application with the test client's
+            cookies, returns the status and body
+        """
+        application = application or asgi.application
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': b'',
+            'headers': [(b'host', b'testserver'), (
+                b'cookie',
+                '; '.join(
+                    '{}={}'.format(name, morsel.value)
+                    for name, morsel in self.client.cookies.items()
+                ).encode()
+            )],
+        }
+
+        async def run():
+            sent = []
+            client_messages = asyncio.Queue()
+            client_messages.put_nowait({'type': 'http.request', 'body': b''})
+
+            async def send(message):
+                sent.append(message)
+
+            await application(scope, client_messages.get, send)
+            return sent
+
+        # as the test client does, keep the test transaction's connection
+        signals.request_started.disconnect(close_old_connections)
+        signals.request_finished.disconnect(close_old_connections)
+        try:
+            sent = async_to_sync(run)()
+        finally:
+            signals.request_started.connect(close_old_connections)
+            signals.request_finished.connect(close_old_connections)
+        return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+
+
+class TeamBeatTestCase(TeamBeatTestMixin, TestCase):
+    """ Base class for TeamBeat Test Cases
+    """
+
+
+class TestTeamDailyRollup(TeamBeatTestCase):
+    """ Test cases for the per team daily rollup
+    """
+    def test_rollup_follows_status_saves(self):
+        """ Verify rollup counts and worst status update as statuses change
+        """
+        alice = self._create_teammember('alice@example.com')
+        bob = self._create_teammember('bob@example.com')
+        self.assertIsNone(self.team.teamstatus())
+
+        alice_status = self._set_status(alice, 'green')
+        self.assertEqual(self.team.teamstatus(), 'green')
+        rollup = TeamDailyRollup.objects.get(team=self.team, day=date.today())
+        self.assertEqual(rollup.green_count, 1)
+        self.assertEqual(rollup.missing_count, 1)
+
+        self._set_status(bob, 'yellow')
+        self.assertEqual(self.team.teamstatus(), 'yellow')
+
+        alice_status.status = 'red'
+        alice_status.save()
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.worst_status, 'red')
+        self.assertEqual(rollup.green_count, 0)
+        self.assertEqual(rollup.missing_count, 0)
+
+        alice_status.delete()
+        self.assertEqual(self.team.teamstatus(), 'yellow')
+
+    def test_rollup_is_per_day(self):
+        """ Verify statuses from other days do not leak into today's status
+        """
+        alice = self._create_teammember('alice@example.com')
+        self._set_status(alice, 'red', day=date.today() - timedelta(1))
+        self.assertIsNone(self.team.teamstatus())
+        self.assertEqual(
+            self.team.teamstatus(date.today() - timedelta(1)),
+            'red'
+        )
+
+    def test_deleting_team_removes_rollups(self):
+        """ Verify cascading deletes do not leave or recreate rollup rows
+        """
+        alice = self._create_teammember('alice@example.com')
+        self._set_status(alice, 'green')
+        self.team.delete()
+        self.assertFalse(TeamDailyRollup.objects.exists())
+
+    def test_rebuild_command(self):
+        """ Verify the rebuild command recreates rollups for a date range
+        """
+        alice = self._create_teammember('alice@example.com')
+        bob = self._create_teammember('bob@example.com')
+        yesterday = date.today() - timedelta(1)
+        self._set_status(alice, 'green', day=yesterday)
+        self._set_status(alice, 'yellow')
+        self._set_status(bob, 'red')
+        TeamDailyRollup.objects.all().delete()
+
+        out = StringIO()
+        call_command(
+            'rebuild_team_rollups',
+            start=yesterday.isoformat(),
+            end=date.today().isoformat(),
+            stdout=out
+        )
+        self.assertIn('Rebuilt 2 team rollups', out.getvalue())
+        self.assertEqual(self.team.teamstatus(), 'red')
+        rollup = TeamDailyRollup.objects.get(team=self.team, day=yesterday)
+        self.assertEqual(rollup.worst_status, 'green')
+        self.assertEqual(rollup.missing_count, 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'row locks need PostgreSQL')
+class TestTeamDailyRollupConcurrency(TeamBeatTestMixin, TransactionTestCase):
+    """ Test cases for rollups refreshed by concurrent status saves
+    """
+    def test_concurrent_saves(self):
+        """ Verify a refresh waiting for another one's lock counts the
+            status it committed
+        """
+        alice = self._create_teammember('alice@example.com')
+        bob = self._create_teammember('bob@example.com')
+        saved = threading.Event()
+        commit = threading.Event()
+
+        def save_alice():
+            try:
+                with transaction.atomic():
+                    self._set_status(alice, 'red')
+                    saved.set()
+                    commit.wait(5)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=save_alice)
+        thread.start()
+        self.assertTrue(saved.wait(5))
+        # commit alice's status while bob's refresh waits for the row
+        timer = threading.Timer(0.5, commit.set)
+        timer.start()
+        self._set_status(bob, 'green')
+        thread.join()
+        timer.join()
+
+        rollup = TeamDailyRollup.objects.get(team=self.team, day=date.today())
+        self.assertEqual(
+            (rollup.red_count, rollup.green_count, rollup.missing_count, rollup.worst_status),
+            (1, 1, 0, 'red')
+        )
+
+
+class TestSetStatus(TeamBeatTestCase):
+    """ Test cases for setting a team member's daily status
+    """
+    def test_set_for_day_upserts(self):
+        """ Verify repeated submits update the single row for the day
+        """
+        alice = self._create_teammember('alice@example.com')
+        status, created = TeamMemberStatus.set_for_day(alice, 'green')
+        self.assertTrue(created)
+        self.assertEqual(self.team.teamstatus(), 'green')
+
+        status, created = TeamMemberStatus.set_for_day(
+            alice,
+            'red',
+            additional_info_for_lead='blocked'
+        )
+        self.assertFalse(created)
+        self.assertEqual(alice.teammemberstatus_set.count(), 1)
+        self.assertEqual(status.status, 'red')
+        self.assertEqual(status.additional_info_for_lead, 'blocked')
+        self.assertEqual(self.team.teamstatus(), 'red')
+
+    def test_set_status_view(self):
+        """ Verify the set status view creates then updates today's status
+        """
+        alice = self._create_teammember('alice@example.com')
+        self._login(alice.organization_user)
+        url = reverse('teams_set_status', kwargs={'team_uuid': self.team.uuid})
+        post_data = {
+            'selected-status': 'yellow',
+            'status-additional-info-team': '',
+            'status-additional-info-lead': '',
+        }
+        response = self.client.post(url, post_data, follow=True)
+        self.assertIn(
+            'Thank you for setting your Test Team status!',
+            [msg.message for msg in response.context['messages']]
+        )
+        post_data['selected-status'] = 'green'
+        response = self.client.post(url, post_data, follow=True)
+        self.assertIn(
+            'Your Test Team status for today has been updated',
+            [msg.message for msg in response.context['messages']]
+        )
+        self.assertEqual(alice.status_for_today.status, 'green')
+
+
+class TestRequestContext(TeamBeatTestCase):
+    """ Test cases for resolving the organization, team and roles of a request
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestRequestContext, self).setUp(*args, **kwargs)
+        self.admin = self._create_org_user('admin@example.com')
+        self.teamadmin = TeamAdmin.objects.create(
+            organization_user=self.admin,
+            team=self.team
+        )
+        self.team.team_lead = self.admin
+        self.team.save()
+
+    def test_single_query(self):
+        """ Verify org, membership, team and roles load in one query
+        """
+        with self.assertNumQueries(1):
+            resolved = load_request_context(
+                self.admin.user,
+                str(self.organization.uuid),
+                str(self.team.uuid)
+            )
+            self.assertEqual(resolved.organization, self.organization)
+            self.assertEqual(resolved.org_user, self.admin)
+            self.assertEqual(resolved.team, self.team)
+            self.assertEqual(resolved.team.name, 'Test Team')
+            self.assertTrue(resolved.is_team_admin)
+            self.assertTrue(resolved.is_team_lead)
+            self.assertFalse(resolved.is_organization_admin)
+
+    def test_cached_and_invalidated(self):
+        """ Verify repeat requests skip the query until roles change
+        """
+        self._login(self.admin)
+        self._select_team(self.team)
+        url = reverse('team_admin_dashboard', kwargs={'team_uuid': self.team.uuid})
+        with CaptureQueriesContext(connection) as first_request:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        fragment_cache.clear()
+        with CaptureQueriesContext(connection) as second_request:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(second_request), len(first_request) - 1)
+
+        self.teamadmin.delete()
+        response = self.client.get(url)
+        self.assertContains(response, 'You are not an admin for this team')
+
+    def test_unknown_team(self):
+        """ Verify unknown or malformed team uuids are not found
+        """
+        self._login(self.admin)
+        for team_uuid in [uuid.uuid4(), 'not-a-uuid']:
+            response = self.client.get(
+                reverse('team_admin_dashboard', kwargs={'team_uuid': team_uuid})
+            )
+            self.assertEqual(response.status_code, 404)
+
+    def test_inactive_membership(self):
+        """ Verify removed organization users don't resolve
+        """
+        OrganizationUser.objects.filter(pk=self.admin.pk).update(active=False)
+        self.assertIsNone(load_request_context(self.admin.user, self.organization.uuid))
+
+
+class TestUserSearchAPI(TeamBeatTestCase):
+    """ Test cases for the organization scoped user search API
+    """
+    def test_search_scoped_to_active_org_users(self):
+        """ Verify only active users of the current organization are found
+        """
+        admin = self._create_org_user('admin@example.com', is_organization_admin=True)
+        alice = self._create_org_user('alice@example.com')
+        removed = self._create_org_user('alicia@example.com')
+        removed.active = False
+        removed.save()
+        other_organization = Organization.objects.create(name='Other Org')
+        OrganizationUser.objects.create(
+            organization=other_organization,
+            user=User.objects.create(username='alison@example.com', first_name='alison')
+        )
+        self._login(admin)
+        response = self.client.get(reverse('api_user_search'), {'search_term': 'ali'})
+        payload = response.json()
+        self.assertEqual(
+            [result['id'] for result in payload['searchResult']],
+            [alice.pk]
+        )
+        self.assertIsNone(payload['nextCursor'])
+
+
+class TestUserAutocomplete(TeamBeatTestCase):
+    """ Test cases for the per organization typeahead index
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestUserAutocomplete, self).setUp(*args, **kwargs)
+        autocomplete_cache.clear()
+        self.grace = self._create_org_user('grace@example.com')
+        self.gregory = self._create_org_user('gregory@example.com')
+
+    def _ids(self, prefix):
+        return [
+            result['id'] for result in
+            autocomplete_cache.search(self.organization.pk, prefix)
+        ]
+
+    def test_prefix_search_without_queries(self):
+        """ Verify lookups after the first are answered from memory
+        """
+        self.assertEqual(self._ids('gr'), [self.grace.pk, self.gregory.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(self._ids('GRA'), [self.grace.pk])
+            self.assertEqual(self._ids('grace tes'), [self.grace.pk])
+            self.assertEqual(self._ids('gregory@'), [self.gregory.pk])
+            self.assertEqual(self._ids('z'), [])
+
+    def test_signal_invalidation(self):
+        """ Verify membership and name changes drop the cached index
+        """
+        self.assertEqual(self._ids('ma'), [])
+        user = self.grace.user
+        user.first_name = 'Margaret'
+        user.save()
+        self.assertEqual(self._ids('ma'), [self.grace.pk])
+
+        self.gregory.active = False
+        self.gregory.save()
+        self.assertEqual(self._ids('gregory'), [])
+
+        user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self._ids('ma')
+
+    def test_lru_bound(self):
+        """ Verify the least recently used organization is evicted
+        """
+        other_organization = Organization.objects.create(name='Other Org')
+        with self.settings(AUTOCOMPLETE_MAX_ORGANIZATIONS=1):
+            autocomplete_cache.get(self.organization.pk)
+            autocomplete_cache.get(other_organization.pk)
+            self.assertEqual(
+                list(autocomplete_cache.indexes),
+                [other_organization.pk]
+            )
+
+    def test_invalidation_during_build(self):
+        """ Verify an index built while an invalidation ran is not cached
+        """
+        build = OrganizationAutocompleteIndex.build
+
+        def racing_build(organization_id):
+            index = build(organization_id)
+            autocomplete_cache.invalidate(organization_id)
+            return index
+
+        with mock.patch.object(OrganizationAutocompleteIndex, 'build', side_effect=racing_build):
+            autocomplete_cache.get(self.organization.pk)
+        self.assertNotIn(self.organization.pk, autocomplete_cache.indexes)
+        autocomplete_cache.get(self.organization.pk)
+        self.assertIn(self.organization.pk, autocomplete_cache.indexes)
+
+    def test_autocomplete_api(self):
+        """ Verify the API returns typeahead results for the current org
+        """
+        self._login(self.grace)
+        response = self.client.get(
+            reverse('api_user_autocomplete'),
+            {'search_term': 'greg'}
+        )
+        self.assertEqual(
+            response.json()['searchResult'],
+            [{
+                'displayName': 'gregory Tester',
+                'email': 'gregory@example.com',
+                'id': self.gregory.pk
+            }]
+        )
+
+
+class TestTeamLeadDashboard(TeamBeatTestCase):
+    """ Test cases for the team lead status view
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestTeamLeadDashboard, self).setUp(*args, **kwargs)
+        self.lead = self._create_org_user('lead@example.com')
+        self.team.team_lead = self.lead
+        self.team.save()
+        self.url = reverse(
+            'team_lead_dashboard',
+            kwargs={'team_uuid': self.team.uuid}
+        )
+        self._login(self.lead)
+
+    def test_today_with_missing_members(self):
+        """ Verify only today's statuses show, and who has not reported
+        """
+        alice = self._create_teammember('alice@example.com')
+        bob = self._create_teammember('bob@example.com')
+        self._set_status(alice, 'green')
+        self._set_status(alice, 'red', day=date.today() - timedelta(1))
+        response = self.client.get(self.url)
+        self.assertEqual(
+            [status.status for status in response.context['statuses']],
+            ['green']
+        )
+        self.assertEqual(list(response.context['missing_members']), [bob])
+
+    def test_date_range_pages_by_keyset(self):
+        """ Verify history over a range pages newest first without overlap
+        """
+        alice = self._create_teammember('alice@example.com')
+        start = date.today() - timedelta(4)
+        for offset in range(5):
+            self._set_status(alice, 'green', day=start + timedelta(offset))
+        with mock.patch.object(TeamLeadDashboard, 'history_page_size', 3):
+            response = self.client.get(self.url, {'start': start.isoformat()})
+            first_page = [status.day for status in response.context['statuses']]
+            self.assertIsNone(response.context['missing_members'])
+            response = self.client.get(self.url, {
+                'start': start.isoformat(),
+                'before': response.context['next_cursor']
+            })
+        second_page = [status.day for status in response.context['statuses']]
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(
+            first_page + second_page,
+            [start + timedelta(offset) for offset in range(4, -1, -1)]
+        )
+
+    def test_not_team_lead(self):
+        """ Verify non leads are denied access
+        """
+        alice = self._create_teammember('alice@example.com')
+        self._login(alice.organization_user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+
+class TestDashboard(TeamBeatTestCase):
+    """ Test cases for the user dashboard and its refresh API
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestDashboard, self).setUp(*args, **kwargs)
+        self.org_user = self._create_org_user('lead@example.com')
+        self._login(self.org_user)
+
+    def _add_teams(self, count):
+        for i in range(count):
+            team = Team.objects.create(
+                name='Team {}'.format(Team.objects.count()),
+                organization=self.organization,
+                team_lead=self.org_user
+            )
+            teammember = TeamMember.objects.create(
+                organization_user=self.org_user,
+                team=team
+            )
+            TeamAdmin.objects.create(organization_user=self.org_user, team=team)
+            self._set_status(teammember, 'yellow')
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_dashboard_queries_do_not_grow_with_teams(self):
+        """ Verify the dashboard and API query counts are fixed per request
+        """
+        for url in [reverse('dashboard'), reverse('dashboard_refresh_api')]:
+            self._add_teams(2)
+            few_teams = self._count_queries(url)
+            self._add_teams(8)
+            many_teams = self._count_queries(url)
+            self.assertEqual(few_teams, many_teams)
+
+    def test_dashboard_api_payload(self):
+        """ Verify the API reports today's status for each team
+        """
+        self._add_teams(1)
+        response = self.client.get(reverse('dashboard_refresh_api'))
+        payload = response.json()
+        self.assertEqual(payload['teams'][0]['status'], 'yellow')
+        self.assertEqual(payload['teams'][0]['teamStatus'], 'yellow')
+        self.assertEqual(payload['leadTeams'][0]['teamName'], 'Team 1')
+        self.assertEqual(len(payload['adminTeams']), 1)
+
+    def test_polling_without_stream(self):
+        """ Verify dashboards are told to poll when streams are turned off
+        """
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'value="{}"'.format(settings.DASHBOARD_STREAM_PATH))
+        self.assertContains(response, 'id="js-poll-interval" value="30"')
+        with self.settings(DASHBOARD_STREAM_PATH=None):
+            response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, 'id="js-stream-url" value=""')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'LISTEN/NOTIFY needs PostgreSQL')
+class TestPostgresBroker(TransactionTestCase):
+    """ Test cases for the cross process PostgreSQL broker
+    """
+    def test_publish_reaches_listener(self):
+        """ Verify messages go through NOTIFY to subscribers of the topic
+        """
+        broker = PostgresBroker()
+        self.addCleanup(broker.close)
+
+        async def run():
+            subscription = broker.subscribe([team_topic(1)])
+            await sync_to_async(broker.listening.wait)(5)
+            await sync_to_async(broker.publish)(team_topic(2), {'type': 'other'})
+            await sync_to_async(broker.publish)(team_topic(1), {'type': 'team-status'})
+            message = await subscription.get(timeout=5)
+            subscription.close()
+            return message
+
+        self.assertEqual(async_to_sync(run)(), {'type': 'team-status'})
+        self.assertEqual(broker.subscribers, {})
+
+
+class TestASGIApplication(TeamBeatTestCase):
+    """ Smoke tests of the whole middleware stack under project.asgi, as
+        served in production
+    """
+    def test_pages(self):
+        """ Verify pages render through every middleware
+        """
+        status, body = self._asgi_get(reverse('session_manager_login'))
+        self.assertEqual(status, 200)
+
+        teammember = self._create_teammember('member@example.com')
+        self._login(teammember.organization_user)
+        self._select_team(self.team)
+        status, body = self._asgi_get(reverse('dashboard'))
+        self.assertEqual(status, 200)
+        self.assertIn(self.team.name.encode(), body)
+
+
+class TestDashboardStream(TeamBeatTestCase):
+    """ Test cases for pushing team status changes to the dashboard stream
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestDashboardStream, self).setUp(*args, **kwargs)
+        self.teammember = self._create_teammember('member@example.com')
+        self.org_user = self.teammember.organization_user
+        self.other_team = Team.objects.create(
+            name='Other Team',
+            organization=self.organization
+        )
+
+    def _scope(self):
+        session_key = self.client.session.session_key
+        return {
+            'type': 'http',
+            'path': settings.DASHBOARD_STREAM_PATH,
+            'headers': [(
+                b'cookie',
+                '{}={}'.format(settings.SESSION_COOKIE_NAME, session_key).encode()
+            )],
+        }
+
+    def _stream(self, scope, publish):
+        """ Run the stream, calling publish once it is open and hanging up
+            after the first event
+        """
+        async def run():
+            sent = []
+            client_messages = asyncio.Queue()
+
+            async def send(message):
+                sent.append(message)
+                body = message.get('body', b'')
+                if body.startswith(b'retry'):
+                    publish()
+                elif body.startswith(b'event'):
+                    client_messages.put_nowait({'type': 'http.disconnect'})
+
+            await DashboardStream()(scope, client_messages.get, send)
+            return sent
+
+        with mock.patch('teambeat.streams.close_old_connections'):
+            return async_to_sync(run)()
+
+    def test_status_save_publishes(self):
+        """ Verify saving a status publishes the team's new status
+        """
+        with mock.patch('teambeat.signals.transaction.on_commit', lambda callback: callback()):
+            with mock.patch('teambeat.signals.publish_team_status') as publish:
+                self._set_status(self.teammember, 'red')
+        publish.assert_called_once_with(self.team.pk, date.today(), 'red')
+
+    def test_stream_forwards_subscribed_teams(self):
+        """ Verify the stream sends today's events for the user's teams only
+        """
+        self._login(self.org_user)
+
+        def publish():
+            publish_team_status(self.other_team.pk, date.today(), 'red')
+            publish_team_status(self.team.pk, date.today() - timedelta(days=1), 'red')
+            publish_team_status(self.team.pk, date.today(), 'yellow')
+
+        sent = self._stream(self._scope(), publish)
+        self.assertEqual(sent[0]['status'], 200)
+        events = [
+            message['body'] for message in sent[1:]
+            if message.get('body', b'').startswith(b'event')
+        ]
+        self.assertEqual(len(events), 1)
+        self.assertIn(b'event: team-status', events[0])
+        self.assertIn(b'"teamStatus": "yellow"', events[0])
+        self.assertEqual(get_broker().subscribers, {})
+
+    def test_stream_requires_login(self):
+        """ Verify anonymous connections are refused
+        """
+        scope = self._scope()
+        scope['headers'] = []
+        sent = self._stream(scope, lambda: None)
+        self.assertEqual(sent[0]['status'], 403)
+
+
+class TestConditionalGet(TeamBeatTestCase):
+    """ Test cases for ETags built from the team and organization versions
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestConditionalGet, self).setUp(*args, **kwargs)
+        self.admin = self._create_org_user('admin@example.com')
+        TeamAdmin.objects.create(organization_user=self.admin, team=self.team)
+        self.teammember = TeamMember.objects.create(
+            organization_user=self.admin,
+            team=self.team
+        )
+        self._login(self.admin)
+
+    def _assert_not_modified(self, url, data=None):
+        """ Fetch url, then verify a revalidation is answered with a 304
+            Returns the ETag
+        """
+        with CaptureQueriesContext(connection) as full_queries:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertLess(len(queries), len(full_queries))
+        return etag
+
+    def _assert_modified(self, url, etag, data=None):
+        response = self.client.get(url, data, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_dashboard_api(self):
+        """ Verify status and membership writes change the dashboard ETag
+        """
+        url = reverse('dashboard_refresh_api')
+        etag = self._assert_not_modified(url)
+        self._set_status(self.teammember, 'red')
+        self._assert_modified(url, etag)
+
+        etag = self._assert_not_modified(url)
+        other_team = Team.objects.create(name='Other Team', organization=self.organization)
+        self._assert_not_modified(url)
+        TeamMember.objects.create(organization_user=self.admin, team=other_team)
+        self._assert_modified(url, etag)
+
+    def test_user_search_api(self):
+        """ Verify user changes in the organization change the search ETag
+        """
+        url = reverse('api_user_search')
+        data = {'search_term': 'admin'}
+        etag = self._assert_not_modified(url, data)
+        self._assert_modified(url, etag, {'search_term': 'adm'})
+
+        user = self.admin.user
+        user.last_login = timezone.now()
+        user.save(update_fields=['last_login'])
+        self._assert_not_modified(url, data)
+        user.first_name = 'Renamed'
+        user.save()
+        self._assert_modified(url, etag, data)
+
+    def test_team_admin_dashboard(self):
+        """ Verify team changes, including update() based removals, change
+            the team admin dashboard ETag
+        """
+        url = reverse('team_admin_dashboard', kwargs={'team_uuid': self.team.uuid})
+        etag = self._assert_not_modified(url)
+        response = self.client.post(
+            reverse('team_admin_dashboard_api', kwargs={
+                'team_uuid': self.team.uuid,
+                'api_target': 'removeteammember'
+            }),
+            {'teammember_id': self.teammember.pk}
+        )
+        self.assertEqual(response.json()['status'], 'success')
+        self._assert_modified(url, etag)
+
+    def test_stale_save_keeps_version(self):
+        """ Verify saving an old Team instance does not roll its version back
+        """
+        stale_team = Team.objects.get(pk=self.team.pk)
+        self._set_status(self.teammember, 'green')
+        version = Team.objects.get(pk=self.team.pk).version
+        stale_team.save()
+        self.assertEqual(Team.objects.get(pk=self.team.pk).version, version + 1)
+
+
+class TestFragmentCache(TeamBeatTestCase):
+    """ Test cases for cached template fragments
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestFragmentCache, self).setUp(*args, **kwargs)
+        self.admin = self._create_org_user('admin@example.com')
+        TeamAdmin.objects.create(organization_user=self.admin, team=self.team)
+        for i in range(3):
+            self._create_teammember('member{}@example.com'.format(i))
+        self._login(self.admin)
+        self.url = reverse('team_admin_dashboard', kwargs={'team_uuid': self.team.uuid})
+
+    def test_team_admin_rows_cached_until_team_changes(self):
+        """ Verify a warm cache skips the row queries and team changes show up
+        """
+        with CaptureQueriesContext(connection) as cold_queries:
+            cold = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as warm_queries:
+            warm = self.client.get(self.url)
+        self.assertLess(len(warm_queries), len(cold_queries))
+        self.assertEqual(
+            cold.content.count(b'teammember-row'),
+            warm.content.count(b'teammember-row')
+        )
+        self.assertNotIn(CSRF_PLACEHOLDER.encode(), warm.content)
+        # cached rows carry the same token as the rest of the page
+        self.assertEqual(
+            len(set(re.findall(rb'name="csrfmiddlewaretoken" value="(\w+)"', warm.content))),
+            1
+        )
+
+        teammember = self._create_teammember('newcomer@example.com')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'teammember_{}'.format(teammember.pk))
+
+        user = teammember.organization_user.user
+        user.first_name = 'Renamed'
+        user.save()
+        self.assertContains(self.client.get(self.url), 'Renamed')
+
+    def test_render_fragment(self):
+        """ Verify fragments render once per stamp and get the caller's token
+        """
+        teammember = TeamMember.objects.filter(team=self.team).first()
+        template_name = 'teambeat/includes/team-admin-dashboard/teammember-row.html'
+        context = {'teammember': teammember, 'team': self.team}
+        request = RequestFactory().get('/')
+        with mock.patch(
+                'teambeat.fragments.loader.render_to_string',
+                wraps=render_to_string) as render:
+            first = render_fragment(template_name, context, ['v1'], request=request)
+            second = render_fragment(template_name, context, ['v1'], request=RequestFactory().get('/'))
+            render_fragment(template_name, context, ['v2'], request=request)
+        self.assertEqual(render.call_count, 2)
+        self.assertIn('teammember_{}'.format(teammember.pk), first)
+        self.assertNotEqual(first, second)
+        self.assertNotIn(CSRF_PLACEHOLDER, second)
+
+
+class TestStatusExport(TeamBeatTestCase):
+    """ Test cases for the streaming status history export
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestStatusExport, self).setUp(*args, **kwargs)
+        self.lead = self._create_org_user('lead@example.com')
+        self.team.team_lead = self.lead
+        self.team.save()
+        self.alice = self._create_teammember('alice@example.com')
+        self.yesterday = date.today() - timedelta(1)
+        self._set_status(self.alice, 'red', day=self.yesterday)
+        self._set_status(self.alice, 'green')
+        other_team = Team.objects.create(name='Other', organization=self.organization)
+        self._set_status(self._create_teammember('bob@example.com', other_team), 'yellow')
+        self.url = reverse('team_status_export', kwargs={'team_uuid': self.team.uuid})
+
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_team_csv(self):
+        """ Verify the team export streams a CSV of its statuses in day order
+        """
+        self._login(self.lead)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(StringIO(self._content(response).decode())))
+        self.assertEqual(
+            [(row['day'], row['email'], row['status']) for row in rows],
+            [
+                (self.yesterday.isoformat(), 'alice@example.com', 'red'),
+                (date.today().isoformat(), 'alice@example.com', 'green'),
+            ]
+        )
+
+    def test_date_range_jsonl_gzip(self):
+        """ Verify the date range, JSON Lines format and gzip options
+        """
+        self._login(self.lead)
+        response = self.client.get(self.url, {
+            'start': date.today().isoformat(),
+            'format': 'jsonl',
+            'gzip': 'on',
+        })
+        lines = gzip.decompress(self._content(response)).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])['status'], 'green')
+
+    def test_access(self):
+        """ Verify members are denied and organization admins get every team
+        """
+        self._login(self.alice.organization_user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('organization_status_export')).status_code,
+            403
+        )
+
+        self._login(self._create_org_user('owner@example.com', True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.get(reverse('organization_status_export'), {
+            'format': 'jsonl'
+        })
+        self.assertEqual(
+            sorted(json.loads(line)['status'] for line in self._content(response).splitlines()),
+            ['green', 'red', 'yellow']
+        )
+
+    def test_command_writes_file(self):
+        """ Verify the command writes an organization export to a file with
+            the smallest chunk and buffer sizes
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.csv')
+            with mock.patch('teambeat.export.BUFFER_SIZE', 1):
+                call_command(
+                    'export_statuses',
+                    organization=str(self.organization.uuid),
+                    chunk_size=1,
+                    output=path,
+                    stdout=StringIO()
+                )
+            with open(path) as export_file:
+                rows = list(csv.DictReader(export_file))
+        self.assertEqual(len(rows), 3)
+
+
+class TestASGIStatusExport(TeamBeatTestMixin, TransactionTestCase):
+    """ Test cases for exports served by project.asgi, whose rows are read
+        in a thread of their own outside the test transaction
+    """
+    def test_organization_export(self):
+        """ Verify the export streams its rows through the ASGI handler
+        """
+        admin = self._create_org_user('admin@example.com', is_organization_admin=True)
+        self._set_status(self._create_teammember('alice@example.com'), 'red')
+        self._login(admin)
+        status, body = self._asgi_get(reverse('organization_status_export'))
+        self.assertEqual(status, 200)
+        rows = list(csv.DictReader(StringIO(body.decode())))
+        self.assertEqual(
+            [(row['email'], row['status']) for row in rows],
+            [('alice@example.com', 'red')]
+        )
+
+
+class TestStatusImport(TeamBeatTestCase):
+    """ Test cases for the bulk status import
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestStatusImport, self).setUp(*args, **kwargs)
+        self.alice = self._create_teammember('alice@example.com')
+        self.yesterday = date.today() - timedelta(1)
+        self.csv = (
+            'email,team,day,status,additional_info_for_team\n'
+            'ALICE@example.com,,{yesterday},red,late train\n'
+            'alice@example.com,Test Team,{today},green,\n'
+            'nobody@example.com,,{today},green,\n'
+            'alice@example.com,,someday,green,\n'
+            'alice@example.com,,{today},blue,\n'
+        ).format(
+            yesterday=self.yesterday.isoformat(),
+            today=date.today().isoformat()
+        ).encode()
+
+    def _import(self, data, **kwargs):
+        return import_statuses(self.organization, BytesIO(data), **kwargs)
+
+    def test_import_in_batches(self):
+        """ Verify valid rows are written, invalid ones reported with their
+            line, and rollups and the team version follow
+        """
+        version = self.team.version
+        result = self._import(self.csv, batch_size=1)
+        self.assertEqual((result.created, result.rejected_count), (2, 3))
+        self.assertEqual([line for line, reason in result.rejected], [4, 5, 6])
+        self.assertEqual(
+            TeamMemberStatus.objects.get(day=self.yesterday).additional_info_for_team,
+            'late train'
+        )
+        self.assertEqual(self.team.teamstatus(self.yesterday), 'red')
+        self.assertEqual(self.team.teamstatus(), 'green')
+        self.team.refresh_from_db()
+        self.assertGreater(self.team.version, version)
+
+    def test_conflicts(self):
+        """ Verify existing statuses are kept or overwritten
+        """
+        self._set_status(self.alice, 'yellow')
+        result = self._import(self.csv)
+        self.assertEqual((result.created, result.skipped), (1, 1))
+        self.assertEqual(self.alice.teammemberstatus_set.get(day=date.today()).status, 'yellow')
+
+        result = self._import(self.csv, on_conflict='update')
+        self.assertEqual((result.created, result.updated), (0, 2))
+        self.assertEqual(self.alice.teammemberstatus_set.get(day=date.today()).status, 'green')
+        self.assertEqual(self.team.teamstatus(), 'green')
+
+    def test_status_saved_during_update(self):
+        """ Verify a status saved after the import read the existing ones
+            is overwritten instead of failing the import
+        """
+        bulk_create = TeamMemberStatus.objects.bulk_create
+
+        def save_then_bulk_create(statuses, **kwargs):
+            if not TeamMemberStatus.objects.exists():
+                self._set_status(self.alice, 'yellow')
+            return bulk_create(statuses, **kwargs)
+
+        with mock.patch.object(TeamMemberStatus.objects, 'bulk_create', save_then_bulk_create):
+            result = self._import(self.csv, on_conflict='update')
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(self.alice.teammemberstatus_set.get(day=date.today()).status, 'green')
+        self.assertEqual(self.team.teamstatus(), 'green')
+
+    def test_export_round_trip(self):
+        """ Verify a JSON Lines export imports into the same statuses
+        """
+        self._set_status(self.alice, 'red', day=self.yesterday)
+        self._set_status(self.alice, 'green')
+        data = b''.join(stream_export(export_queryset(team=self.team), 'jsonl'))
+        TeamMemberStatus.objects.all().delete()
+        result = self._import(data, import_format='jsonl')
+        self.assertEqual((result.created, result.rejected_count), (2, 0))
+        self.assertEqual(
+            list(self.alice.teammemberstatus_set.order_by('day').values_list('status', flat=True)),
+            ['red', 'green']
+        )
+
+    def test_member_of_several_teams_needs_team(self):
+        """ Verify an email on two teams must name the team
+        """
+        other_team = Team.objects.create(name='Other', organization=self.organization)
+        TeamMember.objects.create(
+            organization_user=self.alice.organization_user,
+            team=other_team
+        )
+        data = 'email,team,day,status\nalice@example.com,,{today},red\nalice@example.com,{uuid},{today},red\n'.format(
+            today=date.today().isoformat(),
+            uuid=other_team.uuid
+        ).encode()
+        result = self._import(data)
+        self.assertEqual((result.created, result.rejected_count), (1, 1))
+        self.assertEqual(other_team.teamstatus(), 'red')
+
+    def test_upload_and_command(self):
+        """ Verify the organization admin upload and the management command
+        """
+        owner = self._create_org_user('owner@example.com', True)
+        self._login(owner)
+        upload = SimpleUploadedFile('statuses.csv', self.csv, content_type='text/csv')
+        response = self.client.post(
+            reverse('organization_status_import'),
+            {'status_file': upload, 'on_conflict': 'skip'},
+            follow=True
+        )
+        self.assertContains(response, '2 created')
+        self.assertContains(response, 'Line 4: No team member')
+        TeamMemberStatus.objects.all().delete()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'statuses.csv.gz')
+            with gzip.open(path, 'wb') as status_file:
+                status_file.write(self.csv)
+            stdout = StringIO()
+            call_command(
+                'import_statuses',
+                path,
+                organization=str(self.organization.uuid),
+                stdout=stdout,
+                stderr=StringIO()
+            )
+        self.assertIn('2 created', stdout.getvalue())
+        self.assertEqual(TeamMemberStatus.objects.count(), 2)
+
+    def test_unreadable_files(self):
+        """ Verify gzip uploads are decompressed and files that are not
+            UTF-8 or gzip stop the import with an error instead of a crash
+        """
+        owner = self._create_org_user('owner@example.com', True)
+        self._login(owner)
+        upload = SimpleUploadedFile('statuses.csv.gz', gzip.compress(self.csv))
+        response = self.client.post(
+            reverse('organization_status_import'),
+            {'status_file': upload, 'on_conflict': 'skip'},
+            follow=True
+        )
+        self.assertContains(response, '2 created')
+        TeamMemberStatus.objects.all().delete()
+
+        # the first row is written before the bad byte is read
+        latin1 = self.csv.split(b'\n')
+        latin1[2] = latin1[2] + 'caf\u00e9'.encode('latin-1')
+        result = self._import(b'\n'.join(latin1), batch_size=1)
+        self.assertEqual(result.created, 1)
+        self.assertIn('not UTF-8', result.error)
+        self.assertEqual(self.team.teamstatus(self.yesterday), 'red')
+
+        for name, data in (('statuses.csv.gz', self.csv), ('statuses.csv', gzip.compress(self.csv))):
+            upload = SimpleUploadedFile(name, data)
+            response = self.client.post(
+                reverse('organization_status_import'),
+                {'status_file': upload, 'on_conflict': 'skip'}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Import stopped at line 1')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'statuses.csv.gz')
+            with open(path, 'wb') as status_file:
+                status_file.write(self.csv)
+            with self.assertRaisesRegex(CommandError, 'not valid gzip'):
+                call_command(
+                    'import_statuses',
+                    path,
+                    organization=str(self.organization.uuid),
+                    stdout=StringIO(),
+                    stderr=StringIO()
+                )
+
+
+class TestBulkInvite(TeamBeatTestCase):
+    """ Test cases for inviting many emails to an organization at once
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestBulkInvite, self).setUp(*args, **kwargs)
+        self.owner = self._create_org_user('owner@example.com', True)
+        self.member = self._create_org_user('member@example.com')
+        self.existing = User.objects.create(username='existing@example.com', email='existing@example.com')
+        OrganizationInvitation.objects.create(
+            organization=self.organization,
+            user=User.objects.create(username='invited@example.com', email='invited@example.com')
+        )
+
+    def test_results_and_queries(self):
+        """ Verify each email's result, and that the query count does not
+            depend on the number of emails
+        """
+        emails = [
+            'member@example.com', 'Existing@example.com', 'invited@example.com',
+            'new@example.com', 'new@example.com', 'not-an-email@',
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            results = self.organization.invite_bulk(emails, self.owner.user)
+        self.assertEqual(results, [
+            ('member@example.com', Organization.ALREADY_MEMBER),
+            ('Existing@example.com', Organization.INVITED),
+            ('invited@example.com', Organization.ALREADY_INVITED),
+            ('new@example.com', Organization.INVITED_TO_APP),
+            ('not-an-email@', Organization.INVALID_EMAIL),
+        ])
+        self.assertEqual(
+            set(self.organization.organizationinvitation_set.values_list('user__email', flat=True)),
+            {'invited@example.com', 'existing@example.com', 'new@example.com'}
+        )
+        self.assertEqual(
+            list(EmailLog.objects.order_by('to_email').values_list('email_type', 'to_email')),
+            [
+                ('Organization Invitation', 'existing@example.com'),
+                ('App Invitation', 'new@example.com'),
+            ]
+        )
+
+        # build the user search index before the bulk insert
+        self.assertFalse(SessionManager.full_search('user49@example.com'))
+        more_emails = ['user{}@example.com'.format(number) for number in range(50)]
+        with CaptureQueriesContext(connection) as more_queries:
+            results = self.organization.invite_bulk(more_emails, self.owner.user)
+        self.assertEqual(len(results), 50)
+        self.assertEqual(len(more_queries), len(queries))
+        self.assertEqual(
+            [user.pk for user in SessionManager.full_search('user49@example.com')],
+            [User.objects.get(email='user49@example.com').pk]
+        )
+
+    def test_bulk_mode_of_add_user_view(self):
+        """ Verify pasted and uploaded emails are invited in one submission
+        """
+        self._login(self.owner)
+        url = reverse('add_user_to_organization')
+        self.assertIsInstance(
+            self.client.get(url, {'mode': 'bulk'}).context['form'],
+            BulkInviteForm
+        )
+        upload = SimpleUploadedFile('emails.csv', b'email\nb@example.com\nc@example.com\n')
+        response = self.client.post(url, {
+            'bulk_invite': '1',
+            'emails': 'a@example.com, member@example.com',
+            'email_file': upload,
+        })
+        self.assertContains(response, 'Invited 3 of 4')
+        self.assertContains(response, Organization.ALREADY_MEMBER)
+        self.assertEqual(self.organization.organizationinvitation_set.count(), 4)
+
+
+class TestOrganizationAdminBulk(TeamBeatTestCase):
+    """ Test cases for the organization admin batch actions
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestOrganizationAdminBulk, self).setUp(*args, **kwargs)
+        self.owner = self._create_org_user('owner@example.com', True)
+        self.organization.admins.add(self.owner.user)
+        self.members = [
+            self._create_teammember('member{}@example.com'.format(number))
+            for number in range(3)
+        ]
+        self._set_status(self.members[0], 'green')
+        self._login(self.owner)
+
+    def _post(self, api_target, data):
+        return self.client.post(
+            reverse('organization_admin_dashboard_api', kwargs={'api_target': api_target}),
+            data
+        ).json()
+
+    def test_remove_users(self):
+        """ Verify users and their memberships are deactivated in one request,
+            skipping the current user and other organizations
+        """
+        other_org = Organization.objects.create(name='Other Org')
+        outsider = OrganizationUser.objects.create(
+            organization=other_org,
+            user=User.objects.create(username='outsider@example.com')
+        )
+        org_user_ids = [member.organization_user.pk for member in self.members[:2]]
+        version = self.team.version
+        self.assertEqual(self.team.teamdailyrollup_set.get().missing_count, 2)
+        response = self._post('removeusers', {
+            'orguser_ids': ','.join(str(pk) for pk in org_user_ids + [self.owner.pk, outsider.pk])
+        })
+        self.assertEqual(sorted(response['ids']), sorted(org_user_ids))
+        self.assertEqual(
+            set(OrganizationUser.objects.filter(active=False).values_list('pk', flat=True)),
+            set(org_user_ids)
+        )
+        self.assertEqual(TeamMember.objects.filter(active=True).get(), self.members[2])
+        self.assertEqual(self.team.teamdailyrollup_set.get().missing_count, 1)
+        self.team.refresh_from_db()
+        self.assertGreater(self.team.version, version)
+
+    def test_toggle_admin(self):
+        """ Verify toggling an unknown, missing or other organization's user
+            is reported instead of failing
+        """
+        member = self.members[0].organization_user
+        self.assertEqual(self._post('toggleisadmin', {'orguser_id': member.pk}), {'status': 'success'})
+        member.refresh_from_db()
+        self.assertTrue(member.is_organization_admin)
+
+        outsider = OrganizationUser.objects.create(
+            organization=Organization.objects.create(name='Other Org'),
+            user=User.objects.create(username='outsider@example.com')
+        )
+        for data in ({'orguser_id': outsider.pk}, {'orguser_id': 'x'}, {}):
+            self.assertEqual(
+                self._post('toggleisadmin', data),
+                {'status': 'error', 'errorMessage': 'Organization user not found'}
+            )
+        outsider.refresh_from_db()
+        self.assertFalse(outsider.is_organization_admin)
+
+    def test_remove_user_and_cancel_invitation(self):
+        """ Verify removing an unknown, missing or the current user and
+            cancelling an unknown or missing invitation are reported instead
+            of failing
+        """
+        member = self.members[0].organization_user
+        self.assertEqual(self._post('removeuser', {'orguser_id': member.pk}), {'status': 'success'})
+        member.refresh_from_db()
+        self.assertFalse(member.active)
+        for data in ({'orguser_id': member.pk}, {'orguser_id': self.owner.pk}, {'orguser_id': 'x'}, {}):
+            self.assertEqual(
+                self._post('removeuser', data),
+                {'status': 'error', 'errorMessage': 'Organization user not found'}
+            )
+        self.owner.refresh_from_db()
+        self.assertTrue(self.owner.active)
+
+        invitation = OrganizationInvitation.objects.create(
+            organization=self.organization,
+            user=User.objects.create(username='invitee@example.com')
+        )
+        self.assertEqual(self._post('cancelinvitation', {'invitee_id': invitation.pk}), {'status': 'success'})
+        self.assertFalse(OrganizationInvitation.objects.exists())
+        for data in ({'invitee_id': invitation.pk}, {'invitee_id': 'x'}, {}):
+            self.assertEqual(
+                self._post('cancelinvitation', data),
+                {'status': 'error', 'errorMessage': 'Invitation not found'}
+            )
+
+    def test_set_admins(self):
+        """ Verify admin rights and Organization.admins change together with
+            a query count independent of the number of users
+        """
+        org_user_ids = [member.organization_user.pk for member in self.members]
+        with CaptureQueriesContext(connection) as one_user:
+            self._post('setadmins', {'orguser_ids': org_user_ids[:1], 'is_admin': 'true'})
+        with CaptureQueriesContext(connection) as two_users:
+            self._post('setadmins', {'orguser_ids': org_user_ids[1:], 'is_admin': 'true'})
+        self.assertEqual(len(one_user), len(two_users))
+        self.assertEqual(self.organization.admins.count(), 4)
+
+        response = self._post('setadmins', {
+            'orguser_ids': org_user_ids + [self.owner.pk],
+            'is_admin': 'false'
+        })
+        self.assertEqual(sorted(response['ids']), sorted(org_user_ids))
+        self.assertEqual(list(self.organization.admins.all()), [self.owner.user])
+        self.assertEqual(
+            list(OrganizationUser.objects.filter(is_organization_admin=True)),
+            [self.owner]
+        )
+
+    def test_cancel_invitations_and_access(self):
+        """ Verify invitations are cancelled in bulk and non admins are refused
+        """
+        invitations = [
+            OrganizationInvitation.objects.create(
+                organization=self.organization,
+                user=User.objects.create(username='invitee{}@example.com'.format(number))
+            )
+            for number in range(2)
+        ]
+        response = self._post('cancelinvitations', {
+            'invitee_ids': [invitation.pk for invitation in invitations]
+        })
+        self.assertEqual(len(response['ids']), 2)
+        self.assertFalse(OrganizationInvitation.objects.exists())
+
+        self._login(self.members[0].organization_user)
+        response = self.client.post(
+            reverse('organization_admin_dashboard_api', kwargs={'api_target': 'removeusers'}),
+            {'orguser_ids': self.owner.pk}
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(OrganizationUser.objects.get(pk=self.owner.pk).active)
+
+
+class TestTeamMembershipBulk(TeamBeatTestCase):
+    """ Test cases for the team admin batch membership actions
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestTeamMembershipBulk, self).setUp(*args, **kwargs)
+        self.admin = self._create_org_user('admin@example.com')
+        TeamAdmin.objects.create(organization_user=self.admin, team=self.team)
+        self.org_users = [
+            self._create_org_user('user{}@example.com'.format(number))
+            for number in range(4)
+        ]
+        self._login(self.admin)
+
+    def _post(self, api_target, data):
+        return self.client.post(
+            reverse(
+                'team_admin_dashboard_api',
+                kwargs={'team_uuid': self.team.uuid, 'api_target': api_target}
+            ),
+            data
+        ).json()
+
+    def test_add_and_remove_members(self):
+        """ Verify members are created or reactivated in one request, rows are
+            rendered for each, and the rollup and version follow
+        """
+        former = TeamMember.objects.create(
+            organization_user=self.org_users[0],
+            team=self.team,
+            active=False
+        )
+        current = TeamMember.objects.create(organization_user=self.org_users[1], team=self.team)
+        self._set_status(current, 'green')
+        other_org = Organization.objects.create(name='Other Org')
+        outsider = OrganizationUser.objects.create(
+            organization=other_org,
+            user=User.objects.create(username='outsider@example.com')
+        )
+        version = Team.objects.get(pk=self.team.pk).version
+
+        response = self._post('addteammembers', {
+            'user_ids': [org_user.pk for org_user in self.org_users] + [outsider.pk]
+        })
+        self.assertEqual(len(response['teamMemberIds']), 3)
+        self.assertIn(former.pk, response['teamMemberIds'])
+        self.assertEqual(response['htmlResult'].count("class='teammember-row'"), 3)
+        self.assertIn('user3@example.com', response['htmlResult'])
+        self.assertEqual(self.team.teammember_set.filter(active=True).count(), 4)
+        self.assertEqual(self.team.teamdailyrollup_set.get().missing_count, 3)
+        self.assertGreater(Team.objects.get(pk=self.team.pk).version, version)
+
+        response = self._post('removeteammembers', {
+            'teammember_ids': ','.join(str(pk) for pk in response['teamMemberIds'])
+        })
+        self.assertEqual(len(response['teamMemberIds']), 3)
+        self.assertEqual(list(self.team.teammember_set.filter(active=True)), [current])
+        self.assertEqual(self.team.teamdailyrollup_set.get().missing_count, 0)
+
+    def test_add_admins(self):
+        """ Verify admins are bulk created with a query count independent of
+            their number, skipping existing admins
+        """
+        self._select_team(self.team)
+        with CaptureQueriesContext(connection) as one_admin:
+            self._post('addteamadmins', {'user_ids': [self.org_users[0].pk, self.admin.pk]})
+        with CaptureQueriesContext(connection) as three_admins:
+            response = self._post('addteamadmins', {
+                'user_ids': [org_user.pk for org_user in self.org_users]
+            })
+        self.assertEqual(len(one_admin), len(three_admins))
+        self.assertEqual(len(response['teamAdminIds']), 3)
+        self.assertEqual(response['htmlResult'].count('class="teamadmin-row"'), 3)
+        self.assertEqual(self.team.teamadmin_set.count(), 5)
+
+        # the new admins can use the admin pages straight away
+        self._login(self.org_users[3])
+        response = self.client.get(
+            reverse('team_admin_dashboard', kwargs={'team_uuid': self.team.uuid})
+        )
+        self.assertNotContains(response, 'You are not an admin for this team')
+
+
+class TestUserCache(TeamBeatTestCase):
+    """ Test cases for the cached request.user and has_alerts flag
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestUserCache, self).setUp(*args, **kwargs)
+        self.org_user = self._create_org_user('cached@example.com')
+        self.user = self.org_user.user
+        self.user.set_password('t3st3r@dmin')
+        self.user.save()
+        self.client.force_login(self.user)
+
+    def _request(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        # read the session now, outside any counted queries
+        request.session.keys()
+        return request
+
+    def test_cached(self):
+        """ Verify repeat lookups run no queries and hand out copies
+        """
+        first = get_user(self._request())
+        self.assertEqual(first, self.user)
+        self.assertFalse(has_alerts(first))
+        request = self._request()
+        with self.assertNumQueries(0):
+            second = get_user(request)
+            self.assertFalse(has_alerts(second))
+        self.assertIsNot(first, second)
+        self.assertEqual(second.email, 'cached@example.com')
+
+    def test_invalidated(self):
+        """ Verify user and invitation changes, bulk invitations included,
+            are seen on the next lookup
+        """
+        get_user(self._request())
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(get_user(self._request()).first_name, 'Renamed')
+
+        invitation = OrganizationInvitation.objects.create(
+            organization=self.organization,
+            user=self.user
+        )
+        self.assertTrue(has_alerts(get_user(self._request())))
+        invitation.delete()
+        self.assertFalse(has_alerts(get_user(self._request())))
+
+        other_org = Organization.objects.create(name='Other Org')
+        other_org.invite_bulk(['cached@example.com'], self.org_user)
+        self.assertTrue(has_alerts(get_user(self._request())))
+
+    def test_password_change(self):
+        """ Verify a changed password logs the session out, once the TTL
+            passed when it was changed by another process
+        """
+        get_user(self._request())
+        User.objects.filter(pk=self.user.pk).update(password='changed')
+        self.assertTrue(get_user(self._request()).is_authenticated)
+        with self.settings(USER_CACHE_TTL=0):
+            request = self._request()
+            self.assertFalse(get_user(request).is_authenticated)
+        self.assertIsNone(request.session.session_key)
+
+        self.client.force_login(self.user)
+        get_user(self._request())
+        self.user.set_password('n3w p@ssword')
+        self.user.save()
+        self.assertFalse(get_user(self._request()).is_authenticated)
+
+    def test_pages(self):
+        """ Verify pages use the cached user and alert flag
+        """
+        self._login(self.org_user)
+        url = reverse('session_manager_profile')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([
+            query['sql'] for query in captured.captured_queries
+            if 'FROM "auth_user" WHERE' in query['sql']
+        ])
+        self.assertContains(response, 'profile-icon.png')
+
+
+class TestSessionModes(TeamBeatTestCase):
+    """ Test cases for keeping sessions in signed cookies or the cache
+    """
+    def _use_site(self):
+        """ Log in with a token, select the organization and set a status
+            like a browser would
+        """
+        alice = self._create_teammember('alice@example.com')
+        response = self.client.get(
+            SignedToken.issue(alice.organization_user.user, 'login').path
+        )
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        # the dashboard selects the organization, then redirects back to itself
+        response = self.client.get(reverse('dashboard'), follow=True)
+        self.assertEqual(response.request['PATH_INFO'], reverse('dashboard'))
+        self.assertContains(response, 'Test Team')
+
+        url = reverse('teams_set_status', kwargs={'team_uuid': self.team.uuid})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, {
+            'selected-status': 'green',
+            'status-additional-info-team': '',
+            'status-additional-info-lead': '',
+        }, follow=True)
+        self.assertIn(
+            'Thank you for setting your Test Team status!',
+            [msg.message for msg in response.context['messages']]
+        )
+        self.assertEqual(alice.status_for_today.status, 'green')
+        self.assertEqual(self.client.session['current_team_id'], str(self.team.uuid))
+
+    def test_modes(self):
+        """ Verify the site works without touching django_session
+        """
+        for session_mode in ('signed_cookies', 'cache'):
+            with self.subTest(session_mode), \
+                    self.settings(SESSION_ENGINE=settings.SESSION_ENGINES[session_mode]), \
+                    CaptureQueriesContext(connection) as captured:
+                self.client = self.client_class()
+                self._use_site()
+                self.assertFalse([
+                    query['sql'] for query in captured.captured_queries
+                    if 'django_session' in query['sql']
+                ])
+            TeamMember.objects.all().delete()
+            User.objects.filter(email='alice@example.com').delete()
+
+
+class TestMetrics(TeamBeatTestCase):
+    """ Test cases for the Prometheus metrics endpoint
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestMetrics, self).setUp(*args, **kwargs)
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_request_metrics(self):
+        """ Verify requests, their queries and cache lookups are counted
+            and the scrape skips the session
+        """
+        alice = self._create_teammember('alice@example.com')
+        self._login(alice.organization_user)
+        self._select_team(self.team)
+        url = reverse('teams_set_status', kwargs={'team_uuid': self.team.uuid})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        EmailLog.objects.create(
+            to_email='alice@example.com',
+            subject='Hello',
+            body='Hello',
+            status=EmailLog.STATUS_QUEUED
+        )
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(settings.METRICS_PATH)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([
+            query['sql'] for query in captured.captured_queries
+            if 'django_session' in query['sql'] or 'auth_user' in query['sql']
+        ])
+        text = response.content.decode('utf-8')
+        self.assertIn('# TYPE teambeat_http_request_duration_seconds histogram', text)
+        self.assertIn(
+            'teambeat_http_requests_total{method="GET",status="200",view="teams_set_status"} 1.0',
+            text
+        )
+        self.assertIn(
+            'teambeat_http_request_duration_seconds_bucket{view="teams_set_status",le="+Inf"} 1.0',
+            text
+        )
+        self.assertIn('teambeat_http_request_duration_seconds_count{view="teams_set_status"} 1.0', text)
+        self.assertIn('teambeat_cache_lookups_total{cache="users",result="hit"} 1.0', text)
+        self.assertIn('teambeat_email_outbox_emails{status="queued"} 1.0', text)
+        self.assertIn('teambeat_email_outbox_emails{status="failed"} 0.0', text)
+
+        queries = re.search(
+            r'^teambeat_http_request_queries_sum\{view="teams_set_status"\} (\S+)$',
+            text,
+            re.MULTILINE
+        )
+        self.assertGreater(float(queries.group(1)), 0)
+        # buckets are cumulative
+        buckets = [
+            float(value) for value in re.findall(
+                r'^teambeat_http_response_size_bytes_bucket\{view="teams_set_status",le="[^"]+"\} (\S+)$',
+                text,
+                re.MULTILINE
+            )
+        ]
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(buckets[-1], 1.0)
+
+    def test_token(self):
+        """ Verify METRICS_TOKEN protects the endpoint, and that it is not
+            found without one when METRICS_REQUIRE_TOKEN is on
+        """
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(settings.METRICS_PATH).status_code, 403)
+            response = self.client.get(
+                settings.METRICS_PATH,
+                HTTP_AUTHORIZATION='Bearer secret'
+            )
+            self.assertEqual(response.status_code, 200)
+        with self.settings(METRICS_TOKEN=None, METRICS_REQUIRE_TOKEN=True):
+            response = self.client.get(settings.METRICS_PATH)
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn(b'teambeat_', response.content)
+
+    def test_shared_directory(self):
+        """ Verify the values of every process's file are summed
+        """
+        with tempfile.TemporaryDirectory() as directory, \
+                self.settings(METRICS_DIR=directory):
+            metrics.reset()
+            key = sample_key('teambeat_cache_lookups_total', {'cache': 'fragments', 'result': 'miss'})
+            other_process = MmapValues(os.path.join(directory, 'metrics-1.db'))
+            other_process.add(key, 2)
+            for i in range(2000):
+                # grow past the initial size
+                other_process.add(sample_key('teambeat_cache_lookups_total', {'cache': str(i), 'result': 'hit'}), 1)
+            other_process.close()
+            metrics.inc('teambeat_cache_lookups_total', {'cache': 'fragments', 'result': 'miss'})
+
+            samples = metrics.samples()
+            self.assertEqual(samples[key], 3.0)
+            self.assertEqual(samples[sample_key('teambeat_cache_lookups_total', {'cache': '1999', 'result': 'hit'})], 1.0)
+            # reopening a file keeps its values
+            self.assertEqual(dict(MmapValues(os.path.join(directory, 'metrics-1.db')).items())[key], 2.0)
+            metrics.reset()
+
+            # the gunicorn on_starting hook empties the directory
+            spec = importlib.util.spec_from_file_location(
+                'gunicorn_conf', os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+            )
+            gunicorn_conf = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(gunicorn_conf)
+            with mock.patch.dict(os.environ, {'METRICS_DIR': directory}):
+                gunicorn_conf.on_starting(None)
+            self.assertEqual(os.listdir(directory), [])
+
+
+class TestRequestProfiling(TeamBeatTestCase):
+    """ Test cases for on demand request profiling
+    """
+    def setUp(self, *args, **kwargs):
+        super(TestRequestProfiling, self).setUp(*args, **kwargs)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # before the first request, which loads the middleware
+        override = self.settings(PROFILING_DIR=directory.name, PROFILING_MAX_PROFILES=2)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.alice = self._create_teammember('alice@example.com')
+        self._login(self.alice.organization_user)
+        self._select_team(self.team)
+        self.url = reverse('teams_set_status', kwargs={'team_uuid': self.team.uuid})
+
+    def _make_superuser(self):
+        User.objects.filter(pk=self.alice.organization_user.user_id).update(
+            is_superuser=True,
+            is_staff=True
+        )
+        user_cache.clear()
+
+    def test_superuser_trigger(self):
+        """ Verify superusers get profiles on request, others don't
+        """
+        response = self.client.get(self.url, {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(profile_store.names(), [])
+
+        self._make_superuser()
+        response = self.client.get(self.url, {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        name = response['X-Profile']
+        self.assertEqual(profile_store.names(), [name])
+        with open(profile_store.path(name, 'txt')) as summary_file:
+            summary = summary_file.read()
+        self.assertIn('(teams_set_status) 200', summary)
+        self.assertIn('superuser by alice@example.com', summary)
+        self.assertIn('cumulative', summary)
+
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertIn('X-Profile', response)
+        self.assertEqual(len(profile_store.names()), 2)
+        # only the newest PROFILING_MAX_PROFILES are kept
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(profile_store.names()[0], response['X-Profile'])
+        self.assertNotIn(name, profile_store.names())
+
+    def test_streaming_response(self):
+        """ Verify captures of streaming responses say their body is not
+            profiled
+        """
+        request = RequestFactory().get('/export/')
+        response = profile_request(
+            request,
+            lambda request: StreamingHttpResponse(iter(['a', 'b'])),
+            'sample'
+        )
+        self.assertEqual(b''.join(response.streaming_content), b'ab')
+        with open(profile_store.path(response['X-Profile'], 'txt')) as summary_file:
+            summary = summary_file.readline()
+        self.assertIn('GET /export/ (unresolved) 200', summary)
+        self.assertIn('sample by anonymous, streamed body not profiled', summary)
+
+    def test_sampling(self):
+        """ Verify one in PROFILING_SAMPLE_RATE requests are profiled
+        """
+        with self.settings(PROFILING_SAMPLE_RATE=1):
+            self.client = self.client_class()
+            self._login(self.alice.organization_user)
+            self._select_team(self.team)
+            response = self.client.get(self.url)
+        self.assertIn('X-Profile', response)
+        with open(profile_store.path(response['X-Profile'], 'txt')) as summary_file:
+            self.assertIn('sample by alice@example.com', summary_file.read())
+
+    def test_superuser_views(self):
+        """ Verify only superusers list and download profiles, whose
+            summaries leave out the query string
+        """
+        list_url = reverse('request_profiles')
+        self.assertEqual(self.client.get(list_url).status_code, 403)
+        User.objects.filter(pk=self.alice.organization_user.user_id).update(is_staff=True)
+        user_cache.clear()
+        self.assertEqual(self.client.get(list_url).status_code, 403)
+
+        self._make_superuser()
+        name = self.client.get(self.url, {'profile': '1', 'token': 'secret'})['X-Profile']
+        response = self.client.get(list_url)
+        self.assertContains(response, name)
+        self.assertContains(response, 'GET {} (teams_set_status)'.format(self.url))
+        self.assertNotContains(response, 'secret')
+
+        response = self.client.get(reverse(
+            'request_profile_download',
+            kwargs={'name': name, 'file_format': 'prof'}
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertGreater(len(b''.join(response.streaming_content)), 0)
+
+        for name, file_format in ((name, 'py'), ('..', 'prof'), ('20200101T000000-1-1-missing', 'txt')):
+            response = self.client.get(reverse(
+                'request_profile_download',
+                kwargs={'name': name, 'file_format': file_format}
+            ))
+            self.assertEqual(response.status_code, 404)
+
+
+class TestQueryBudgets(TeamBeatTestCase):
+    """ Query budget regression harness: every view in project/urls.py that
+        declares a query_budget must stay within it as the organization
+        grows tenfold
+    """
+    base_size = {'users': 15, 'teams': 3, 'members_per_team': 5, 'days': 2}
+
+    def _budgeted_urls(self, team):
+        urls = []
+        for pattern in get_resolver().url_patterns:
+            view_class = getattr(pattern.callback, 'view_class', None)
+            if view_class is None:
+                continue
+            budget = getattr(view_class, 'query_budget', None)
+            if issubclass(view_class, AuthenticatedView):
+                self.assertIsNotNone(
+                    budget,
+                    '{} does not declare a query_budget'.format(view_class.__name__)
+                )
+            if budget is None or not hasattr(view_class, 'get'):
+                continue
+            if set(pattern.pattern.converters) - {'team_uuid'}:
+                # downloads of files the organization doesn't have
+                continue
+            kwargs = {}
+            if 'team_uuid' in pattern.pattern.converters:
+                kwargs['team_uuid'] = str(team.uuid)
+            urls.append((
+                reverse(pattern.name, kwargs=kwargs),
+                budget
+            ))
+        return urls
+
+    def _assert_within_budgets(self, scale):
+        organization = seed_organization(
+            'Scale {}'.format(scale),
+            seed=scale,
+            **{key: value * scale for key, value in self.base_size.items()}
+        )
+        owner = organization.organizationuser_set.get(is_organization_admin=True)
+        # superuser, for the request profile views
+        User.objects.filter(pk=owner.user_id).update(is_superuser=True)
+        self._login(owner)
+
+        for url, budget in self._budgeted_urls(organization.team_set.first()):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'search_term': 'a'})
+            self.assertLess(response.status_code, 400, url)
+            self.assertLessEqual(
+                len(queries),
+                budget,
+                '{} ran {} queries at {}x scale, budget is {}:\n{}'.format(
+                    url,
+                    len(queries),
+                    scale,
+                    budget,
+                    '\n'.join(query['sql'] for query in queries)
+                )
+            )
+
+    def test_middleware_logs_queries_over_budget(self):
+        """ Verify the dev middleware logs the SQL of an over budget request
+        """
+        organization = seed_organization('Logged', **self.base_size)
+        owner = organization.organizationuser_set.get(is_organization_admin=True)
+        self._login(owner)
+        with self.settings(QUERY_BUDGET_LOGGING=True), \
+                mock.patch.object(Dashboard, 'query_budget', 1), \
+                self.assertLogs('teambeat.middleware', 'WARNING') as logs:
+            self.client.get(reverse('dashboard'))
+        self.assertIn('over its budget of 1', logs.output[0])
+        self.assertIn('teambeat_teammemberstatus', logs.output[0])
+
+    def test_views_within_budget(self):
+        """ Verify views stay within budget at base scale
+        """
+        self._assert_within_budgets(1)
+
+    def test_views_within_budget_at_10x(self):
+        """ Verify views stay within budget at ten times the data
+        """
+        self._assert_within_budgets(10)
+
+
+class TestBenchmark(TeamBeatTestCase):
+    """ Test cases for the synthetic data and benchmark commands
+    """
+    def test_seed_data(self):
+        """ Verify the command creates the requested organizations once
+        """
+        call_command(
+            'seed_data',
+            organizations=2,
+            users=6,
+            teams=2,
+            members_per_team=3,
+            days=2,
+            seed=1,
+            stdout=StringIO()
+        )
+        self.assertEqual(
+            Organization.objects.filter(name__startswith='Synthetic').count(),
+            2
+        )
+        self.assertEqual(
+            OrganizationUser.objects.filter(organization__name='Synthetic 2').count(),
+            6
+        )
+        with self.assertRaises(CommandError):
+            call_command('seed_data', users=6, stdout=StringIO())
+
+    def test_report(self):
+        """ Verify every GET view is measured and reports compare
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command(
+                'benchmark',
+                users=6,
+                teams=2,
+                members_per_team=3,
+                days=2,
+                iterations=2,
+                warmup=1,
+                output=path,
+                stdout=StringIO()
+            )
+            with open(path) as report_file:
+                report = json.load(report_file)
+        # the seeded data is rolled back
+        self.assertFalse(Organization.objects.filter(name='Benchmark').exists())
+        self.assertIn('dashboard', report['urls'])
+        self.assertIn('team_lead_dashboard', report['urls'])
+        self.assertNotIn('session_manager_logout', report['urls'])
+        dashboard = report['urls']['dashboard']
+        self.assertEqual(dashboard['status'], 200)
+        self.assertGreater(dashboard['queries'], 0)
+        self.assertLessEqual(dashboard['p50_ms'], dashboard['max_ms'])
+        # steady state requests don't save the session
+        self.assertEqual(
+            [name for name, result in report['urls'].items() if result['session_writes']],
+            []
+        )
+
+        slower = json.loads(json.dumps(report))
+        slower['urls']['dashboard']['queries'] = dashboard['queries'] * 2
+        self.assertIn(
+            ('dashboard', 'queries', dashboard['queries'] * 2, dashboard['queries'], -50.0),
+            compare_reports(slower, report)
+        )
+
+
+class SerialLiveServerThread(LiveServerThread):
+    """ Live server answering one request at a time, as threads share the
+        connection to an in memory SQLite test database
+    """
+    def _create_server(self):
+        return WSGIServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+class TestLoadReplay(LiveServerTestCase):
+    """ Test cases for the replay_load command, against a live server
+    """
+    server_thread_class = SerialLiveServerThread
+
+    def test_parse_mix(self):
+        """ Verify weights default to 1 and unknown actions are rejected
+        """
+        self.assertEqual(
+            parse_mix('dashboard=3, user_search'),
+            {'dashboard': 3.0, 'user_search': 1.0}
+        )
+        for mix in ('dashboard=3,unknown=1', 'dashboard=x', 'dashboard=0'):
+            with self.assertRaises(ValueError):
+                parse_mix(mix)
+        self.assertEqual(
+            list(histogram_labels(range(11)))[::10],
+            ['<=5', '>5000']
+        )
+
+    def test_replay(self):
+        """ Verify every action of the mix succeeds with session and CSRF
+            cookies handled
+        """
+        fragment_cache.clear()
+        organization = seed_organization('Load', users=4, teams=2, members_per_team=3, days=1, status_rate=0, seed=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            call_command(
+                'replay_load',
+                base_url=self.live_server_url,
+                organization=str(organization.uuid),
+                concurrency=2,
+                duration=2,
+                seed=1,
+                output=path,
+                stdout=StringIO()
+            )
+            with open(path) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(report['total']['errors'], 0, report['total']['error_reasons'])
+        self.assertEqual(
+            set(report['actions']),
+            {'login', 'dashboard', 'dashboard_api', 'set_status', 'user_search', 'team_admin_api'}
+        )
+        self.assertEqual(
+            sum(report['total']['histogram'].values()),
+            report['total']['requests']
+        )
+        # set_status posted through CSRF protection
+        self.assertTrue(TeamMemberStatus.objects.filter(
+            teammember__team__organization=organization,
+            day=as_date()
+        ).exists())
+        with self.assertRaises(CommandError):
+            call_command(
+                'replay_load',
+                organization=str(organization.uuid),
+                mix='nothing=1',
+                stdout=StringIO()
+            )
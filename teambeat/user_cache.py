@@ -0,0 +1,161 @@
+""" Per process cache of logged in Users and their has_alerts flag
+
+    django.contrib.auth's AuthenticationMiddleware reads auth_user on every
+    request and AuthenticatedView.setup used to query the user's
+    OrganizationInvitations for the alert on the profile icon.
+    CachedAuthenticationMiddleware (see teambeat.middleware) serves both
+    from a bounded LRU of USER_CACHE_MAX_USERS entries that expire after
+    USER_CACHE_TTL seconds. The User and OrganizationInvitation signal
+    handlers in teambeat.signals drop a user's entry when they change; the
+    TTL is the backstop for writes made by other processes.
+
+    The session's auth hash is verified the way django.contrib.auth.get_user
+    does it. When it doesn't match the cached password the user is read
+    again before the session is flushed, so sessions kept valid by a
+    password change elsewhere are not logged out. Every request gets its
+    own User instance.
+"""
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY,
+    HASH_SESSION_KEY,
+    SESSION_KEY,
+    load_backend,
+)
+from django.contrib.auth.models import AnonymousUser, User
+from django.utils.crypto import constant_time_compare
+
+from teambeat.metrics import record_cache_lookup
+
+from collections import OrderedDict
+import threading
+import time
+
+
+DEFAULT_MAX_USERS = 1000
+DEFAULT_TTL = 30
+
+
+class CachedUser(object):
+    """ Field values of a User plus what the app derives from them
+    """
+    def __init__(self, user, has_alerts):
+        self.db = user._state.db
+        self.field_names = [field.attname for field in user._meta.concrete_fields]
+        self.values = [getattr(user, name) for name in self.field_names]
+        self.session_auth_hash = user.get_session_auth_hash()
+        self.has_alerts = has_alerts
+
+    @classmethod
+    def load(cls, user_id, backend_path):
+        """ Read the user through the session's auth backend, None if it
+            no longer finds them (e.g. deleted or inactive)
+        """
+        user = load_backend(backend_path).get_user(user_id)
+        if user is None:
+            return None
+        return cls(user, user.organizationinvitation_set.exists())
+
+    def verifies(self, session_hash):
+        return bool(session_hash) and constant_time_compare(
+            session_hash,
+            self.session_auth_hash
+        )
+
+    def get_user(self):
+        user = User.from_db(self.db, self.field_names, self.values)
+        user._cached_has_alerts = self.has_alerts
+        return user
+
+
+class UserCache(object):
+    """ Bounded LRU of CachedUsers by user pk, safe to share between threads
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = OrderedDict()
+        # bumped by every invalidation, so a load that raced one is not stored
+        self.generation = 0
+
+    @property
+    def max_users(self):
+        return getattr(settings, 'USER_CACHE_MAX_USERS', DEFAULT_MAX_USERS)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'USER_CACHE_TTL', DEFAULT_TTL)
+
+    def get(self, user_id):
+        with self.lock:
+            cached = self.users.get(user_id)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self.users.move_to_end(user_id)
+                return cached[1]
+        return None
+
+    def load(self, user_id, backend_path):
+        """ Read the user from the database and cache them
+        """
+        generation = self.generation
+        cached_user = CachedUser.load(user_id, backend_path)
+        if cached_user is None or not self.ttl:
+            return cached_user
+        with self.lock:
+            if generation == self.generation:
+                self.users[user_id] = (time.monotonic(), cached_user)
+                self.users.move_to_end(user_id)
+                while len(self.users) > self.max_users:
+                    self.users.popitem(last=False)
+        return cached_user
+
+    def invalidate(self, user_id):
+        self.invalidate_users([user_id])
+
+    def invalidate_users(self, user_ids):
+        with self.lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self.users.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.users.clear()
+
+
+user_cache = UserCache()
+
+
+def get_user(request):
+    """ Stand in for django.contrib.auth.get_user that reads the cache first
+    """
+    try:
+        user_id = User._meta.pk.to_python(request.session[SESSION_KEY])
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    cached_user = user_cache.get(user_id)
+    hit = cached_user is not None and cached_user.verifies(session_hash)
+    record_cache_lookup('users', hit)
+    if not hit:
+        cached_user = user_cache.load(user_id, backend_path)
+        if cached_user is None:
+            return AnonymousUser()
+    if not cached_user.verifies(session_hash):
+        request.session.flush()
+        return AnonymousUser()
+    return cached_user.get_user()
+
+
+def has_alerts(user):
+    """ Whether the user has organization invitations waiting, without a
+        query when the user came from the cache
+    """
+    cached = getattr(user, '_cached_has_alerts', None)
+    if cached is not None:
+        return cached
+    return user.organizationinvitation_set.exists()
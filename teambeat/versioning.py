@@ -0,0 +1,81 @@
+""" Version counters for conditional GETs
+
+    Team.version is bumped whenever a team's statuses, members, admins or
+    details change and Organization.version whenever its memberships or the
+    names of its users change (see the handlers in teambeat.signals). Views
+    build their ETag from these counters with a single small query instead
+    of running their payload queries, see AuthenticatedView.get_etag.
+
+    Writes that bypass signals (QuerySet.update, bulk_create) must call the
+    bump functions themselves.
+"""
+from django.db.models import F
+
+from teambeat.models import Organization, Team
+
+import hashlib
+
+
+def bump_team_versions(team_ids):
+    team_ids = [team_id for team_id in team_ids if team_id]
+    if team_ids:
+        Team.objects.filter(pk__in=team_ids).update(version=F('version') + 1)
+
+
+def bump_teammember_team_version(teammember_id):
+    """ Bump the team of a team member known only by its primary key
+    """
+    Team.objects.filter(
+        teammember__pk=teammember_id
+    ).update(version=F('version') + 1)
+
+
+def bump_organization_versions(organization_ids):
+    organization_ids = [
+        organization_id for organization_id in organization_ids if organization_id
+    ]
+    if organization_ids:
+        Organization.objects.filter(
+            pk__in=organization_ids
+        ).update(version=F('version') + 1)
+
+
+def bump_user_organization_versions(user_id):
+    """ Bump every organization the user belongs to, for changes to the
+        user's name or email
+    """
+    Organization.objects.filter(
+        organizationuser__user_id=user_id
+    ).update(version=F('version') + 1)
+
+
+def make_etag(*parts):
+    """ Compact ETag value from the given parts
+    """
+    key = '|'.join(str(part) for part in parts)
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def dashboard_versions(org_user):
+    """ (team pk, version) of every team on the organization user's
+        dashboard; joining or leaving a team bumps that team, so this covers
+        membership changes as well
+    """
+    return sorted(
+        Team.dashboard_teams(org_user).values_list('pk', 'version')
+    )
+
+
+def team_versions(team):
+    """ (team version, organization version) for a team, both read fresh
+    """
+    return Team.objects.filter(pk=team.pk).values_list(
+        'version',
+        'organization__version'
+    ).first()
+
+
+def fetch_organization_version(organization):
+    return Organization.objects.filter(
+        pk=organization.pk
+    ).values_list('version', flat=True).first()
@@ -1,45 +1,105 @@
+from django.http import Http404
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    quote_etag,
+)
 from django.template import loader
 from django.views import View
 from django.conf import settings
 
-from teambeat.models import (
-    Organization,
-    Team,
-    TeamAdmin,
-)
+from teambeat.models import Team
 
 from teambeat.forms import SearchUsersForm
+from teambeat.request_context import resolve_request_context
+from teambeat.user_cache import has_alerts
+from teambeat.versioning import team_versions
+
+import uuid
 
 
 class AuthenticatedView(View):
+    # maximum SQL queries per request, see teambeat.query_budget
+    query_budget = None
+
     def setup(self, request, *args, **kwargs):
         super(AuthenticatedView, self).setup(request, *args, **kwargs)
         self.user = request.user
-        has_alerts = False
-        org_invitations = self.user.organizationinvitation_set.all()
-        if org_invitations:
-            has_alerts = True
         self.context = {
             'user': self.user,
-            'has_alerts': has_alerts
+            'has_alerts': has_alerts(self.user)
         }
 
+    def posted_ids(self, request, name):
+        """ Integer ids posted under name, as repeated fields or a comma
+            separated list, for the batch API actions
+        """
+        ids = []
+        for value in request.POST.getlist(name):
+            for part in value.split(','):
+                try:
+                    ids.append(int(part))
+                except ValueError:
+                    continue
+        return ids
+
+    def get_etag(self, request, *args, **kwargs):
+        """ Override to answer GET requests conditionally: return a value
+            that changes whenever the response would, computed without the
+            view's payload queries (see teambeat.versioning), or None to
+            always render
+        """
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        etag = None
+        if request.method in ('GET', 'HEAD'):
+            etag = self.get_etag(request, *args, **kwargs)
+        if etag is None:
+            return super(AuthenticatedView, self).dispatch(request, *args, **kwargs)
+
+        etag = quote_etag(etag)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super(AuthenticatedView, self).dispatch(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            # browsers keep the response but always revalidate it
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 
 class TeamBeatView(AuthenticatedView):
     def setup(self, request, *args, **kwargs):
         super(TeamBeatView, self).setup(request, *args, **kwargs)
         organization_uuid = request.session.get('organization')
         if organization_uuid:
-            self.organization = Organization.objects.get(uuid=organization_uuid)
-            self.org_user = self.organization.organizationuser_set.get(
-                user=self.user
-            )
-            if kwargs.get('team_uuid'):
-                self.team = Team.objects.get(
-                    organization=self.organization,
-                    uuid=kwargs['team_uuid']
+            team_uuid = kwargs.get('team_uuid')
+            if team_uuid:
+                try:
+                    team_uuid = str(uuid.UUID(team_uuid))
+                except ValueError:
+                    raise Http404('Team not found')
+            try:
+                resolved = resolve_request_context(
+                    request,
+                    organization_uuid,
+                    team_uuid
                 )
-                request.session['current_team_id'] = str(self.team.uuid)
+            except Team.DoesNotExist:
+                raise Http404('Team not found')
+            if resolved is None:
+                # no longer a member, treat it as no organization selected
+                del request.session['organization']
+                return
+            self.organization = resolved.organization
+            self.org_user = resolved.org_user
+            self.is_team_admin = resolved.is_team_admin
+            self.is_team_lead = resolved.is_team_lead
+            if resolved.team:
+                self.team = resolved.team
+                if request.session.get('current_team_id') != team_uuid:
+                    request.session['current_team_id'] = team_uuid
 
 
 class OrganizationAdminView(TeamBeatView):
@@ -62,25 +122,31 @@ class OrganizationAdminView(TeamBeatView):
 class TeamAdminView(TeamBeatView):
     def setup(self, request, *args, **kwargs):
         super(TeamAdminView, self).setup(request, *args, **kwargs)
-        try:
-            self.teamadmin = TeamAdmin.objects.get(
-                team=self.team,
-                organization_user=self.org_user
-            )
+        if self.is_team_admin:
             self.template = loader.get_template(
                 'teambeat/team-admin-dashboard.html'
             )
+            # fresh version stamp for the team's cached fragments and ETag
+            self.team_stamp = 'team:{}.{}.{}'.format(
+                self.team.pk,
+                *team_versions(self.team)
+            )
 
             self.context.update({
                 'current_user': self.org_user,
                 'team': self.team,
-                'teammembers': self.team.teammember_set.filter(active=True),
+                'teammembers': self.team.teammember_set.filter(
+                    active=True
+                ).select_related('organization_user__user'),
                 'team_lead': self.team.team_lead,
-                'team_admins': self.team.teamadmin_set,
+                'team_admins': self.team.teamadmin_set.select_related(
+                    'organization_user__user'
+                ),
                 'user_search_form': SearchUsersForm(),
+                'team_stamp': self.team_stamp,
             })
             self.status_code = 200
-        except TeamAdmin.DoesNotExist:
+        else:
             self.context.update({
                 'status_code': 403,
                 'error_message': (
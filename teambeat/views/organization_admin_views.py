@@ -1,14 +1,25 @@
+from django.conf import settings
 from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
 from django.template import loader
 from django.urls import reverse
 
+from teambeat.bulk import (
+    cancel_invitations,
+    remove_organization_users,
+    set_organization_admins,
+)
+from teambeat.export import export_queryset, export_response
 from teambeat.forms import (
+    BulkInviteForm,
     CreateOrganizationForm,
     SearchUsersForm,
-    InviteUserForm
+    InviteUserForm,
+    StatusExportForm,
+    StatusImportForm,
 )
+from teambeat.importer import format_for_filename, import_statuses, open_lines
 from teambeat.models import (
     Organization,
     OrganizationInvitation,
@@ -24,6 +35,8 @@ from session_manager.models import SessionManager
 
 
 class CreateOrganization(AuthenticatedView):
+    query_budget = 12
+
     def setup(self, request, *args, **kwargs):
         super(CreateOrganization, self).setup(request, *args, **kwargs)
         self.template = loader.get_template('teambeat/generic_form.html')
@@ -62,6 +75,8 @@ class CreateOrganization(AuthenticatedView):
 
 
 class HandleOrganizationInvitation(AuthenticatedView):
+    query_budget = 15
+
     def post(self, request, *args, **kwargs):
         organization = Organization.objects.filter(
             uuid=self.kwargs['org_uuid'],
@@ -125,6 +140,8 @@ class HandleOrganizationInvitation(AuthenticatedView):
 
 
 class AddUserToOrganization(OrganizationAdminView):
+    query_budget = 20
+
     def setup(self, request, *args, **kwargs):
         super(AddUserToOrganization, self).setup(request, *args, **kwargs)
 
@@ -137,11 +154,42 @@ class AddUserToOrganization(OrganizationAdminView):
                 'additional_helptext': None,
                 'form': self.form()
             })
+            if request.GET.get('mode') == 'bulk':
+                self.context.update({
+                    'header': 'Invite users to organization "{}"'.format(self.organization.name),
+                    'submit_text': 'Invite users',
+                    'form': BulkInviteForm()
+                })
 
     def get(self, request, *args, **kwargs):
         return HttpResponse(self.template.render(self.context, request))
 
+    def bulk_invite(self, request):
+        form = BulkInviteForm(request.POST, request.FILES)
+        if not form.is_valid():
+            self.context.update({
+                'header': 'Invite users to organization "{}"'.format(self.organization.name),
+                'submit_text': 'Invite users',
+                'form': form
+            })
+            return HttpResponse(self.template.render(self.context, request))
+        results = self.organization.invite_bulk(
+            form.cleaned_data['email_list'],
+            _from=self.user
+        )
+        self.context.update({
+            'organization': self.organization,
+            'results': results,
+            'invited_count': len([
+                result for email, result in results
+                if result in (Organization.INVITED, Organization.INVITED_TO_APP)
+            ]),
+        })
+        return render(request, 'teambeat/bulk-invite-results.html', self.context)
+
     def post(self, request, *args, **kwargs):
+        if 'bulk_invite' in request.POST:
+            return self.bulk_invite(request)
         if 'search_term' in request.POST:
             form = SearchUsersForm(request.POST)
             stage = 1
@@ -152,9 +200,11 @@ class AddUserToOrganization(OrganizationAdminView):
 
         if stage == 1:
             django_users = SessionManager.full_search(
-                request.POST['search_term']
+                request.POST['search_term'],
+                cursor=request.POST.get('search_cursor')
             )
             self.context.update({
+                'search_term': request.POST['search_term'],
                 'search_result_users': django_users,
                 'form': InviteUserForm()
             })
@@ -211,17 +261,24 @@ class AddUserToOrganization(OrganizationAdminView):
 
 
 class OrganizationAdminDashboard(OrganizationAdminView):
+    query_budget = 12
+
     def setup(self, request, *args, **kwargs):
         super(OrganizationAdminDashboard, self).setup(request, *args, **kwargs)
 
         if self.status_code == 200:
-            request.session['current_team_id'] = None
+            if request.session.get('current_team_id') is not None:
+                request.session['current_team_id'] = None
             self.template = loader.get_template('teambeat/organization-admin-dashboard.html')
             self.context.update({
                 'organization': self.organization,
-                'org_users': self.organization.organizationuser_set.filter(active=True).all(),
+                'org_users': self.organization.organizationuser_set.filter(
+                    active=True
+                ).select_related('user'),
                 'current_user': self.org_user,
-                'invited_users': OrganizationInvitation.objects.filter(organization=self.organization)
+                'invited_users': OrganizationInvitation.objects.filter(
+                    organization=self.organization
+                ).select_related('user')
             })
 
     def get(self, request, *args, **kwargs):
@@ -229,30 +286,166 @@ class OrganizationAdminDashboard(OrganizationAdminView):
 
 
 class OrganizationAdminDashboardAPI(OrganizationAdminView):
+    query_budget = 20
+
+    def _without_current_user(self, org_user_ids):
+        # admins cannot remove or demote themselves
+        return [pk for pk in org_user_ids if pk != self.org_user.pk]
+
     def post(self, request, *args, **kwargs):
+        if self.status_code != 200:
+            return JsonResponse(
+                {'status': 'error', 'errorMessage': self.context['error_message']},
+                status=self.status_code
+            )
+        context = {'status': 'error', 'errorMessage': 'Unknown action'}
         if kwargs['api_target'] == 'removeuser':
-            org_user = OrganizationUser.objects.get(pk=request.POST['orguser_id'])
-            org_user.active = False
-            org_user.teammember_set.all().update(active=False)
-            org_user.save()
-            context = {'status': 'success'}
+            if remove_organization_users(
+                self.organization,
+                self._without_current_user(self.posted_ids(request, 'orguser_id')[:1])
+            ):
+                context = {'status': 'success'}
+            else:
+                context = {'status': 'error', 'errorMessage': 'Organization user not found'}
         if kwargs['api_target'] == 'toggleisadmin':
-            org_user = OrganizationUser.objects.get(pk=request.POST['orguser_id'])
-            if org_user.is_organization_admin:
-                org_user.is_organization_admin = False
-                self.organization.admins.remove(org_user.user)
-                self.organization.save()
+            org_user = self.organization.organizationuser_set.filter(
+                pk__in=self.posted_ids(request, 'orguser_id')[:1]
+            ).first()
+            if org_user is None:
+                context = {'status': 'error', 'errorMessage': 'Organization user not found'}
             else:
-                org_user.is_organization_admin = True
-                self.organization.admins.add(org_user.user)
-                self.organization.save()
-            org_user.save()
-            context = {'status': 'success'}
+                set_organization_admins(
+                    self.organization,
+                    [org_user.pk],
+                    not org_user.is_organization_admin
+                )
+                context = {'status': 'success'}
         if kwargs['api_target'] == 'cancelinvitation':
-            invitation = OrganizationInvitation.objects.filter(
-                pk=request.POST['invitee_id']
-            ).first()
-            if invitation:
-                invitation.delete()
-            context = {'status': 'success'}
+            if cancel_invitations(
+                self.organization,
+                self.posted_ids(request, 'invitee_id')[:1]
+            ):
+                context = {'status': 'success'}
+            else:
+                context = {'status': 'error', 'errorMessage': 'Invitation not found'}
+        if kwargs['api_target'] == 'removeusers':
+            context = {
+                'status': 'success',
+                'ids': remove_organization_users(
+                    self.organization,
+                    self._without_current_user(self.posted_ids(request, 'orguser_ids'))
+                ),
+            }
+        if kwargs['api_target'] == 'setadmins':
+            is_admin = request.POST.get('is_admin') == 'true'
+            org_user_ids = self.posted_ids(request, 'orguser_ids')
+            if not is_admin:
+                org_user_ids = self._without_current_user(org_user_ids)
+            context = {
+                'status': 'success',
+                'ids': set_organization_admins(
+                    self.organization,
+                    org_user_ids,
+                    is_admin
+                ),
+            }
+        if kwargs['api_target'] == 'cancelinvitations':
+            context = {
+                'status': 'success',
+                'ids': cancel_invitations(
+                    self.organization,
+                    self.posted_ids(request, 'invitee_ids')
+                ),
+            }
         return JsonResponse(context)
+
+
+class OrganizationStatusExport(OrganizationAdminView):
+    """ Download of the status history of every team in the organization
+    """
+    query_budget = 12
+
+    def get(self, request, *args, **kwargs):
+        if self.status_code != 200:
+            return HttpResponse(
+                self.template.render(self.context, request),
+                status=self.status_code
+            )
+        form = StatusExportForm(request.GET)
+        if not form.is_valid():
+            return render(
+                request,
+                settings.DEFAULT_ERROR_TEMPLATE,
+                {'status_code': 400, 'error_message': form.errors.as_text()},
+                status=400
+            )
+        return export_response(
+            export_queryset(
+                organization=self.organization,
+                start=form.cleaned_data['start'],
+                end=form.cleaned_data['end']
+            ),
+            'organization-status-{}'.format(self.organization.uuid),
+            form.cleaned_data['format'],
+            form.cleaned_data['gzip']
+        )
+
+
+class OrganizationStatusImport(OrganizationAdminView):
+    """ Upload of historical statuses for the organization's team members,
+        see teambeat.importer
+    """
+    query_budget = 12
+    reported_rejections = 10
+
+    def setup(self, request, *args, **kwargs):
+        super(OrganizationStatusImport, self).setup(request, *args, **kwargs)
+        if self.status_code == 200:
+            self.template = loader.get_template('teambeat/generic_form.html')
+            self.context.update({
+                'header': 'Import statuses into "{}"'.format(self.organization.name),
+                'submit_text': 'Import',
+                'additional_helptext': (
+                    'Statuses are matched to team members by email, and by '
+                    'team name or uuid for members of several teams.'
+                ),
+                'form': StatusImportForm()
+            })
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            self.template.render(self.context, request),
+            status=self.status_code
+        )
+
+    def post(self, request, *args, **kwargs):
+        if self.status_code != 200:
+            return self.get(request, *args, **kwargs)
+        form = StatusImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            self.context['form'] = form
+            return HttpResponse(self.template.render(self.context, request))
+
+        status_file = form.cleaned_data['status_file']
+        result = import_statuses(
+            self.organization,
+            open_lines(status_file, status_file.name),
+            import_format=format_for_filename(status_file.name),
+            on_conflict=form.cleaned_data['on_conflict']
+        )
+        if result.error:
+            form.add_error('status_file', result.error)
+            self.context['form'] = form
+            messages.warning(request, result.summary())
+            return HttpResponse(self.template.render(self.context, request))
+        messages.success(request, result.summary())
+        for line_number, reason in result.rejected[:self.reported_rejections]:
+            messages.warning(request, 'Line {}: {}'.format(line_number, reason))
+        if result.rejected_count > self.reported_rejections:
+            messages.warning(
+                request,
+                '{} more rows were rejected'.format(
+                    result.rejected_count - self.reported_rejections
+                )
+            )
+        return redirect(reverse('organization_admin_dashboard'))
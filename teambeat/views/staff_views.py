@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.template import loader
+
+from teambeat.profiling import profile_store
+
+from teambeat.views.base_views import AuthenticatedView
+
+import os
+
+
+class SuperuserView(AuthenticatedView):
+    def setup(self, request, *args, **kwargs):
+        super(SuperuserView, self).setup(request, *args, **kwargs)
+        if not self.user.is_superuser:
+            self.context.update({
+                'status_code': 403,
+                'error_message': 'Access denied for this page. You are not a superuser',
+            })
+            self.template = loader.get_template(settings.DEFAULT_ERROR_TEMPLATE)
+            self.status_code = 403
+        else:
+            self.status_code = 200
+
+
+class RequestProfiles(SuperuserView):
+    query_budget = 4
+
+    def setup(self, request, *args, **kwargs):
+        super(RequestProfiles, self).setup(request, *args, **kwargs)
+        if self.status_code == 200:
+            self.template = loader.get_template('teambeat/request-profiles.html')
+            self.context.update({
+                'profiling_enabled': bool(profile_store.directory),
+                'profiles': profile_store.list(),
+            })
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(
+            self.template.render(self.context, request),
+            status=self.status_code
+        )
+
+
+class RequestProfileDownload(SuperuserView):
+    query_budget = 4
+
+    def get(self, request, name, file_format, *args, **kwargs):
+        if self.status_code != 200:
+            return HttpResponse(
+                self.template.render(self.context, request),
+                status=self.status_code
+            )
+        path = profile_store.path(name, file_format)
+        if path is None or not os.path.isfile(path):
+            raise Http404('Profile not found')
+        return FileResponse(
+            open(path, 'rb'),
+            as_attachment=file_format == 'prof',
+            filename='{}.{}'.format(name, file_format),
+            content_type='text/plain' if file_format == 'txt' else 'application/octet-stream'
+        )
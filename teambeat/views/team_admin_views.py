@@ -1,9 +1,11 @@
 from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render, redirect
 from django.template import loader
 from django.urls import reverse
 
+from teambeat.bulk import add_team_admins, add_team_members, remove_team_members
 from teambeat.forms import TeamForm, RemoveTeamMemberForm
 from teambeat.models import (
     OrganizationUser,
@@ -11,10 +13,14 @@ from teambeat.models import (
     TeamAdmin,
     TeamMember
 )
+from teambeat.fragments import render_fragment
+from teambeat.versioning import bump_team_versions, make_etag
 from teambeat.views.base_views import TeamAdminView, TeamBeatView
 
 
 class CreateTeam(TeamBeatView):
+    query_budget = 15
+
     def setup(self, request, *args, **kwargs):
         super(CreateTeam, self).setup(request, *args, **kwargs)
         self.template = loader.get_template('teambeat/generic_form.html')
@@ -66,11 +72,30 @@ class CreateTeam(TeamBeatView):
 
 
 class TeamAdminDashboard(TeamAdminView):
+    query_budget = 16
+
+    def get_etag(self, request, *args, **kwargs):
+        # pending messages are shown once, so those pages always render
+        if self.status_code != 200 or messages.get_messages(request):
+            return None
+        # the page embeds a CSRF token, which stays valid while the cookie
+        # does; get_token sets the cookie up front for first time visitors
+        get_token(request)
+        return make_etag(
+            'teamadmin',
+            self.org_user.pk,
+            self.team_stamp,
+            self.context['has_alerts'],
+            request.META['CSRF_COOKIE']
+        )
+
     def get(self, request, *args, **kwargs):
         return HttpResponse(self.template.render(self.context, request))
 
 
 class TeamAdminDashboardAPI(TeamAdminView):
+    query_budget = 20
+
     def setup(self, request, *args, **kwargs):
         super(TeamAdminDashboardAPI, self).setup(request, *args, **kwargs)
         self.context = {
@@ -101,6 +126,8 @@ class TeamAdminDashboardAPI(TeamAdminView):
             if form.is_valid():
                 TeamMember.objects.filter(
                     pk=request.POST['teammember_id']).update(active=False)
+                # update() sends no signals, see teambeat.versioning
+                bump_team_versions([self.team.pk])
                 self.context['status'] = 'success'
             else:
                 self.context['status'] = 'error'
@@ -122,9 +149,10 @@ class TeamAdminDashboardAPI(TeamAdminView):
                             team=self.team
                         )
                         new_teammember.save()
-                    rendered_table_row = loader.render_to_string(
+                    rendered_table_row = render_fragment(
                         'teambeat/includes/team-admin-dashboard/teammember-row.html',
-                        context={'teammember': new_teammember, 'team': self.team},
+                        {'teammember': new_teammember, 'team': self.team},
+                        [self.team_stamp, new_teammember.pk],
                         request=request
                     )
                     self.context['status'] = 'success'
@@ -135,9 +163,10 @@ class TeamAdminDashboardAPI(TeamAdminView):
                 org_user = OrganizationUser.objects.get(pk=request.POST['user_id'])
                 new_teamadmin, created = self._get_or_create_team_admin(org_user)
                 if created:
-                    rendered_table_row = loader.render_to_string(
+                    rendered_table_row = render_fragment(
                         'teambeat/includes/team-admin-dashboard/teamadmin-row.html',
-                        context={'admin': new_teamadmin, 'team': self.team,},
+                        {'admin': new_teamadmin, 'team': self.team},
+                        [self.team_stamp, new_teamadmin.pk],
                         request=request
                     )
                     self.context['status'] = 'success'
@@ -166,11 +195,53 @@ class TeamAdminDashboardAPI(TeamAdminView):
                     self.team.save()
                     self._get_or_create_team_admin(org_user)
 
-                    rendered_table_row = loader.render_to_string(
+                    rendered_table_row = render_fragment(
                         'teambeat/includes/team-admin-dashboard/teamlead-row.html',
-                        context={'team_lead': self.team.team_lead},
+                        {'team_lead': self.team.team_lead},
+                        [self.team_stamp, org_user.pk],
                         request=request
                     )
                     self.context['status'] = 'success'
                     self.context['htmlResult'] = rendered_table_row
+
+        elif api_target == 'addteammembers':
+            teammembers = add_team_members(
+                self.team,
+                self.posted_ids(request, 'user_ids')
+            )
+            self.context['status'] = 'success'
+            self.context['teamMemberIds'] = [teammember.pk for teammember in teammembers]
+            self.context['htmlResult'] = ''.join(
+                render_fragment(
+                    'teambeat/includes/team-admin-dashboard/teammember-row.html',
+                    {'teammember': teammember, 'team': self.team},
+                    [self.team_stamp, teammember.pk],
+                    request=request
+                )
+                for teammember in teammembers
+            )
+
+        elif api_target == 'removeteammembers':
+            self.context['status'] = 'success'
+            self.context['teamMemberIds'] = remove_team_members(
+                self.team,
+                self.posted_ids(request, 'teammember_ids')
+            )
+
+        elif api_target == 'addteamadmins':
+            teamadmins = add_team_admins(
+                self.team,
+                self.posted_ids(request, 'user_ids')
+            )
+            self.context['status'] = 'success'
+            self.context['teamAdminIds'] = [teamadmin.pk for teamadmin in teamadmins]
+            self.context['htmlResult'] = ''.join(
+                render_fragment(
+                    'teambeat/includes/team-admin-dashboard/teamadmin-row.html',
+                    {'admin': teamadmin, 'team': self.team, 'current_user': self.org_user},
+                    [self.team_stamp, teamadmin.pk, self.org_user.pk],
+                    request=request
+                )
+                for teamadmin in teamadmins
+            )
         return JsonResponse(self.context, status=self.status_code)
@@ -1,29 +1,29 @@
+from django.conf import settings
 from django.http import HttpResponse
 from django.shortcuts import render
 from django.template import loader
 
-from teambeat.models import Team
+from teambeat.export import export_queryset, export_response
+from teambeat.forms import StatusExportForm, TeamStatusFilterForm
+from teambeat.models import as_date
 from teambeat.views.base_views import TeamBeatView
 
 
 class TeamLeadDashboard(TeamBeatView):
+    query_budget = 12
+    history_page_size = 50
+
     def setup(self, request, *args, **kwargs):
         super(TeamLeadDashboard, self).setup(request, *args, **kwargs)
-        try:
-            self.is_team_lead = Team.objects.get(
-                pk=self.team.pk,
-                team_lead=self.org_user
-            )
-
+        if self.is_team_lead:
             self.template = loader.get_template('teambeat/team-lead-status-view.html')
-            self.context.update({'statuses': self.team.teamstatus_set})
             self.status_code = 200
-        except Team.DoesNotExist:
+        else:
             self.context.update({
                 'status_code': 403,
                 'error_message': (
                     'Access denied for this page. You are not a Team Lead '
-                    'for this team',
+                    'for this team'
                 )
             })
             self.template = loader.get_template(
@@ -32,7 +32,87 @@ class TeamLeadDashboard(TeamBeatView):
             self.status_code = 403
 
     def get(self, request, *args, **kwargs):
+        if self.status_code == 200:
+            form = TeamStatusFilterForm(request.GET)
+            if form.is_valid():
+                start = form.cleaned_data['start']
+                end = form.cleaned_data['end']
+                before = form.cleaned_data['before']
+            else:
+                start = end = as_date()
+                before = None
+
+            # fetch one extra row to know whether there is an older page
+            statuses = list(self.team.status_history(
+                start,
+                end,
+                before=before,
+                limit=self.history_page_size + 1
+            ))
+            next_cursor = None
+            if len(statuses) > self.history_page_size:
+                statuses = statuses[:self.history_page_size]
+                last_status = statuses[-1]
+                next_cursor = '{}.{}'.format(
+                    last_status.day.isoformat(),
+                    last_status.pk
+                )
+
+            missing_members = None
+            if start == end and not before:
+                missing_members = self.team.members_missing_status(start)
+
+            self.context.update({
+                'team': self.team,
+                'form': form,
+                'start': start,
+                'end': end,
+                'is_today': start == end == as_date(),
+                'statuses': statuses,
+                'missing_members': missing_members,
+                'next_cursor': next_cursor,
+            })
         return HttpResponse(
             self.template.render(self.context, request),
             status=self.status_code
         )
+
+
+class TeamStatusExport(TeamBeatView):
+    """ Download of the team's status history, for the team lead and the
+        organization's admins
+    """
+    query_budget = 12
+
+    def get(self, request, *args, **kwargs):
+        if not (self.is_team_lead or self.org_user.is_organization_admin):
+            return render(
+                request,
+                settings.DEFAULT_ERROR_TEMPLATE,
+                {
+                    'status_code': 403,
+                    'error_message': (
+                        'Access denied for this page. You are not a Team Lead '
+                        'for this team'
+                    ),
+                },
+                status=403
+            )
+        form = StatusExportForm(request.GET)
+        if not form.is_valid():
+            return render(
+                request,
+                settings.DEFAULT_ERROR_TEMPLATE,
+                {'status_code': 400, 'error_message': form.errors.as_text()},
+                status=400
+            )
+        return export_response(
+            export_queryset(
+                team=self.team,
+                start=form.cleaned_data['start'],
+                end=form.cleaned_data['end']
+            ),
+            'team-status-{}'.format(self.team.uuid),
+            form.cleaned_data['format'],
+            form.cleaned_data['gzip']
+        )
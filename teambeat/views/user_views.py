@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.http import HttpResponse, JsonResponse
@@ -5,6 +6,8 @@ from django.shortcuts import render, redirect
 from django.template import loader
 from django.urls import reverse
 
+from teambeat.autocomplete import autocomplete_cache
+from teambeat.dashboard import DashboardLoader
 from teambeat.forms import (
     SearchUsersForm,
 )
@@ -13,9 +16,15 @@ from teambeat.models import (
     OrganizationUser,
     Team,
     TeamMember,
-    TeamMemberStatus
+    TeamMemberStatus,
+    as_date,
 )
 from teambeat.status_defs import STATUSES
+from teambeat.versioning import (
+    dashboard_versions,
+    fetch_organization_version,
+    make_etag,
+)
 from teambeat.views.base_views import (
     AuthenticatedView,
     TeamBeatView
@@ -24,18 +33,34 @@ from session_manager.forms import UserProfileForm
 
 
 class UserSearchAPI(TeamBeatView):
+    query_budget = 12
+
+    def get_etag(self, request, *args, **kwargs):
+        if not getattr(self, 'organization', None):
+            return None
+        return make_etag(
+            'usersearch',
+            self.organization.pk,
+            fetch_organization_version(self.organization),
+            request.GET.get('search_term'),
+            request.GET.get('cursor')
+        )
+
     def get(self, request, *args, **kwargs):
         context = {
             'status': None,
-            'searchResult': []
+            'searchResult': [],
+            'nextCursor': None
         }
         form = SearchUsersForm(request.GET)
         if form.is_valid():
             context['status'] = 'success'
             org_users = OrganizationUser.search(
                 self.organization,
-                request.GET['search_term']
+                request.GET['search_term'],
+                cursor=request.GET.get('cursor')
             )
+            context['nextCursor'] = org_users.next_cursor
             for user in org_users:
                 context['searchResult'].append({
                     'displayName': '{} {}'.format(
@@ -50,7 +75,22 @@ class UserSearchAPI(TeamBeatView):
         return JsonResponse(context)
 
 
+class UserAutocompleteAPI(TeamBeatView):
+    query_budget = 10
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({
+            'status': 'success',
+            'searchResult': autocomplete_cache.search(
+                self.organization.pk,
+                request.GET.get('search_term', '')
+            )
+        })
+
+
 class Profile(AuthenticatedView):
+    query_budget = 12
+
     def setup(self, request, *args, **kwargs):
         super(Profile, self).setup(request, *args, **kwargs)
         self.template = loader.get_template('teambeat/profile.html')
@@ -60,7 +100,9 @@ class Profile(AuthenticatedView):
         else:
             self.current_organization = None
         self.context.update({
-            'org_invitations': self.user.organizationinvitation_set.all()
+            'org_invitations': self.user.organizationinvitation_set.select_related(
+                'organization'
+            )
         })
 
     def get(self, request, *args, **kwargs):
@@ -75,7 +117,9 @@ class Profile(AuthenticatedView):
         )
         self.context.update({
             'profile_form': profile_form,
-            'user_organizations': self.user.organizationuser_set.all(),
+            'user_organizations': self.user.organizationuser_set.select_related(
+                'organization'
+            ),
             'current_organization': self.current_organization,
             'org_select_submit_text': 'Switch Organization'
         })
@@ -86,7 +130,9 @@ class Profile(AuthenticatedView):
 
         self.context.update({
             'profile_form': profile_form,
-            'user_organizations': self.user.organizationuser_set.all(),
+            'user_organizations': self.user.organizationuser_set.select_related(
+                'organization'
+            ),
             'current_organization': self.current_organization,
             'org_select_submit_text': 'Switch Organization'
         })
@@ -113,10 +159,14 @@ class Profile(AuthenticatedView):
 
 
 class SetOrganization(TeamBeatView):
+    query_budget = 12
+
     def setup(self, request, *args, **kwargs):
         super(SetOrganization, self).setup(request, *args, **kwargs)
         self.context.update({
-            'user_organizations': request.user.organizationuser_set.all(),
+            'user_organizations': request.user.organizationuser_set.select_related(
+                'organization'
+            ),
             'current_organization': None,
             'org_select_submit_text': 'Select Organization'
         })
@@ -126,9 +176,9 @@ class SetOrganization(TeamBeatView):
     def get(self, request, *args, **kwargs):
         user_organizations = OrganizationUser.objects.filter(user=request.user)
         if user_organizations.count() == 1:
-            request.session['organization'] = str(
-                user_organizations.first().organization.uuid
-            )
+            organization_uuid = str(user_organizations.first().organization.uuid)
+            if request.session.get('organization') != organization_uuid:
+                request.session['organization'] = organization_uuid
             return redirect('dashboard')
         else:
             return HttpResponse(self.template.render(self.context, request))
@@ -141,6 +191,8 @@ class SetOrganization(TeamBeatView):
 
 
 class SetStatus(TeamBeatView):
+    query_budget = 15
+
     def setup(self, request, *args, **kwargs):
         super(SetStatus, self).setup(request, *args, **kwargs)
         self.teammember = TeamMember.objects.get(
@@ -158,9 +210,13 @@ class SetStatus(TeamBeatView):
         return HttpResponse(self.template.render(self.context, request))
 
     def post(self, request, *args, **kwargs):
-        todays_status = self.teammember.status_for_today
-        if not todays_status:
-            todays_status = TeamMemberStatus(teammember=self.teammember)
+        todays_status, created = TeamMemberStatus.set_for_day(
+            self.teammember,
+            status=request.POST['selected-status'],
+            additional_info_for_team=request.POST['status-additional-info-team'],
+            additional_info_for_lead=request.POST['status-additional-info-lead']
+        )
+        if created:
             success_message = 'Thank you for setting your {} status!'.format(
                 self.team.name
             )
@@ -168,56 +224,74 @@ class SetStatus(TeamBeatView):
             success_message = 'Your {} status for today has been updated'.format(
                 self.team.name
             )
-        todays_status.status = request.POST['selected-status']
-        todays_status.additional_info_for_team = request.POST['status-additional-info-team']
-        todays_status.additional_info_for_lead = request.POST['status-additional-info-lead']
-        todays_status.save()
         messages.success(request, success_message)
         return redirect(reverse('dashboard'))
 
 
 class Dashboard(TeamBeatView):
+    query_budget = 15
+
     def get(self, request, *args, **kwargs):
         if not request.session.get('organization'):
             return redirect(reverse('set_organization'))
         template = loader.get_template('teambeat/dashboard.html')
+        dashboard = DashboardLoader(self.org_user)
         self.context.update({
             'org_user': self.org_user,
-            'myteams': self.org_user.teammember_set.all(),
-            'adminteams': self.org_user.teamadmin_set.all(),
-            'leadteams': self.org_user.teamlead_teams,
-            'organization': self.organization
+            'myteams': dashboard.teammembers,
+            'adminteams': dashboard.adminteams,
+            'leadteams': dashboard.leadteams,
+            'organization': self.organization,
+            'dashboard_stream_url': settings.DASHBOARD_STREAM_PATH or '',
+            'dashboard_poll_interval': settings.DASHBOARD_POLL_INTERVAL,
         })
         return HttpResponse(template.render(self.context, request))
 
 
 class DashboardAPI(TeamBeatView):
-    def _formatted_admin_teams(self):
-        admin_teams = []
-        for teamlead in self.org_user.teamlead_set.all():
-            admin_teams.append(
-                {
-                    'teamId': teamlead.team.pk,
-                    'teamName': teamlead.team.name
-                }
-            )
-        return admin_teams
+    query_budget = 15
 
-    def _formatted_teams(self):
+    def get_etag(self, request, *args, **kwargs):
+        if not getattr(self, 'org_user', None):
+            return None
+        return make_etag(
+            'dashboard',
+            self.org_user.pk,
+            as_date(),
+            dashboard_versions(self.org_user)
+        )
+
+    def _formatted_team(self, team):
+        return {
+            'teamId': team.pk,
+            'teamName': team.name,
+            'teamStatus': team.current_status
+        }
+
+    def _formatted_admin_teams(self, dashboard):
+        return [
+            self._formatted_team(teamadmin.team)
+            for teamadmin in dashboard.adminteams
+        ]
+
+    def _formatted_lead_teams(self, dashboard):
+        return [self._formatted_team(team) for team in dashboard.leadteams]
+
+    def _formatted_teams(self, dashboard):
         teams = []
-        for teammember in self.org_user.teammember_set.all():
-            teams.append(
-                {
-                    'teamId': teammember.team.pk,
-                    'teamName': teammember.team.name,
-                    'status': teammember.status_for_today
-                }
-            )
+        for teammember in dashboard.teammembers:
+            formatted_team = self._formatted_team(teammember.team)
+            formatted_team['status'] = None
+            if teammember.todays_status:
+                formatted_team['status'] = teammember.todays_status.status
+            teams.append(formatted_team)
         return teams
 
     def get(self, request, *args, **kwargs):
+        dashboard = DashboardLoader(self.org_user)
         context = {
-            'adminTeams': self._formatted_admin_teams(),
-            'teams': self._formatted_teams()
+            'adminTeams': self._formatted_admin_teams(dashboard),
+            'leadTeams': self._formatted_lead_teams(dashboard),
+            'teams': self._formatted_teams(dashboard)
         }
         return JsonResponse(context)